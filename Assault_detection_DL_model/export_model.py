@@ -0,0 +1,271 @@
+"""
+Violence Model Export
+Converts MoBiLSTM_model.h5 to TFLite (float32 / float16 / INT8) or ONNX and
+compares the exported model against Keras for accuracy and latency
+
+Usage:
+    python export_model.py tflite --quantize int8 --calibration Real_Life_Violence_Dataset/
+    python export_model.py onnx --split
+    python export_model.py compare MoBiLSTM_model_int8.tflite --videos test_videos/ --report report.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from violence_stream import (CLASSES_LIST, IMAGE_HEIGHT, IMAGE_WIDTH, SEQUENCE_LENGTH,
+                             load_violence_model, split_model)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(SCRIPT_DIR, "MoBiLSTM_model.h5")
+CLIP_SHAPE = (SEQUENCE_LENGTH, IMAGE_HEIGHT, IMAGE_WIDTH, 3)
+
+
+# -------------------------------
+# Calibration / evaluation data
+# -------------------------------
+def load_clips(paths, limit):
+    """
+    Sample clips from videos; labels come from a Violence/NonViolence parent folder
+    """
+    from main import collect_videos, sample_videos
+
+    videos = collect_videos(paths)[:limit]
+    clips, labels, names = [], [], []
+    for path, frames in sample_videos(videos):
+        if frames is None:
+            continue
+        parent = os.path.basename(os.path.dirname(path))
+        clips.append(frames)
+        labels.append(CLASSES_LIST.index(parent) if parent in CLASSES_LIST else None)
+        names.append(path)
+    return clips, labels, names
+
+
+def synthetic_clips(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.random(CLIP_SHAPE, dtype=np.float32) for _ in range(count)]
+
+
+def representative_dataset(clips, keras_model, part):
+    """
+    Yield calibration inputs for one graph: whole clips, single frames or
+    frame embeddings for the head
+    """
+    extractor = None
+    if part != "clips":
+        extractor, _ = split_model(keras_model)
+
+    def generator():
+        for clip in clips:
+            if part == "clips":
+                yield [clip[np.newaxis]]
+            elif part == "frames":
+                for frame in clip:
+                    yield [frame[np.newaxis]]
+            else:
+                yield [np.asarray(extractor(clip, training=False))[np.newaxis]]
+    return generator
+
+
+# -------------------------------
+# Export
+# -------------------------------
+def _graphs(keras_model, split):
+    """(suffix, keras model, input shape) for every graph to export"""
+    import tensorflow as tf
+
+    graphs = [("", keras_model, CLIP_SHAPE, "clips")]
+    if split:
+        extractor, head = split_model(keras_model)
+        graphs.append(("_frames", extractor, (IMAGE_HEIGHT, IMAGE_WIDTH, 3), "frames"))
+        graphs.append(("_head", head, tuple(head.inputs[0].shape[1:]), "features"))
+    return [(suffix, model, tf.TensorSpec((None,) + tuple(shape), tf.float32), part)
+            for suffix, model, shape, part in graphs]
+
+
+def export_tflite(keras_model, output_path, quantize, calibration_clips, split):
+    import tensorflow as tf
+
+    base, _ = os.path.splitext(output_path)
+    written = []
+    for suffix, model, spec, part in _graphs(keras_model, split):
+        # A concrete function with a batch of 1 keeps LSTM ops convertible to builtins
+        fixed_spec = tf.TensorSpec((1,) + tuple(spec.shape[1:]), tf.float32)
+        function = tf.function(lambda x, m=model: m(x, training=False)).get_concrete_function(fixed_spec)
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([function], model)
+
+        if quantize == "float16":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.target_spec.supported_types = [tf.float16]
+        elif quantize == "int8":
+            if not calibration_clips:
+                raise ValueError("INT8 quantization needs calibration clips (--calibration)")
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = representative_dataset(calibration_clips, keras_model, part)
+            # Keep float I/O and fall back to float kernels for ops without int8 support
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+                                                   tf.lite.OpsSet.TFLITE_BUILTINS]
+
+        try:
+            tflite_model = converter.convert()
+        except Exception as e:
+            print(f"⚠️ Builtin-only conversion failed ({str(e)[:100]}), enabling SELECT_TF_OPS")
+            converter.target_spec.supported_ops = list(converter.target_spec.supported_ops or
+                                                       [tf.lite.OpsSet.TFLITE_BUILTINS]) + [tf.lite.OpsSet.SELECT_TF_OPS]
+            tflite_model = converter.convert()
+            print("⚠️ The exported model needs the Flex delegate (full TensorFlow Lite runtime)")
+
+        path = f"{base}{suffix}.tflite"
+        with open(path, "wb") as f:
+            f.write(tflite_model)
+        written.append(path)
+        print(f"✅ Wrote {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+    return written
+
+
+def export_onnx(keras_model, output_path, split):
+    import tf2onnx
+
+    base, _ = os.path.splitext(output_path)
+    written = []
+    for suffix, model, spec, _ in _graphs(keras_model, split):
+        path = f"{base}{suffix}.onnx"
+        tf2onnx.convert.from_keras(model, input_signature=[spec], opset=17, output_path=path)
+        written.append(path)
+        print(f"✅ Wrote {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+    return written
+
+
+# -------------------------------
+# Comparison report
+# -------------------------------
+def _timed_predictions(predict, clips):
+    outputs, latencies = [], []
+    predict(clips[0][np.newaxis])  # warmup
+    for clip in clips:
+        started = time.perf_counter()
+        outputs.append(np.asarray(predict(clip[np.newaxis]))[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(outputs), latencies
+
+
+def _latency_stats(latencies):
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(np.mean(latencies)), 3)
+    }
+
+
+def _accuracy(predictions, labels):
+    labelled = [(p, l) for p, l in zip(predictions, labels) if l is not None]
+    if not labelled:
+        return None
+    return round(float(np.mean([np.argmax(p) == l for p, l in labelled])), 4)
+
+
+def _import_seconds(module):
+    """Cold import time of a module in a fresh interpreter"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    try:
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=SCRIPT_DIR,
+                                         stderr=subprocess.DEVNULL)
+        return round(float(output.decode().strip().splitlines()[-1]), 3)
+    except Exception:
+        return None
+
+
+def compare(keras_model, keras_path, runtime_path, clips, labels):
+    from violence_runtime import load_runtime_model
+
+    runtime_model = load_runtime_model(runtime_path)
+    keras_out, keras_lat = _timed_predictions(lambda x: keras_model(x, training=False), clips)
+    runtime_out, runtime_lat = _timed_predictions(runtime_model.predict, clips)
+
+    violence_diff = np.abs(keras_out[:, 1] - runtime_out[:, 1])
+    keras_stats = _latency_stats(keras_lat)
+    runtime_stats = _latency_stats(runtime_lat)
+    return {
+        "keras_model": keras_path,
+        "runtime_model": runtime_path,
+        "clips": len(clips),
+        "labelled_clips": sum(label is not None for label in labels),
+        "agreement": round(float(np.mean(keras_out.argmax(1) == runtime_out.argmax(1))), 4),
+        "violence_prob_abs_diff": {
+            "mean": round(float(violence_diff.mean()), 5),
+            "max": round(float(violence_diff.max()), 5)
+        },
+        "accuracy": {"keras": _accuracy(keras_out, labels), "runtime": _accuracy(runtime_out, labels)},
+        "latency": {"keras": keras_stats, "runtime": runtime_stats,
+                    "speedup_p50": round(keras_stats["p50_ms"] / runtime_stats["p50_ms"], 2)},
+        "file_size_mb": {"keras": round(os.path.getsize(keras_path) / 2**20, 2),
+                         "runtime": round(os.path.getsize(runtime_path) / 2**20, 2)},
+        "import_seconds": {"tensorflow": _import_seconds("tensorflow"),
+                           "runtime": _import_seconds("violence_runtime")}
+    }
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Export and compare the violence detection model")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Keras .h5 model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tflite_parser = subparsers.add_parser("tflite", help="Export to TensorFlow Lite")
+    tflite_parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="float16")
+    tflite_parser.add_argument("--calibration", nargs="*", default=[], help="Videos/directories for INT8 calibration")
+    tflite_parser.add_argument("--calibration-clips", type=int, default=200)
+    tflite_parser.add_argument("--output")
+    tflite_parser.add_argument("--split", action="store_true", help="Also export frame extractor and head graphs")
+
+    onnx_parser = subparsers.add_parser("onnx", help="Export to ONNX (requires tf2onnx)")
+    onnx_parser.add_argument("--output")
+    onnx_parser.add_argument("--split", action="store_true", help="Also export frame extractor and head graphs")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare an exported model against Keras")
+    compare_parser.add_argument("runtime_model")
+    compare_parser.add_argument("--videos", nargs="*", default=[], help="Evaluation videos/directories")
+    compare_parser.add_argument("--clips", type=int, default=100)
+    compare_parser.add_argument("--report", help="Write the JSON report here")
+
+    args = parser.parse_args()
+    keras_model = load_violence_model(args.model)
+    base = os.path.splitext(args.model)[0]
+
+    if args.command == "tflite":
+        clips = load_clips(args.calibration, args.calibration_clips)[0] if args.calibration else []
+        output = args.output or f"{base}_{args.quantize}.tflite"
+        export_tflite(keras_model, output, args.quantize, clips, args.split)
+
+    elif args.command == "onnx":
+        export_onnx(keras_model, args.output or f"{base}.onnx", args.split)
+
+    elif args.command == "compare":
+        if args.videos:
+            clips, labels, _ = load_clips(args.videos, args.clips)
+        else:
+            clips = synthetic_clips(args.clips)
+            labels = [None] * len(clips)
+        if not clips:
+            print("❌ No clips could be sampled")
+            return 1
+
+        report = compare(keras_model, args.model, args.runtime_model, clips, labels)
+        output = json.dumps(report, indent=2)
+        if args.report:
+            with open(args.report, "w") as f:
+                f.write(output + "\n")
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
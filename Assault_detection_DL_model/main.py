@@ -4,6 +4,8 @@ Simple test function with hardcoded paths
 """
 
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import tensorflow as tf
@@ -22,6 +24,7 @@ os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 IMAGE_HEIGHT, IMAGE_WIDTH = 64, 64
 SEQUENCE_LENGTH = 16
 CLASSES_LIST = ["NonViolence", "Violence"]
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".mpg", ".mpeg", ".webm")
 
 # Hardcoded paths
 MODEL_PATH = r".\Assault_detection_DL_model\MoBiLSTM_model.h5"
@@ -30,12 +33,14 @@ VIDEO_PATH = r".\Assault_detection_DL_model\test_video.mp4"
 # -------------------------------
 # Model Architecture Recreation
 # -------------------------------
-def create_model():
+def create_model(weights="imagenet"):
     """
-    Recreate the exact model architecture from training
+    Recreate the exact model architecture from training.
+    Pass weights=None when trained weights are loaded afterwards, which
+    also avoids downloading the ImageNet weights.
     """
     # Load MobileNetV2 base model
-    mobilenet = MobileNetV2(include_top=False, weights="imagenet")
+    mobilenet = MobileNetV2(include_top=False, weights=weights)
     
     # Fine-tuning: make last 40 layers trainable
     mobilenet.trainable = True
@@ -77,10 +82,17 @@ def create_model():
 # -------------------------------
 # Model Loading Function
 # -------------------------------
+_loaded_model = None
+
 def load_trained_model():
     """
-    Load the trained model with proper error handling
+    Load the trained model with proper error handling.
+    The model is loaded once and reused by later calls.
     """
+    global _loaded_model
+    if _loaded_model is not None:
+        return _loaded_model
+    
     if not os.path.exists(MODEL_PATH):
         print(f"❌ Model file not found: {MODEL_PATH}")
         print("Please ensure 'MoBiLSTM_model.h5' is in the same directory as this script.")
@@ -90,6 +102,7 @@ def load_trained_model():
         print(f"📥 Loading model from {MODEL_PATH}...")
         model = keras.models.load_model(MODEL_PATH)
         print("✅ Model loaded successfully!")
+        _loaded_model = model
         return model
         
     except Exception as e:
@@ -97,8 +110,8 @@ def load_trained_model():
         print("🔧 Recreating model architecture and loading weights...")
         
         try:
-            # Recreate model and load weights
-            model = create_model()
+            # Recreate model offline and load the trained weights
+            model = create_model(weights=None)
             model.load_weights(MODEL_PATH)
             
             # Compile the model
@@ -108,6 +121,7 @@ def load_trained_model():
                 metrics=['accuracy']
             )
             print("✅ Model weights loaded successfully!")
+            _loaded_model = model
             return model
             
         except Exception as e2:
@@ -117,6 +131,93 @@ def load_trained_model():
 # -------------------------------
 # Video Processing Functions
 # -------------------------------
+def count_frames(video_path):
+    """
+    Count frames with a grab-only pass (no color conversion) for containers
+    that do not report CAP_PROP_FRAME_COUNT
+    """
+    video_reader = cv2.VideoCapture(video_path)
+    frame_count = 0
+    while video_reader.grab():
+        frame_count += 1
+    video_reader.release()
+    return frame_count
+
+def _sample_pass(video_path, frame_count, raw_frames):
+    """
+    One linear decode pass: grab() every frame, retrieve() only the sampled ones.
+    Returns (frames sampled, frames grabbed).
+    """
+    video_reader = cv2.VideoCapture(video_path)
+    if not video_reader.isOpened():
+        return 0, 0
+
+    skip_frames_window = max(int(frame_count / SEQUENCE_LENGTH), 1)
+    sampled = 0
+    frame_index = 0
+    while sampled < SEQUENCE_LENGTH and video_reader.grab():
+        if frame_index == sampled * skip_frames_window:
+            success, frame = video_reader.retrieve()
+            if not success:
+                break
+            raw_frames[sampled] = cv2.resize(frame, (IMAGE_WIDTH, IMAGE_HEIGHT))
+            sampled += 1
+        frame_index += 1
+
+    video_reader.release()
+    return sampled, frame_index
+
+def sample_video_frames(video_path):
+    """
+    Sample SEQUENCE_LENGTH evenly spaced frames without seeking.
+    Returns a float32 array of shape (SEQUENCE_LENGTH, H, W, 3) or None.
+    """
+    video_reader = cv2.VideoCapture(video_path)
+    if not video_reader.isOpened():
+        return None
+    frame_count = int(video_reader.get(cv2.CAP_PROP_FRAME_COUNT))
+    video_reader.release()
+
+    if frame_count <= 0:
+        frame_count = count_frames(video_path)
+
+    raw_frames = np.empty((SEQUENCE_LENGTH, IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.uint8)
+    sampled, grabbed = _sample_pass(video_path, frame_count, raw_frames)
+
+    if sampled < SEQUENCE_LENGTH and grabbed >= SEQUENCE_LENGTH:
+        # Reported frame count was too high; resample with the real length
+        sampled, grabbed = _sample_pass(video_path, grabbed, raw_frames)
+
+    if sampled < SEQUENCE_LENGTH:
+        return None
+
+    # Normalize all sampled frames in one vectorized step
+    frames = np.empty(raw_frames.shape, dtype=np.float32)
+    np.multiply(raw_frames, np.float32(1.0 / 255.0), out=frames, dtype=np.float32)
+    return frames
+
+def sample_videos(video_paths, max_workers=None):
+    """
+    Sample many videos in parallel (OpenCV releases the GIL while decoding).
+    Yields (video_path, frames or None) in input order.
+    """
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        yield from zip(video_paths, pool.map(sample_video_frames, video_paths))
+
+def collect_videos(paths):
+    """
+    Expand files and directories into a sorted list of video files
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                videos.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return videos
+
 def extract_frames():
     """
     Extract frames from video for prediction
@@ -126,37 +227,14 @@ def extract_frames():
         print("Please ensure 'test_video.mp4' is in the same directory as this script.")
         return None
     
-    frames_list = []
-    video_reader = cv2.VideoCapture(VIDEO_PATH)
-    
-    if not video_reader.isOpened():
-        print(f"❌ Could not open video file: {VIDEO_PATH}")
-        return None
-    
-    video_frames_count = int(video_reader.get(cv2.CAP_PROP_FRAME_COUNT))
-    skip_frames_window = max(int(video_frames_count / SEQUENCE_LENGTH), 1)
-    
-    print(f"📹 Video has {video_frames_count} frames, extracting {SEQUENCE_LENGTH} frames...")
+    print(f"📹 Extracting {SEQUENCE_LENGTH} frames from {VIDEO_PATH}...")
+    frames = sample_video_frames(VIDEO_PATH)
     
-    for frame_counter in range(SEQUENCE_LENGTH):
-        video_reader.set(cv2.CAP_PROP_POS_FRAMES, frame_counter * skip_frames_window)
-        success, frame = video_reader.read()
-        
-        if not success:
-            break
-            
-        # Resize and normalize frame
-        resized_frame = cv2.resize(frame, (IMAGE_HEIGHT, IMAGE_WIDTH))
-        normalized_frame = resized_frame / 255.0
-        frames_list.append(normalized_frame)
-    
-    video_reader.release()
-    
-    if len(frames_list) == SEQUENCE_LENGTH:
-        print(f"✅ Successfully extracted {len(frames_list)} frames")
-        return np.array(frames_list)
+    if frames is not None:
+        print(f"✅ Successfully extracted {len(frames)} frames")
+        return frames
     else:
-        print(f"⚠️ Only extracted {len(frames_list)} frames, expected {SEQUENCE_LENGTH}")
+        print(f"⚠️ Could not extract {SEQUENCE_LENGTH} frames from {VIDEO_PATH}")
         return None
 
 def predict_violence():
@@ -202,6 +280,65 @@ def predict_violence():
     
     print("="*50)
 
+def score_videos(video_paths, model, batch_size=32, max_workers=None):
+    """
+    Dataset-scale scoring: sample videos in parallel and predict in batches.
+    Returns one result dict per video.
+    """
+    results = []
+    batch = np.empty((batch_size, SEQUENCE_LENGTH, IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.float32)
+    batch_paths = []
+
+    def flush():
+        predictions = model.predict(batch[:len(batch_paths)], verbose=0)
+        for path, prediction in zip(batch_paths, predictions):
+            label = int(np.argmax(prediction))
+            results.append({
+                "video": path,
+                "prediction": CLASSES_LIST[label],
+                "confidence": float(prediction[label]),
+                "violence_probability": float(prediction[1])
+            })
+        batch_paths.clear()
+
+    for path, frames in sample_videos(video_paths, max_workers):
+        if frames is None:
+            results.append({"video": path, "error": "Could not extract frames"})
+            continue
+        batch[len(batch_paths)] = frames
+        batch_paths.append(path)
+        if len(batch_paths) == batch_size:
+            flush()
+
+    if batch_paths:
+        flush()
+    return results
+
+def score_dataset(paths):
+    """
+    Score every video under the given files/directories and print a summary
+    """
+    videos = collect_videos(paths)
+    print(f"🔍 Scoring {len(videos)} videos...")
+    
+    model = load_trained_model()
+    if model is None:
+        print("❌ Failed to load model")
+        return
+    
+    results = score_videos(videos, model)
+    violent = 0
+    for result in results:
+        if "error" in result:
+            print(f"⚠️ {result['video']}: {result['error']}")
+            continue
+        violent += result["prediction"] == "Violence"
+        print(f"{'🔴' if result['prediction'] == 'Violence' else '🟢'} {result['video']}: "
+              f"{result['prediction']} ({result['confidence']:.1%})")
+    
+    print("="*50)
+    print(f"📊 {violent} of {len(results)} videos classified as Violence")
+
 # -------------------------------
 # Simple Test Function
 # -------------------------------
@@ -221,4 +358,7 @@ def test_violence_detection():
 # Run Test
 # -------------------------------
 if __name__ == "__main__":
-    test_violence_detection()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        score_dataset(sys.argv[1:])
+    else:
+        test_violence_detection()
\ No newline at end of file
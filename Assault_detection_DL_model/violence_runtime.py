@@ -0,0 +1,144 @@
+"""
+Lightweight Violence Model Runtime
+Runs exported TFLite / ONNX versions of the MoBiLSTM model without
+importing Keras or the full TensorFlow package
+"""
+
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Interpreter loading
+# -------------------------------
+def _tflite_interpreter_class():
+    """Prefer the standalone runtimes; full TensorFlow is only a last resort"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class _TFLiteRunner:
+    """Single TFLite graph with dynamic batch support and int8 (de)quantization"""
+
+    def __init__(self, model_path, num_threads=None):
+        Interpreter = _tflite_interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input['shape'][0])
+        self.item_shape = tuple(int(d) for d in self.input['shape'][1:])
+        # The interpreter holds one set of tensors, so calls must not overlap
+        self.lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        self.interpreter.resize_tensor_input(self.input['index'], (batch_size,) + self.item_shape)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = batch_size
+
+    def __call__(self, batch):
+        with self.lock:
+            return self._invoke(np.asarray(batch, dtype=np.float32))
+
+    def _invoke(self, batch):
+        if len(batch) != self.batch_size:
+            self._resize(len(batch))
+
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] != np.float32 and scale:
+            batch = np.round(batch / scale + zero_point).astype(self.input['dtype'])
+
+        self.interpreter.set_tensor(self.input['index'], batch)
+        self.interpreter.invoke()
+        result = self.interpreter.get_tensor(self.output['index'])
+
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] != np.float32 and scale:
+            result = (result.astype(np.float32) - zero_point) * scale
+        return np.array(result, dtype=np.float32)
+
+
+class _ONNXRunner:
+    def __init__(self, model_path, num_threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.item_shape = tuple(self.session.get_inputs()[0].shape[1:])
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+def _make_runner(model_path, num_threads=None):
+    extension = os.path.splitext(model_path)[1].lower()
+    if extension == '.tflite':
+        return _TFLiteRunner(model_path, num_threads)
+    if extension == '.onnx':
+        return _ONNXRunner(model_path, num_threads)
+    raise ValueError(f"Unsupported model format: {model_path}")
+
+
+# -------------------------------
+# Runtime model
+# -------------------------------
+class RuntimeViolenceModel:
+    """
+    Drop-in replacement for the Keras model: `predict(batch, verbose=0)`
+    returns class probabilities for clips of shape (N, 16, 64, 64, 3).
+
+    When the split frame/head graphs exported with `--split` are found next
+    to the model, `embed` / `score` / `feature_dim` are exposed as well so
+    ViolenceDetector can use its per-frame feature cache.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+        self.model_path = model_path
+        self.clip_runner = _make_runner(model_path, num_threads)
+
+        base, extension = os.path.splitext(model_path)
+        frames_path = f"{base}_frames{extension}"
+        head_path = f"{base}_head{extension}"
+        self.feature_dim = None
+        if os.path.exists(frames_path) and os.path.exists(head_path):
+            self.frame_runner = _make_runner(frames_path, num_threads)
+            self.head_runner = _make_runner(head_path, num_threads)
+            self.feature_dim = int(self.head_runner.item_shape[-1])
+
+    def predict(self, clips, verbose=0):
+        return self.clip_runner(clips)
+
+    def embed(self, frames):
+        return self.frame_runner(frames)
+
+    def score(self, features):
+        return self.head_runner(features)
+
+
+def load_runtime_model(model_path, num_threads=None):
+    model = RuntimeViolenceModel(model_path, num_threads)
+    logger.info(f"Loaded violence runtime model {model_path}"
+                f"{' with feature cache graphs' if model.feature_dim else ''}")
+    return model
@@ -0,0 +1,223 @@
+"""
+Violence Inference Service
+Long-lived MoBiLSTM model with cross-source request batching
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from violence_stream import (IMAGE_HEIGHT, IMAGE_WIDTH, SEQUENCE_LENGTH,
+                             load_violence_model, split_model)
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Request batching
+# -------------------------------
+class _BatchQueue:
+    """
+    Collects single inputs from many threads and runs them as one stacked
+    batch once `max_batch_size` items are waiting or `max_wait` has passed
+    """
+
+    def __init__(self, name, run_batch, max_batch_size, max_wait):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.items = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"violence-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.requests.put((item, future))
+        return future
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self.requests.get()
+            if first is None:
+                return
+
+            batch = self._collect(first)
+            started = time.perf_counter()
+            try:
+                outputs = self.run_batch(np.stack([item for item, _ in batch]))
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+            self.last_ms = (time.perf_counter() - started) * 1000
+            self.total_ms += self.last_ms
+            self.batches += 1
+            self.items += len(batch)
+
+    def close(self):
+        self.requests.put(None)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'mean_batch_ms': round(self.total_ms / self.batches, 2) if self.batches else 0.0,
+            'last_batch_ms': round(self.last_ms, 2)
+        }
+
+
+# -------------------------------
+# Inference Service
+# -------------------------------
+class ViolenceInferenceService:
+    """
+    Loads the violence model once and serves predictions for many sources.
+
+    Batches are padded to power-of-two buckets and run through a
+    tf.function (XLA compiled when available), so each bucket is traced
+    once during warmup and per-batch latency stays stable afterwards.
+
+    Exposes the Keras-style `predict(batch, verbose=0)` for full clips and,
+    when the model can be split, `embed(frames)` / `score(features)` for the
+    per-frame feature cache used by ViolenceDetector.
+    """
+
+    def __init__(self, model_path=None, model=None, max_batch_size=16, max_wait_ms=5,
+                 jit_compile=True, feature_cache=True, warmup=True):
+        import tensorflow as tf
+        self.tf = tf
+
+        self.model = model if model is not None else load_violence_model(model_path)
+        self.max_batch_size = max_batch_size
+        self.jit_compile = jit_compile
+        self.buckets = [1 << i for i in range(max_batch_size.bit_length()) if (1 << i) <= max_batch_size]
+        if self.buckets[-1] != max_batch_size:
+            self.buckets.append(max_batch_size)
+        max_wait = max_wait_ms / 1000.0
+
+        self.runners = {}
+        self.queues = {}
+        self._add_runner('clips', self.model, (SEQUENCE_LENGTH, IMAGE_HEIGHT, IMAGE_WIDTH, 3), max_wait)
+
+        self.feature_dim = None
+        if feature_cache:
+            try:
+                extractor, head = split_model(self.model)
+                self.feature_dim = int(extractor.outputs[0].shape[-1])
+                self._add_runner('frames', extractor, (IMAGE_HEIGHT, IMAGE_WIDTH, 3), max_wait)
+                self._add_runner('features', head, (SEQUENCE_LENGTH, self.feature_dim), max_wait)
+            except Exception as e:
+                logger.warning(f"Feature cache disabled for violence service: {e}")
+                self.feature_dim = None
+
+        if warmup:
+            self.warmup()
+
+    def _compile(self, keras_model, jit_compile):
+        return self.tf.function(lambda x: keras_model(x, training=False), jit_compile=jit_compile)
+
+    def _add_runner(self, name, keras_model, item_shape, max_wait):
+        runner = {
+            'model': keras_model,
+            'fn': self._compile(keras_model, self.jit_compile),
+            'jit': self.jit_compile,
+            'buffers': {size: np.zeros((size,) + item_shape, dtype=np.float32) for size in self.buckets},
+            'lock': threading.Lock()
+        }
+        self.runners[name] = runner
+        self.queues[name] = _BatchQueue(name, lambda batch: self._run(name, batch),
+                                        self.max_batch_size, max_wait)
+
+    def _bucket(self, size):
+        for bucket in self.buckets:
+            if bucket >= size:
+                return bucket
+        return self.buckets[-1]
+
+    def _run(self, name, batch):
+        """Run a stacked batch through the compiled function, chunked and padded to buckets"""
+        runner = self.runners[name]
+        outputs = []
+        for start in range(0, len(batch), self.max_batch_size):
+            chunk = batch[start:start + self.max_batch_size]
+            size = self._bucket(len(chunk))
+            with runner['lock']:
+                padded = runner['buffers'][size]
+                padded[:len(chunk)] = chunk
+                padded[len(chunk):] = 0
+                try:
+                    result = runner['fn'](padded)
+                except Exception as e:
+                    if not runner['jit']:
+                        raise
+                    logger.warning(f"XLA inference failed for {name}, falling back to graph mode: {e}")
+                    runner['fn'] = self._compile(runner['model'], False)
+                    runner['jit'] = False
+                    result = runner['fn'](padded)
+                outputs.append(np.array(result)[:len(chunk)])
+        return np.concatenate(outputs)
+
+    def warmup(self):
+        """Trace every bucket size so the first real request does not pay for compilation"""
+        started = time.perf_counter()
+        for name, runner in self.runners.items():
+            for size, buffer in runner['buffers'].items():
+                self._run(name, np.zeros_like(buffer))
+        logger.info(f"Violence service warmed up in {time.perf_counter() - started:.1f}s "
+                    f"(buckets {self.buckets})")
+
+    def _submit_all(self, name, items):
+        items = np.asarray(items, dtype=np.float32)
+        if len(items) > 1:
+            # Already a batch: run it directly instead of queueing row by row
+            return self._run(name, items)
+        futures = [self.queues[name].submit(item) for item in items]
+        return np.stack([future.result() for future in futures])
+
+    def predict(self, clips, verbose=0):
+        """Violence probabilities for clips of shape (N, 16, 64, 64, 3)"""
+        return self._submit_all('clips', clips)
+
+    def embed(self, frames):
+        """MobileNetV2 embeddings for frames of shape (N, 64, 64, 3)"""
+        return self._submit_all('frames', frames)
+
+    def score(self, features):
+        """Head predictions for cached embeddings of shape (N, 16, feature_dim)"""
+        return self._submit_all('features', features)
+
+    def stats(self):
+        return {name: batch_queue.stats() for name, batch_queue in self.queues.items()}
+
+    def close(self):
+        for batch_queue in self.queues.values():
+            batch_queue.close()
@@ -0,0 +1,268 @@
+"""
+Streaming Violence Detection
+Sliding-window MoBiLSTM inference over live or recorded video
+"""
+
+import logging
+import os
+import time
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# Configuration (must match main.py / training)
+# -------------------------------
+IMAGE_HEIGHT, IMAGE_WIDTH = 64, 64
+SEQUENCE_LENGTH = 16
+CLASSES_LIST = ["NonViolence", "Violence"]
+VIOLENCE_CLASS_INDEX = CLASSES_LIST.index("Violence")
+
+
+# -------------------------------
+# Model Loading
+# -------------------------------
+def load_violence_model(model_path):
+    """
+    Load the trained MoBiLSTM model, rebuilding the architecture if the
+    saved file cannot be deserialized directly
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    from tensorflow import keras
+
+    try:
+        return keras.models.load_model(model_path, compile=False)
+    except Exception as e:
+        logger.warning(f"Direct loading failed ({str(e)[:100]}), rebuilding architecture")
+        from main import create_model
+        # Weights are replaced by load_weights, so skip the ImageNet download
+        model = create_model(weights=None)
+        model.load_weights(model_path)
+        return model
+
+
+def split_model(model):
+    """
+    Split the MoBiLSTM model into a per-frame feature extractor
+    (MobileNetV2 + Flatten) and a sequence head (BiLSTM + Dense layers).
+    Both share the trained weights of the original model.
+    """
+    from tensorflow import keras
+
+    layers = model.layers
+    head_start = next((i for i, layer in enumerate(layers)
+                       if isinstance(layer, keras.layers.Bidirectional)), None)
+    if head_start is None or not isinstance(layers[0], keras.layers.TimeDistributed):
+        raise ValueError("Model does not have the TimeDistributed backbone + Bidirectional head layout")
+
+    for layer in layers[1:head_start]:
+        inner = layer.layer if isinstance(layer, keras.layers.TimeDistributed) else layer
+        if not isinstance(inner, (keras.layers.Dropout, keras.layers.Flatten)):
+            raise ValueError(f"Unexpected layer between backbone and head: {layer.name}")
+
+    frame_input = keras.Input(shape=(IMAGE_HEIGHT, IMAGE_WIDTH, 3))
+    features = keras.layers.Flatten()(layers[0].layer(frame_input, training=False))
+    extractor = keras.Model(frame_input, features, name="frame_features")
+
+    sequence_input = keras.Input(shape=(SEQUENCE_LENGTH, int(features.shape[-1])))
+    x = sequence_input
+    for layer in layers[head_start:]:
+        x = layer(x)
+    head = keras.Model(sequence_input, x, name="sequence_head")
+
+    return extractor, head
+
+
+# -------------------------------
+# Per-source sliding window state
+# -------------------------------
+class _SourceWindow:
+    """
+    Preallocated ring of the last SEQUENCE_LENGTH preprocessed frames, or of
+    their MobileNetV2 embeddings when a feature extractor is used
+    """
+
+    def __init__(self, feature_dim=None):
+        if feature_dim is None:
+            self.ring = np.zeros((SEQUENCE_LENGTH, IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.float32)
+            self.scratch = None
+        else:
+            self.ring = np.zeros((SEQUENCE_LENGTH, feature_dim), dtype=np.float32)
+            self.scratch = np.zeros((1, IMAGE_HEIGHT, IMAGE_WIDTH, 3), dtype=np.float32)
+        self.ordered = np.empty_like(self.ring)
+        self.timestamps = np.zeros(SEQUENCE_LENGTH, dtype=np.float64)
+        self.write_index = 0
+        self.filled = 0
+        self.frames_seen = 0
+        self.samples_since_inference = 0
+
+        # Hysteresis state
+        self.active = False
+        self.high_windows = 0
+        self.low_windows = 0
+        self.event_start = None
+        self.peak_score = 0.0
+        self.last_score = None
+
+    def push(self, frame, timestamp, embed=None):
+        resized = cv2.resize(frame, (IMAGE_WIDTH, IMAGE_HEIGHT))
+        if embed is None:
+            np.multiply(resized, np.float32(1.0 / 255.0), out=self.ring[self.write_index], dtype=np.float32)
+        else:
+            # Only the new frame goes through MobileNetV2; older embeddings stay cached
+            np.multiply(resized, np.float32(1.0 / 255.0), out=self.scratch[0], dtype=np.float32)
+            self.ring[self.write_index] = embed(self.scratch)[0]
+        self.timestamps[self.write_index] = timestamp
+        self.write_index = (self.write_index + 1) % SEQUENCE_LENGTH
+        self.filled = min(self.filled + 1, SEQUENCE_LENGTH)
+        self.samples_since_inference += 1
+
+    def window(self):
+        """Frames in chronological order, copied into a reusable buffer"""
+        oldest = self.write_index
+        tail = SEQUENCE_LENGTH - oldest
+        self.ordered[:tail] = self.ring[oldest:]
+        self.ordered[tail:] = self.ring[:oldest]
+        return self.ordered
+
+    def time_span(self):
+        oldest = self.write_index
+        newest = (self.write_index - 1) % SEQUENCE_LENGTH
+        return float(self.timestamps[oldest]), float(self.timestamps[newest])
+
+
+# -------------------------------
+# Streaming Detector
+# -------------------------------
+class ViolenceDetector:
+    """
+    Keeps a rolling 16-frame window per source and scores it every `stride`
+    sampled frames. Scores pass through hysteresis: an event starts after
+    `on_windows` consecutive scores >= `on_threshold` and ends after
+    `off_windows` consecutive scores < `off_threshold`.
+
+    With `feature_cache` the model is split so each sampled frame costs one
+    MobileNetV2 pass and a window score only runs the BiLSTM head over the
+    cached embeddings.
+    """
+
+    def __init__(self, model, sample_interval=1, stride=4, on_threshold=0.7, off_threshold=0.4,
+                 on_windows=2, off_windows=3, feature_cache=True):
+        self.model = model
+        self.embed_fn = None
+        self.score_fn = None
+        self.feature_dim = None
+        if feature_cache and getattr(model, 'feature_dim', None):
+            # ViolenceInferenceService already exposes batched embed/score
+            self.embed_fn, self.score_fn = model.embed, model.score
+            self.feature_dim = model.feature_dim
+        elif feature_cache and hasattr(model, 'layers'):
+            try:
+                extractor, head = split_model(model)
+                self.embed_fn = lambda frames: np.asarray(extractor(frames, training=False))
+                self.score_fn = lambda features: np.asarray(head(features, training=False))
+                self.feature_dim = int(extractor.outputs[0].shape[-1])
+            except Exception as e:
+                logger.warning(f"Feature cache disabled, scoring full windows: {e}")
+        if self.feature_dim:
+            logger.info(f"Violence feature cache enabled ({self.feature_dim} features per frame)")
+        self.sample_interval = max(int(sample_interval), 1)
+        self.stride = max(int(stride), 1)
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.on_windows = max(int(on_windows), 1)
+        self.off_windows = max(int(off_windows), 1)
+        self.sources = {}
+
+    def reset(self, source_id=None):
+        if source_id is None:
+            self.sources.clear()
+        else:
+            self.sources.pop(source_id, None)
+
+    def _predict(self, batch):
+        if self.score_fn is not None:
+            return self.score_fn(batch)
+        return self.model.predict(batch, verbose=0)
+
+    def process_frame(self, source_id, frame, timestamp=None):
+        """
+        Feed one decoded BGR frame. Returns a score record when the model ran
+        on this frame, otherwise None.
+        """
+        state = self.sources.get(source_id)
+        if state is None:
+            state = self.sources[source_id] = _SourceWindow(self.feature_dim)
+
+        state.frames_seen += 1
+        if (state.frames_seen - 1) % self.sample_interval:
+            return None
+
+        state.push(frame, time.time() if timestamp is None else timestamp, self.embed_fn)
+        if state.filled < SEQUENCE_LENGTH or state.samples_since_inference < self.stride:
+            return None
+
+        state.samples_since_inference = 0
+        predictions = self._predict(state.window()[np.newaxis])[0]
+        return self._update(source_id, state, float(predictions[VIOLENCE_CLASS_INDEX]))
+
+    def _update(self, source_id, state, score):
+        window_start, window_end = state.time_span()
+        state.last_score = score
+        event = None
+
+        if score >= self.on_threshold:
+            state.high_windows += 1
+            state.low_windows = 0
+        elif score < self.off_threshold:
+            state.low_windows += 1
+            state.high_windows = 0
+        else:
+            state.high_windows = 0
+            state.low_windows = 0
+
+        if state.active:
+            state.peak_score = max(state.peak_score, score)
+            if state.low_windows >= self.off_windows:
+                state.active = False
+                event = 'ended'
+        elif state.high_windows == 1:
+            # Remember where the candidate event began
+            state.event_start = window_start
+        if not state.active and event is None and state.high_windows >= self.on_windows:
+            state.active = True
+            state.peak_score = score
+            event = 'started'
+
+        record = {
+            'source': source_id,
+            'score': round(score, 4),
+            'window_start': window_start,
+            'window_end': window_end,
+            'violent': state.active,
+            'event': event
+        }
+        if event is not None:
+            record['event_start'] = state.event_start
+            record['peak_score'] = round(state.peak_score, 4)
+        if event == 'ended':
+            record['event_end'] = window_end
+            record['duration_seconds'] = round(window_end - state.event_start, 2)
+            state.event_start = None
+        return record
+
+    def get_status(self):
+        return {
+            source_id: {
+                'violent': state.active,
+                'last_score': state.last_score,
+                'event_start': state.event_start if state.active else None,
+                'window_ready': state.filled == SEQUENCE_LENGTH
+            }
+            for source_id, state in self.sources.items()
+        }
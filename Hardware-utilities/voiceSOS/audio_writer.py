@@ -0,0 +1,147 @@
+import os
+import struct
+import time
+from collections import deque
+
+try:
+    import lameenc
+except ImportError:
+    lameenc = None
+
+PART_SUFFIX = ".part"
+WAV_HEADER_SIZE = 44
+
+
+class PreRollBuffer:
+    """Fixed-size ring of the most recent audio chunks, kept while not recording."""
+
+    def __init__(self, seconds, sample_rate, chunk_size):
+        max_chunks = max(int(seconds * sample_rate / chunk_size), 0)
+        self.chunks = deque(maxlen=max_chunks)
+
+    def append(self, data):
+        if self.chunks.maxlen:
+            self.chunks.append(data)
+
+    def drain(self):
+        chunks = list(self.chunks)
+        self.chunks.clear()
+        return chunks
+
+
+def _wav_header(channels, sample_width, sample_rate, data_size):
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_size
+    )
+
+
+class StreamingAudioWriter:
+    """
+    Writes PCM chunks straight to disk as they arrive.
+
+    Audio goes to `<name>.part` and is renamed to its final name only after
+    `close()`, so a crash never leaves a half-written file under the real
+    name. WAV headers are re-patched every `sync_interval` seconds, which
+    keeps the partial file playable up to the last sync. MP3 output
+    (lameenc) is frame based and needs no header.
+    """
+
+    def __init__(self, base_path, channels, sample_width, sample_rate, codec="mp3",
+                 bitrate=64, sync_interval=1.0):
+        if codec == "mp3" and lameenc is None:
+            print("⚠️ lameenc not installed, recording as WAV")
+            codec = "wav"
+
+        self.codec = codec
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.sync_interval = sync_interval
+        self.path = f"{base_path}.{codec}"
+        self.part_path = self.path + PART_SUFFIX
+        self.data_size = 0
+        self.last_sync = time.monotonic()
+        self.encoder = None
+
+        self.file = open(self.part_path, "wb")
+        if codec == "mp3":
+            self.encoder = lameenc.Encoder()
+            self.encoder.set_bit_rate(bitrate)
+            self.encoder.set_in_sample_rate(sample_rate)
+            self.encoder.set_channels(channels)
+            self.encoder.set_quality(7)  # Fast encoding; speech does not need more
+        else:
+            self.file.write(_wav_header(channels, sample_width, sample_rate, 0))
+
+    @property
+    def duration(self):
+        return self.data_size / (self.sample_rate * self.channels * self.sample_width)
+
+    def write(self, data):
+        self.data_size += len(data)
+        if self.encoder is not None:
+            self.file.write(self.encoder.encode(data))
+        else:
+            self.file.write(data)
+
+        if time.monotonic() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def _patch_header(self):
+        if self.codec == "wav":
+            self.file.seek(0)
+            self.file.write(_wav_header(self.channels, self.sample_width, self.sample_rate, self.data_size))
+            self.file.seek(0, os.SEEK_END)
+
+    def sync(self):
+        self._patch_header()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        """Finish the file and move it to its final name"""
+        if self.encoder is not None:
+            self.file.write(self.encoder.flush())
+        self.sync()
+        self.file.close()
+        os.replace(self.part_path, self.path)
+        return self.path
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.part_path)
+
+
+def recover_partial_recordings(output_dir):
+    """Finalize `.part` files left behind by a crash. Returns the recovered paths."""
+    recovered = []
+    for name in os.listdir(output_dir):
+        if not name.endswith(PART_SUFFIX):
+            continue
+        part_path = os.path.join(output_dir, name)
+        final_path = part_path[:-len(PART_SUFFIX)]
+        try:
+            if final_path.endswith(".wav"):
+                size = os.path.getsize(part_path)
+                if size <= WAV_HEADER_SIZE:
+                    os.remove(part_path)
+                    continue
+                with open(part_path, "r+b") as f:
+                    header = f.read(WAV_HEADER_SIZE)
+                    channels, sample_rate = struct.unpack_from("<HI", header, 22)
+                    sample_width = struct.unpack_from("<H", header, 34)[0] // 8
+                    # Drop a trailing partial sample frame
+                    data_size = (size - WAV_HEADER_SIZE) // (channels * sample_width) * channels * sample_width
+                    f.truncate(WAV_HEADER_SIZE + data_size)
+                    f.seek(0)
+                    f.write(_wav_header(channels, sample_width, sample_rate, data_size))
+            os.replace(part_path, final_path)
+            recovered.append(final_path)
+        except Exception as e:
+            print(f"⚠️ Could not recover {part_path}: {e}")
+    return recovered
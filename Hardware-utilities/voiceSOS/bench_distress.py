@@ -0,0 +1,122 @@
+"""
+CPU and detection benchmark for the distress detector.
+
+Streams synthetic (or given 16-bit WAV) audio through DistressDetector
+chunk by chunk, exactly like the live PyAudio stream, and reports the CPU
+time spent per second of audio. Fails (exit code 1) when the CPU share
+exceeds --budget-percent, e.g. on a Raspberry Pi:
+
+    python bench_distress.py --seconds 120 --budget-percent 3
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from distress_detector import DistressClassifier, DistressDetector, read_wav
+
+SAMPLE_RATE = 44100
+CHUNK_SIZE = 1024
+
+
+def _harmonics(f0, seconds, level, count, rng, vibrato=0.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f = f0 * (1 + vibrato * np.sin(2 * np.pi * 6 * t))
+    phase = 2 * np.pi * np.cumsum(f) / SAMPLE_RATE
+    signal = sum(np.sin(k * phase) / k for k in range(1, count + 1))
+    signal += 0.05 * rng.standard_normal(len(t))
+    return level * signal / np.abs(signal).max()
+
+
+def synthetic_signals(seconds, seed=0):
+    """Labelled test signals: (name, int16 samples, is_distress)"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+
+    room = 0.003 * rng.standard_normal(n)
+    noise = 0.3 * rng.standard_normal(n)
+    # Speech-like: low pitch harmonics gated into ~4 syllables per second
+    syllables = (np.sin(2 * np.pi * 4 * t) > 0).astype(float)
+    speech = _harmonics(140, seconds, 0.1, 12, rng, vibrato=0.05) * syllables
+    scream = _harmonics(1000, seconds, 0.7, 6, rng, vibrato=0.04)
+
+    signals = [("room_tone", room, False), ("loud_noise", noise, False),
+               ("speech", speech, False), ("scream", scream, True)]
+    return [(name, np.clip(s * 32767, -32768, 32767).astype(np.int16), label) for name, s, label in signals]
+
+
+def run(samples, detector):
+    """Feed chunks; returns (cpu_seconds, max_score, events)"""
+    chunks = samples[:len(samples) // CHUNK_SIZE * CHUNK_SIZE].reshape(-1, CHUNK_SIZE)
+    max_score, events = 0.0, []
+    started = time.process_time()
+    for chunk in chunks:
+        event = detector.push(chunk.tobytes())
+        max_score = max(max_score, detector.last_score)
+        if event:
+            events.append(event)
+    return time.process_time() - started, max_score, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the audio distress detector")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of each synthetic signal")
+    parser.add_argument("--wav", nargs="*", default=[], help="Also score these 16-bit WAV files")
+    parser.add_argument("--model", default="distress_model.json")
+    parser.add_argument("--budget-percent", type=float, default=3.0, help="Allowed CPU share of one core")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    classifier = DistressClassifier.load(args.model)
+    signals = synthetic_signals(args.seconds)
+    for path in args.wav:
+        samples, rate = read_wav(path)
+        if rate != SAMPLE_RATE:
+            print(f"⚠️ Skipping {path}: sample rate {rate} != {SAMPLE_RATE}")
+            continue
+        signals.append((path, samples, None))
+
+    results, total_cpu, total_audio, correct = [], 0.0, 0.0, True
+    for name, samples, label in signals:
+        detector = DistressDetector(SAMPLE_RATE, CHUNK_SIZE, classifier=classifier)
+        cpu, max_score, events = run(samples, detector)
+        audio_seconds = len(samples) / SAMPLE_RATE
+        total_cpu += cpu
+        total_audio += audio_seconds
+        detected = "start" in events
+        if label is not None and detected != label:
+            correct = False
+        results.append({
+            "signal": name,
+            "audio_seconds": round(audio_seconds, 1),
+            "cpu_percent": round(100 * cpu / audio_seconds, 3),
+            "max_score": round(max_score, 3),
+            "detected": detected,
+            "expected": label
+        })
+        print(f"{name:>14}: cpu {100 * cpu / audio_seconds:6.3f}%  max score {max_score:.3f}  "
+              f"detected {detected}{'' if label is None else f' (expected {label})'}")
+
+    cpu_percent = 100 * total_cpu / total_audio
+    print(f"\nOverall CPU: {cpu_percent:.3f}% of one core (budget {args.budget_percent}%)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpu_percent": cpu_percent, "budget_percent": args.budget_percent,
+                       "signals": results}, f, indent=2)
+
+    if cpu_percent > args.budget_percent:
+        print("❌ CPU budget exceeded")
+        return 1
+    if not correct:
+        print("❌ Synthetic signals misclassified")
+        return 1
+    print("✅ Within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
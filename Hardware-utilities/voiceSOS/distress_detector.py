@@ -0,0 +1,257 @@
+"""
+Always-on audio distress detection for the voice SOS recorder.
+
+Every chunk from the PyAudio stream is summarised by a few NumPy features
+(loudness, spectral centroid, speech-band energy, flatness, peakiness). Features are computed for several chunks at a time with one
+batched FFT, and a small logistic classifier scores window statistics over
+the last second. Sustained high scores start a recording; a quiet period
+ends it.
+
+Train custom weights from labelled WAV folders:
+    python distress_detector.py train --positive screams/ --negative background/ --output distress_model.json
+"""
+
+import argparse
+import json
+import os
+import wave
+
+import numpy as np
+
+FEATURE_NAMES = ["loud_fraction", "band_ratio", "centroid_khz", "flatness", "log_peak", "max_level"]
+
+# Hand-tuned defaults: loud, tonal, 0.5-4 kHz heavy sound sustained over the window
+DEFAULT_MODEL = {
+    "weights": [4.0, 6.0, -0.5, -10.0, 1.5, 3.0],
+    "bias": -9.0,
+    "mean": [0.0] * len(FEATURE_NAMES),
+    "scale": [1.0] * len(FEATURE_NAMES)
+}
+
+LOUD_DBFS = -30.0
+BAND_HZ = (500.0, 4000.0)
+
+
+class ChunkFeatures:
+    """Vectorized per-chunk features for a batch of equally sized int16 chunks"""
+
+    def __init__(self, sample_rate, chunk_size):
+        self.window = np.hanning(chunk_size).astype(np.float32)
+        freqs = np.fft.rfftfreq(chunk_size, 1.0 / sample_rate).astype(np.float32)
+        self.freqs_khz = freqs / 1000.0
+        self.band = (freqs >= BAND_HZ[0]) & (freqs <= BAND_HZ[1])
+
+    def __call__(self, chunks):
+        """chunks: (N, chunk_size) int16 -> (N, 5) float32 [dbfs, centroid_khz, band_ratio, flatness, log_peak]"""
+        x = chunks.astype(np.float32) * np.float32(1.0 / 32768.0)
+        rms = np.sqrt(np.mean(x * x, axis=1))
+        dbfs = 20.0 * np.log10(rms + 1e-9)
+
+        power = np.abs(np.fft.rfft(x * self.window, axis=1)) ** 2 + 1e-12
+        total = power.sum(axis=1)
+        centroid = (power * self.freqs_khz).sum(axis=1) / total
+        band_ratio = power[:, self.band].sum(axis=1) / total
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        log_peak = np.log10(power[:, self.band].max(axis=1) / np.mean(power, axis=1))
+        return np.stack([dbfs, centroid, band_ratio, flatness, log_peak], axis=1).astype(np.float32)
+
+
+def window_statistics(frames):
+    """Summarise (N, 5) chunk features into the classifier input"""
+    dbfs = frames[:, 0]
+    loud = dbfs > LOUD_DBFS
+    # Spectral shape only from loud chunks, so silence gaps do not dilute it
+    shaped = frames[loud] if loud.any() else frames
+    return np.array([
+        loud.mean(),
+        shaped[:, 2].mean(),
+        shaped[:, 1].mean(),
+        shaped[:, 3].mean(),
+        shaped[:, 4].mean(),
+        (np.clip(dbfs.max(), -60.0, 0.0) + 60.0) / 60.0
+    ], dtype=np.float32)
+
+
+class DistressClassifier:
+    def __init__(self, model=None):
+        model = model or DEFAULT_MODEL
+        self.weights = np.asarray(model["weights"], dtype=np.float32)
+        self.bias = float(model["bias"])
+        self.mean = np.asarray(model["mean"], dtype=np.float32)
+        self.scale = np.asarray(model["scale"], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        if path and os.path.exists(path):
+            with open(path) as f:
+                return cls(json.load(f))
+        return cls()
+
+    def score(self, stats):
+        z = float(np.dot((stats - self.mean) / self.scale, self.weights) + self.bias)
+        return 1.0 / (1.0 + np.exp(-z))
+
+
+class DistressDetector:
+    """
+    Feed raw PCM chunks with `push`; returns "start" when distress is
+    detected, "stop" when it has been quiet for `hold_seconds` (or the
+    automatic recording reached `max_seconds`), otherwise None.
+    """
+
+    def __init__(self, sample_rate, chunk_size, classifier=None, window_seconds=1.0, hop_chunks=4,
+                 on_threshold=0.8, off_threshold=0.4, on_hops=3, hold_seconds=8.0, max_seconds=120.0):
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.classifier = classifier or DistressClassifier()
+        self.features = ChunkFeatures(sample_rate, chunk_size)
+        self.hop_chunks = hop_chunks
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.on_hops = on_hops
+
+        chunk_seconds = chunk_size / sample_rate
+        self.window_frames = max(int(round(window_seconds / chunk_seconds)), hop_chunks)
+        self.hold_chunks = int(hold_seconds / chunk_seconds)
+        self.max_chunks = int(max_seconds / chunk_seconds)
+
+        # Preallocated buffers: pending raw chunks and a ring of feature rows
+        self.pending = np.zeros((hop_chunks, chunk_size), dtype=np.int16)
+        self.pending_count = 0
+        self.ring = np.zeros((self.window_frames, 5), dtype=np.float32)
+        self.ring_index = 0
+        self.ring_filled = 0
+
+        self.active = False
+        self.high_hops = 0
+        self.quiet_chunks = 0
+        self.active_chunks = 0
+        self.last_score = 0.0
+        self.peak_score = 0.0
+
+    def push(self, data):
+        samples = np.frombuffer(data, dtype=np.int16)
+        if len(samples) != self.chunk_size:
+            return None
+        self.pending[self.pending_count] = samples
+        self.pending_count += 1
+        if self.active:
+            self.active_chunks += 1
+        if self.pending_count < self.hop_chunks:
+            return None
+        self.pending_count = 0
+        return self._evaluate(self.features(self.pending))
+
+    def _evaluate(self, rows):
+        for row in rows:
+            self.ring[self.ring_index] = row
+            self.ring_index = (self.ring_index + 1) % self.window_frames
+        self.ring_filled = min(self.ring_filled + len(rows), self.window_frames)
+        if self.ring_filled < self.window_frames:
+            return None
+
+        score = self.classifier.score(window_statistics(self.ring))
+        self.last_score = score
+
+        if not self.active:
+            self.high_hops = self.high_hops + 1 if score >= self.on_threshold else 0
+            if self.high_hops >= self.on_hops:
+                self.active = True
+                self.active_chunks = 0
+                self.quiet_chunks = 0
+                self.peak_score = score
+                return "start"
+            return None
+
+        self.peak_score = max(self.peak_score, score)
+        self.quiet_chunks = self.quiet_chunks + self.hop_chunks if score < self.off_threshold else 0
+        if self.quiet_chunks >= self.hold_chunks or self.active_chunks >= self.max_chunks:
+            self.active = False
+            self.high_hops = 0
+            return "stop"
+        return None
+
+
+# -------------------------------
+# Training
+# -------------------------------
+def read_wav(path):
+    with wave.open(path, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit WAV is supported")
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        channels = wf.getnchannels()
+        if channels > 1:
+            samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+        return samples, wf.getframerate()
+
+
+def file_windows(path, chunk_size=1024, window_seconds=1.0):
+    """Window statistics for every (half-overlapping) window of one WAV file"""
+    samples, sample_rate = read_wav(path)
+    chunks = samples[:len(samples) // chunk_size * chunk_size].reshape(-1, chunk_size)
+    if not len(chunks):
+        return []
+    frames = ChunkFeatures(sample_rate, chunk_size)(chunks)
+    window = max(int(round(window_seconds * sample_rate / chunk_size)), 1)
+    return [window_statistics(frames[start:start + window])
+            for start in range(0, max(len(frames) - window, 0) + 1, max(window // 2, 1))]
+
+
+def train(positive_dirs, negative_dirs, epochs=2000, learning_rate=0.1):
+    samples, labels = [], []
+    for dirs, label in ((positive_dirs, 1.0), (negative_dirs, 0.0)):
+        for directory in dirs:
+            for name in sorted(os.listdir(directory)):
+                if name.lower().endswith(".wav"):
+                    windows = file_windows(os.path.join(directory, name))
+                    samples.extend(windows)
+                    labels.extend([label] * len(windows))
+    if not samples or len(set(labels)) < 2:
+        raise ValueError("Need WAV files in both positive and negative folders")
+
+    x = np.array(samples, dtype=np.float64)
+    y = np.array(labels)
+    mean, scale = x.mean(axis=0), x.std(axis=0) + 1e-6
+    x = (x - mean) / scale
+
+    # Class-balanced logistic regression with plain gradient descent
+    sample_weight = np.where(y == 1, 0.5 / y.mean(), 0.5 / (1 - y.mean()))
+    weights, bias = np.zeros(x.shape[1]), 0.0
+    for _ in range(epochs):
+        error = (1.0 / (1.0 + np.exp(-(x @ weights + bias))) - y) * sample_weight
+        weights -= learning_rate * (x.T @ error / len(y) + 1e-3 * weights)
+        bias -= learning_rate * error.mean()
+
+    accuracy = np.mean(((x @ weights + bias) > 0) == (y == 1))
+    print(f"✅ Trained on {len(y)} windows ({int(y.sum())} positive), training accuracy {accuracy:.3f}")
+    return {"weights": weights.tolist(), "bias": float(bias), "mean": mean.tolist(), "scale": scale.tolist(),
+            "features": FEATURE_NAMES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio distress classifier")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Fit weights from labelled 16-bit WAV folders")
+    train_parser.add_argument("--positive", nargs="+", required=True, help="Folders with screams / distress audio")
+    train_parser.add_argument("--negative", nargs="+", required=True, help="Folders with normal background audio")
+    train_parser.add_argument("--output", default="distress_model.json")
+    score_parser = subparsers.add_parser("score", help="Print window scores for WAV files")
+    score_parser.add_argument("files", nargs="+")
+    score_parser.add_argument("--model", default="distress_model.json")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        model = train(args.positive, args.negative)
+        with open(args.output, "w") as f:
+            json.dump(model, f, indent=2)
+        print(f"📄 Model saved: {args.output}")
+    else:
+        classifier = DistressClassifier.load(args.model)
+        for path in args.files:
+            scores = [classifier.score(stats) for stats in file_windows(path)]
+            print(f"{path}: max {max(scores, default=0):.3f} mean {np.mean(scores) if scores else 0:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import geocoder
+
+UNKNOWN_LOCATION = {"latitude": "Unknown", "longitude": "Unknown", "location": "Unknown, Unknown"}
+
+
+def lookup_location():
+    """IP based location lookup (network round trip)."""
+    g = geocoder.ip('me')
+    lat, lng = g.latlng if g.latlng else ("Unknown", "Unknown")
+    city = g.city or "Unknown"
+    country = g.country or "Unknown"
+    return {"latitude": lat, "longitude": lng, "location": f"{city}, {country}"}
+
+
+class LocationCache:
+    """
+    Keeps the last known location and refreshes it on a background thread
+    once it is older than `ttl` seconds, so callers never wait on the network.
+    """
+
+    def __init__(self, ttl=300, lookup=lookup_location):
+        self.ttl = ttl
+        self.lookup = lookup
+        self.value = None
+        self.updated = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.ready = threading.Event()
+
+    def refresh(self):
+        """Start a background lookup unless one is already running"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            value = self.lookup()
+            with self.lock:
+                self.value = value
+                self.updated = time.monotonic()
+        except Exception as e:
+            print(f"⚠️ Location error: {e}")
+        finally:
+            with self.lock:
+                self.refreshing = False
+            self.ready.set()
+
+    def get(self, wait=0.0):
+        """
+        Cached location, refreshed in the background when stale. `wait` bounds
+        how long to block when nothing has been looked up yet.
+        """
+        if self.updated is None or time.monotonic() - self.updated > self.ttl:
+            self.refresh()
+        if self.value is None and wait > 0:
+            self.ready.wait(wait)
+        with self.lock:
+            return dict(self.value) if self.value else dict(UNKNOWN_LOCATION)
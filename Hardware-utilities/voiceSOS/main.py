@@ -1,11 +1,26 @@
 import os
+import queue
+import socket
 import tkinter as tk
 import pyaudio
-import wave
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
-import geocoder
+from audio_writer import PreRollBuffer, StreamingAudioWriter, recover_partial_recordings
+from distress_detector import DistressClassifier, DistressDetector
+from location import LocationCache
+from uploader import SosUploader
+
+PRE_ROLL_SECONDS = 3  # Audio kept from before the button press
+AUDIO_CODEC = "mp3"  # "mp3" (lameenc) or "wav"
+LOCATION_TTL_SECONDS = 300  # Re-resolve the IP location at most every 5 minutes
+LOCATION_WAIT_SECONDS = 5  # Longest a save waits for the very first location lookup
+SOS_SERVER_URL = "http://localhost:5000"  # Backend receiving recordings (None disables uploads)
+DEVICE_ID = socket.gethostname()
+DISTRESS_DETECTION_ENABLED = True  # Start recording automatically on screams
+DISTRESS_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "distress_model.json")
 
 class AudioRecorderApp:
     def __init__(self, root):
@@ -17,7 +32,6 @@ class AudioRecorderApp:
         os.makedirs(self.output_dir, exist_ok=True)
 
         self.is_recording = False
-        self.frames = []
         self.audio = pyaudio.PyAudio()
         self.stream = None
         self.sample_rate = 44100
@@ -25,8 +39,49 @@ class AudioRecorderApp:
         self.channels = 1
         self.format = pyaudio.paInt16
 
+        # Memory stays constant: chunks go to the pre-roll ring or straight to disk
+        self.pre_roll = PreRollBuffer(PRE_ROLL_SECONDS, self.sample_rate, self.chunk_size)
+        self.writer = None
+        self.writer_started = None
+        self.trigger = None  # "button" or "auto" for the active recording
+        self.auto_recording = False
+        self.overflows = 0
+
+        self.distress_detector = None
+        if DISTRESS_DETECTION_ENABLED:
+            # Falls back to the built-in weights when no trained model file exists
+            self.distress_detector = DistressDetector(
+                self.sample_rate, self.chunk_size, classifier=DistressClassifier.load(DISTRESS_MODEL_PATH))
+
+        # The PyAudio callback only enqueues; the writer thread owns all file I/O
+        self.audio_queue = queue.SimpleQueue()
+        self.save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sos-save")
+        self.location_cache = LocationCache(ttl=LOCATION_TTL_SECONDS)
+        self.location_cache.refresh()
+
+        for path in recover_partial_recordings(self.output_dir):
+            self.save_executor.submit(self.save_metadata, path, recovered=True)
+            print(f"♻️ Recovered interrupted recording: {path}")
+
+        self.uploader = None
+        if SOS_SERVER_URL:
+            self.uploader = SosUploader(self.output_dir, SOS_SERVER_URL, DEVICE_ID)
+            self.uploader.start()
+
         self.setup_gui()
 
+        self.capturing = True
+        self.record_thread = threading.Thread(target=self.process_audio, daemon=True)
+        self.record_thread.start()
+        self.stream = self.audio.open(
+            format=self.format,
+            channels=self.channels,
+            rate=self.sample_rate,
+            input=True,
+            frames_per_buffer=self.chunk_size,
+            stream_callback=self.audio_callback
+        )
+
     def setup_gui(self):
         main_frame = tk.Frame(self.root, padx=20, pady=20)
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -47,93 +102,175 @@ class AudioRecorderApp:
         self.status_label.pack(pady=10)
 
     def start_recording(self, event=None):
-        if not self.is_recording:
+        if not self.is_recording or self.auto_recording:
+            # Pressing during an automatic recording takes it over until release
+            self.auto_recording = False
             self.is_recording = True
-            self.frames = []
+            # Refresh a stale location in the background while the call is recorded
+            self.location_cache.get()
+            self.audio_queue.put(("start", datetime.now()))
             self.record_button.config(text="Recording...", bg="darkred")
             self.status_label.config(text="Recording in progress...")
 
-            self.record_thread = threading.Thread(target=self.record_audio, daemon=True)
-            self.record_thread.start()
-
     def stop_recording(self, event=None):
         if self.is_recording:
             self.is_recording = False
+            self.audio_queue.put(("stop", None))
             self.record_button.config(text="Press & Hold SOS", bg="red")
+            self.status_label.config(text="Saving...")
 
-            if hasattr(self, 'record_thread') and self.record_thread.is_alive():
-                self.record_thread.join()
+    def audio_callback(self, in_data, frame_count, time_info, status):
+        """Runs on PortAudio's thread: hand the chunk off and return immediately"""
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.audio_queue.put(in_data)
+        return (None, pyaudio.paContinue)
 
-            if self.frames:
-                self.save_audio()
-                self.status_label.config(text="Audio saved successfully")
-            else:
-                self.status_label.config(text="Recording too short, not saved")
+    def process_audio(self):
+        """Drain captured chunks into the pre-roll ring or the active recording"""
+        while self.capturing:
+            try:
+                item = self.audio_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
 
-    def record_audio(self):
-        self.stream = self.audio.open(
-            format=self.format,
-            channels=self.channels,
-            rate=self.sample_rate,
-            input=True,
-            frames_per_buffer=self.chunk_size
-        )
+            if isinstance(item, tuple):
+                command, started = item
+                if command == "start":
+                    if self.writer is None:
+                        self.open_writer(started)
+                    self.trigger = "button"
+                elif self.writer is not None:
+                    self.close_writer()
+                continue
 
-        while self.is_recording:
-            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
-            self.frames.append(data)
+            if self.writer is not None:
+                self.writer.write(item)
+            else:
+                self.pre_roll.append(item)
 
-        self.stream.stop_stream()
-        self.stream.close()
-        self.stream = None
+            if self.distress_detector is not None:
+                self.handle_distress(self.distress_detector.push(item))
 
-    def save_audio(self):
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"SOS_{timestamp}"
-        audio_filename = os.path.join(self.output_dir, f"{base_filename}.mp3")
-        json_filename = os.path.join(self.output_dir, f"{base_filename}.json")
+    def handle_distress(self, event):
+        """Start or end an automatic recording from the distress detector's decision"""
+        if event == "start" and self.writer is None:
+            print(f"🚨 Distress detected (score {self.distress_detector.last_score:.2f}), recording")
+            self.open_writer(datetime.now())
+            self.trigger = "auto"
+            self.root.after(0, self.show_auto_recording, True)
+        elif event == "stop" and self.writer is not None and self.trigger == "auto":
+            self.close_writer()
+            self.root.after(0, self.show_auto_recording, False)
 
-        with wave.open(audio_filename, 'wb') as wf:
-            wf.setnchannels(self.channels)
-            wf.setsampwidth(self.audio.get_sample_size(self.format))
-            wf.setframerate(self.sample_rate)
-            wf.writeframes(b''.join(self.frames))
+    def show_auto_recording(self, active):
+        if active and not self.is_recording:
+            self.auto_recording = self.is_recording = True
+            self.record_button.config(text="Auto recording...", bg="darkred")
+            self.status_label.config(text="Distress detected, recording...")
+        elif not active and self.auto_recording:
+            self.auto_recording = self.is_recording = False
+            self.record_button.config(text="Press & Hold SOS", bg="red")
+            self.status_label.config(text="Saving...")
 
-        metadata = self.get_metadata()
-        metadata["file"] = audio_filename
-        with open(json_filename, "w") as jf:
-            json.dump(metadata, jf, indent=4)
+    def close_writer(self):
+        writer, self.writer = self.writer, None
+        extra = {"trigger": self.trigger}
+        if self.distress_detector is not None:
+            extra["distress_score"] = round(self.distress_detector.peak_score if self.trigger == "auto"
+                                            else self.distress_detector.last_score, 3)
+        self.save_executor.submit(self.save_audio, writer, self.writer_started, extra)
 
-        print(f"🎙️ Audio saved: {audio_filename}")
-        print(f"📄 Metadata saved: {json_filename}")
+    def unique_base_path(self, started):
+        """SOS_<date>_<time>_<ms>, with a counter if that name is already on disk"""
+        base_filename = f"SOS_{started.strftime('%Y%m%d_%H%M%S_%f')[:-3]}"
+        taken = {name.split('.', 1)[0] for name in os.listdir(self.output_dir)}
+        candidate, counter = base_filename, 1
+        while candidate in taken:
+            candidate = f"{base_filename}_{counter}"
+            counter += 1
+        return os.path.join(self.output_dir, candidate)
 
-    def get_metadata(self):
-        """Collect metadata including GPS coordinates and location."""
-        current_time = datetime.now()
+    def open_writer(self, started):
+        self.writer = StreamingAudioWriter(
+            self.unique_base_path(started),
+            self.channels,
+            self.audio.get_sample_size(self.format),
+            self.sample_rate,
+            codec=AUDIO_CODEC
+        )
+        self.writer_started = started
+        # Start the file with the seconds captured before the press
+        for chunk in self.pre_roll.drain():
+            self.writer.write(chunk)
+
+    def save_audio(self, writer, started, extra=None):
+        """Runs on the save worker so the GUI never waits on disk or network"""
+        if writer.data_size == 0:
+            writer.discard()
+            self.set_status("Recording too short, not saved")
+            return
 
         try:
-            g = geocoder.ip('me')
-            lat, lng = g.latlng if g.latlng else ("Unknown", "Unknown")
-            city = g.city or "Unknown"
-            country = g.country or "Unknown"
+            audio_filename = writer.close()
+            json_filename = self.save_metadata(audio_filename, duration=writer.duration,
+                                               started=started, extra=extra)
+            print(f"🎙️ Audio saved: {audio_filename}")
+            print(f"📄 Metadata saved: {json_filename}")
+            if self.overflows:
+                print(f"⚠️ {self.overflows} input overflows so far")
+            self.set_status("Audio saved successfully")
+            if self.uploader is not None:
+                self.uploader.notify()
         except Exception as e:
-            print(f"⚠️ Location error: {e}")
-            lat, lng, city, country = ("Unknown", "Unknown", "Unknown", "Unknown")
+            print(f"❌ Failed to save recording: {e}")
+            self.set_status("Failed to save recording")
+
+    def set_status(self, text):
+        # Tk widgets may only be touched from the main thread
+        self.root.after(0, lambda: self.status_label.config(text=text))
+
+    def save_metadata(self, audio_filename, duration=None, started=None, recovered=False, extra=None):
+        json_filename = os.path.splitext(audio_filename)[0] + ".json"
+        metadata = self.get_metadata(started)
+        metadata["file"] = audio_filename
+        metadata.update(extra or {})
+        if duration is not None:
+            metadata["duration_seconds"] = round(duration, 2)
+        if recovered:
+            metadata["recovered"] = True
+
+        # Write then rename so a crash never leaves a truncated sidecar
+        with open(json_filename + ".tmp", "w") as jf:
+            json.dump(metadata, jf, indent=4)
+        os.replace(json_filename + ".tmp", json_filename)
+        return json_filename
+
+    def get_metadata(self, current_time=None):
+        """Collect metadata including GPS coordinates and location."""
+        current_time = current_time or datetime.now()
+        location = self.location_cache.get(wait=LOCATION_WAIT_SECONDS)
 
         return {
             "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
             "date": current_time.strftime("%Y-%m-%d"),
             "time": current_time.strftime("%H:%M:%S"),
-            "latitude": lat,
-            "longitude": lng,
-            "location": f"{city}, {country}"
+            **location
         }
 
     def on_closing(self):
         if self.is_recording:
             self.stop_recording()
-        if self.stream:
-            self.stream.close()
+        self.stream.stop_stream()
+        self.stream.close()
+        # Let the writer thread drain the queue and hand off the last recording
+        while not self.audio_queue.empty():
+            time.sleep(0.05)
+        self.capturing = False
+        self.record_thread.join(timeout=1)
+        self.save_executor.shutdown(wait=True)
+        if self.uploader is not None:
+            self.uploader.stop()
         self.audio.terminate()
         self.root.destroy()
 
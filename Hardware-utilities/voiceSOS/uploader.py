@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+MANIFEST_NAME = "uploaded.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(256 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RetryLater(Exception):
+    def __init__(self, delay=None):
+        super().__init__("Server asked to retry later")
+        self.delay = delay
+
+
+class SosUploader:
+    """
+    Background uploader for saved distress calls.
+
+    Each cycle takes a batch of recordings that are not in the local
+    manifest, asks the server in one request which hashes it already has,
+    and sends the rest as resumable chunked uploads. Network failures back
+    off exponentially with full jitter (so many devices coming back online
+    do not retry in lockstep) and honour the server's Retry-After.
+    """
+
+    def __init__(self, output_dir, server_url, device_id, batch_size=5, chunk_size=512 * 1024,
+                 poll_interval=30, max_backoff=300, timeout=30):
+        self.output_dir = output_dir
+        self.server_url = server_url.rstrip("/")
+        self.device_id = device_id
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self.hash_cache = {}  # path -> (mtime_ns, size, sha256)
+        self.session = requests.Session()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self.failures = 0
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="sos-uploader", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def notify(self):
+        """Upload soon, e.g. right after a new recording was saved"""
+        self.wake.set()
+
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        cached = self.hash_cache.get(path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        sha256 = file_sha256(path)
+        self.hash_cache[path] = (stat.st_mtime_ns, stat.st_size, sha256)
+        return sha256
+
+    def pending_files(self):
+        """Completed recordings (audio plus sidecar) whose hash is not in the manifest"""
+        uploaded = set(self.manifest)
+        pending = []
+        for name in sorted(os.listdir(self.output_dir)):
+            if not name.endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.join(self.output_dir, name)
+            if not os.path.exists(os.path.splitext(path)[0] + ".json"):
+                continue  # Still being saved
+            sha256 = self._file_hash(path)
+            if sha256 not in uploaded:
+                pending.append((path, sha256))
+        return pending
+
+    def _run(self):
+        while self.running:
+            try:
+                more = self.upload_batch()
+                self.failures = 0
+                delay = 0 if more else self.poll_interval
+            except RetryLater as e:
+                self.failures += 1
+                delay = e.delay if e.delay is not None else self._backoff()
+                print(f"⏳ SOS upload deferred, retrying in {delay:.0f}s")
+            except requests.RequestException as e:
+                self.failures += 1
+                delay = self._backoff()
+                print(f"⚠️ SOS upload failed ({e}), retrying in {delay:.0f}s")
+            except Exception as e:
+                self.failures += 1
+                delay = self._backoff()
+                print(f"❌ SOS uploader error: {e}")
+
+            if delay:
+                self.wake.wait(delay)
+                self.wake.clear()
+
+    def _backoff(self):
+        # Full jitter: uniform in [1, min(cap, 2^failures)] seconds
+        return random.uniform(1, min(self.max_backoff, 2 ** min(self.failures, 16)))
+
+    def _check(self, response):
+        if response.status_code in (429, 503):
+            retry_after = response.headers.get("Retry-After")
+            raise RetryLater(float(retry_after) + random.uniform(0, 2) if retry_after else None)
+        return response
+
+    def upload_batch(self):
+        """Upload one batch; returns True when more files are waiting"""
+        pending = self.pending_files()
+        if not pending:
+            return False
+        batch = pending[:self.batch_size]
+
+        response = self._check(self.session.post(f"{self.server_url}/sos/audio/check",
+                                                 json={"hashes": [sha256 for _, sha256 in batch]},
+                                                 timeout=self.timeout))
+        response.raise_for_status()
+        known = set(response.json().get("known", []))
+
+        for path, sha256 in batch:
+            entry = {"file": os.path.basename(path), "uploaded": time.time()}
+            if sha256 not in known:
+                try:
+                    self.upload_file(path, sha256)
+                except requests.HTTPError as e:
+                    if e.response is None or e.response.status_code >= 500:
+                        raise
+                    # The server will never accept this file; do not retry it forever
+                    print(f"❌ SOS upload rejected for {os.path.basename(path)}: {e.response.text[:200]}")
+                    entry["rejected"] = e.response.status_code
+            self.manifest[sha256] = entry
+            self._save_manifest()
+        return len(pending) > len(batch)
+
+    def upload_file(self, path, sha256):
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            metadata = json.load(f)
+        size = os.path.getsize(path)
+
+        response = self._check(self.session.post(f"{self.server_url}/sos/audio/uploads", json={
+            "device_id": self.device_id,
+            "filename": os.path.basename(path),
+            "size": size,
+            "sha256": sha256,
+            "metadata": metadata
+        }, timeout=self.timeout))
+        response.raise_for_status()
+        upload = response.json()
+        if upload.get("complete"):
+            return
+
+        upload_url = f"{self.server_url}/sos/audio/uploads/{upload['upload_id']}"
+        offset = upload["offset"]
+        with open(path, "rb") as f:
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                response = self._check(self.session.patch(
+                    upload_url, data=chunk, headers={"Upload-Offset": str(offset)}, timeout=self.timeout))
+                if response.status_code in (409, 422):
+                    # Server has a different offset (lost response or corrupt data): resume from there
+                    offset = response.json().get("offset", 0)
+                    continue
+                response.raise_for_status()
+                result = response.json()
+                if result.get("complete"):
+                    print(f"📤 Uploaded {os.path.basename(path)}")
+                    return
+                offset = result["offset"]
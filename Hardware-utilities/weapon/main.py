@@ -1,34 +1,302 @@
+"""
+Standalone weapon detector for edge devices.
+
+A capture thread keeps only the newest camera frame, so a slow model never
+builds up camera lag. Inference runs on its own thread at a reduced input
+size on every k-th captured frame, and the display loop redraws the last
+boxes on every frame in between. Alerts are forwarded to the backend in the
+background.
+
+    python main.py                          # window, 416px inference on every 3rd frame
+    python main.py --headless --server http://192.168.1.10:5000 --source-id gate
+    python main.py --source rtsp://... --imgsz 320 --every 4
+"""
+
+import argparse
+import queue
+import threading
+import time
+
 import cv2
+import requests
 from ultralytics import YOLO
 
-model = YOLO("best.pt")
+WINDOW_NAME = "Gun and Knife Detection - Press 'q' to Quit"
+CLASS_RENAMES = {"pistol": "gun"}
+BOX_COLOR = (0, 0, 255)
+
+
+class LatestFrameReader:
+    """Reads the camera on a background thread and keeps only the newest frame"""
+
+    def __init__(self, source, width, height):
+        self.cap = cv2.VideoCapture(source)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        # Ask the driver for the smallest queue it supports; ignored by some backends
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = 0.0
+        self.seq = 0
+        self.running = self.cap.isOpened()
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Failed to grab frame")
+                break
+            with self.condition:
+                self.frame = frame
+                self.frame_time = time.perf_counter()
+                self.seq += 1
+                self.condition.notify_all()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def wait_newer(self, seq, timeout=1.0):
+        """Newest (seq, frame, capture_time) once seq has advanced past `seq`"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > seq or not self.running, timeout)
+            return self.seq, self.frame, self.frame_time
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+        self.cap.release()
+
+
+class EdgeDetector:
+    """
+    Runs YOLO on every `every`-th captured frame at `imgsz` and publishes the
+    latest boxes; frames captured while a prediction is running are skipped.
+    """
+
+    def __init__(self, model, reader, imgsz, every, conf, on_result=None):
+        self.model = model
+        self.reader = reader
+        self.imgsz = imgsz
+        self.every = max(1, every)
+        self.conf = conf
+        self.on_result = on_result
+        # Class names are fixed for a model, so map them once instead of per frame
+        self.names = {i: CLASS_RENAMES.get(name.lower(), name) for i, name in model.names.items()}
+        self.lock = threading.Lock()
+        self.detections = []
+        self.inference_ms = 0.0
+        self.latency_ms = 0.0
+        self.inferences = 0
+        self.running = False
+        self.thread = threading.Thread(target=self._run, name="inference", daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def _run(self):
+        last_seq = 0
+        while self.running and self.reader.running:
+            seq, frame, frame_time = self.reader.wait_newer(last_seq + self.every - 1)
+            if frame is None or seq == last_seq:
+                continue
+            last_seq = seq
+
+            started = time.perf_counter()
+            result = self.model(frame, imgsz=self.imgsz, conf=self.conf, verbose=False)[0]
+            finished = time.perf_counter()
+
+            detections = []
+            boxes = result.boxes
+            if len(boxes.cls):
+                for cls, score, box in zip(boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy(),
+                                           boxes.xyxy.cpu().numpy()):
+                    detections.append({
+                        "class": self.names.get(int(cls), str(int(cls))),
+                        "confidence": round(float(score), 3),
+                        "bbox": [int(v) for v in box]
+                    })
+
+            with self.lock:
+                self.detections = detections
+                self.inference_ms = (finished - started) * 1000
+                # Camera-to-result latency, including time the frame waited for the model
+                self.latency_ms = (finished - frame_time) * 1000
+                self.inferences += 1
+            if self.on_result:
+                self.on_result(detections, time.time())
+
+    def latest(self):
+        with self.lock:
+            return list(self.detections), self.inference_ms, self.latency_ms
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+
+
+class AlertForwarder:
+    """
+    Raises an alert once a weapon stays in view for `alert_seconds` and posts
+    it to the backend from a background thread so the detector never blocks
+    on the network.
+    """
+
+    def __init__(self, server_url, source_id, alert_seconds=1.0, reset_seconds=3.0, timeout=5):
+        self.url = f"{server_url.rstrip('/')}/alerts/edge" if server_url else None
+        self.source_id = source_id
+        self.alert_seconds = alert_seconds
+        self.reset_seconds = reset_seconds
+        self.timeout = timeout
+        self.first_seen = None
+        self.last_seen = None
+        self.alerted = False
+        self.pending = queue.Queue(maxsize=100)
+        self.session = requests.Session()
+        self.thread = threading.Thread(target=self._run, name="alerts", daemon=True)
+        self.thread.start()
+
+    def update(self, detections, timestamp):
+        if detections:
+            if self.first_seen is None:
+                self.first_seen = timestamp
+                self.alerted = False
+            self.last_seen = timestamp
+            duration = timestamp - self.first_seen
+            if duration >= self.alert_seconds and not self.alerted:
+                self.alerted = True
+                self._raise(detections, duration, timestamp)
+        elif self.last_seen is not None and timestamp - self.last_seen > self.reset_seconds:
+            self.first_seen = self.last_seen = None
+            self.alerted = False
+
+    def _raise(self, detections, duration, timestamp):
+        classes = sorted({d["class"] for d in detections})
+        print(f"ALERT: {', '.join(classes)} in view for {duration:.1f}s")
+        if not self.url:
+            return
+        try:
+            self.pending.put_nowait({
+                "source_id": self.source_id,
+                "timestamp": timestamp,
+                "duration_seconds": round(duration, 2),
+                "detections": detections
+            })
+        except queue.Full:
+            print("Alert queue full, dropping alert")
+
+    def _run(self):
+        while True:
+            alert = self.pending.get()
+            if alert is None:
+                return
+            for attempt in range(3):
+                try:
+                    response = self.session.post(self.url, json=alert, timeout=self.timeout)
+                    response.raise_for_status()
+                    break
+                except requests.RequestException as e:
+                    print(f"Alert forward failed ({e})")
+                    time.sleep(2 ** attempt)
+
+    def stop(self):
+        self.pending.put(None)
+        self.thread.join(timeout=self.timeout)
+
+
+def draw(frame, detections, display_fps, inference_ms, latency_ms):
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        cv2.putText(frame, f"{det['class']} {det['confidence']:.2f}", (x1, max(y1 - 8, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, BOX_COLOR, 2)
+    cv2.putText(frame, f"display {display_fps:4.1f} fps | inference {inference_ms:4.0f} ms | "
+                       f"latency {latency_ms:4.0f} ms", (10, 24),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    return frame
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Edge weapon detector")
+    parser.add_argument("--model", default="best.pt")
+    parser.add_argument("--source", default="0", help="Camera index, stream URL or video file")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--imgsz", type=int, default=416, help="Inference input size (model default is 640)")
+    parser.add_argument("--every", type=int, default=3, help="Run inference on every k-th captured frame")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--headless", action="store_true", help="No window; print stats instead")
+    parser.add_argument("--server", help="Backend URL to forward alerts to, e.g. http://localhost:5000")
+    parser.add_argument("--source-id", default="edge-camera")
+    parser.add_argument("--alert-seconds", type=float, default=1.0, help="Weapon must stay in view this long")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="Headless stats print interval")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    source = int(args.source) if args.source.isdigit() else args.source
 
-cap = cv2.VideoCapture(0)
+    model = YOLO(args.model)
+    reader = LatestFrameReader(source, args.width, args.height)
+    if not reader.running:
+        print(f"Could not open video source {args.source}")
+        return
+    reader.start()
 
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    forwarder = AlertForwarder(args.server, args.source_id, alert_seconds=args.alert_seconds)
+    detector = EdgeDetector(model, reader, args.imgsz, args.every, args.conf, on_result=forwarder.update).start()
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Failed to grab frame")
-        break
+    shown, last_seq = 0, 0
+    window_start = time.perf_counter()
+    display_fps = 0.0
+    try:
+        while reader.running:
+            if args.headless:
+                time.sleep(args.stats_interval)
+                now = time.perf_counter()
+                _, inference_ms, latency_ms = detector.latest()
+                captured, last_seq = reader.seq - last_seq, reader.seq
+                inferred, shown = detector.inferences - shown, detector.inferences
+                print(f"capture {captured / (now - window_start):4.1f} fps | "
+                      f"inference {inferred / (now - window_start):4.1f}/s, {inference_ms:.0f} ms | "
+                      f"latency {latency_ms:.0f} ms")
+                window_start = now
+                continue
 
-    results = model(frame)
+            seq, frame, _ = reader.wait_newer(last_seq)
+            if frame is None or seq == last_seq:
+                continue
+            last_seq = seq
 
-    for r in results:
-        for i in range(len(r.boxes.cls)):
-            class_id = int(r.boxes.cls[i])
-            if r.names[class_id].lower() == "pistol":
-                r.names[class_id] = "gun"
+            shown += 1
+            now = time.perf_counter()
+            if now - window_start >= 1.0:
+                display_fps = shown / (now - window_start)
+                shown, window_start = 0, now
 
-        annotated_frame = r.plot()
+            detections, inference_ms, latency_ms = detector.latest()
+            cv2.imshow(WINDOW_NAME, draw(frame.copy(), detections, display_fps, inference_ms, latency_ms))
 
-    cv2.imshow("Gun and Knife Detection - Press 'q' to Quit", annotated_frame)
+            # Exit on 'q'
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        detector.stop()
+        reader.stop()
+        forwarder.stop()
+        if not args.headless:
+            cv2.destroyAllWindows()
 
-    # Exit on 'q'
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
 
-cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+Durable alert outbox with asynchronous fan-out to notification targets.
+
+Detection threads only call `enqueue`, which stores the alert and one
+delivery row per matching target in SQLite and returns. A dispatcher thread
+hands due deliveries to a worker pool, limited per target, and failed
+deliveries are retried with jittered exponential backoff. Deliveries are
+claimed in one write transaction that records the owning dispatcher, which
+keeps a heartbeat in the database; only deliveries whose owner stopped
+heartbeating (a crash or restart) are re-queued, so other processes that
+open the same file never resend live deliveries. Nothing is dispatched
+until the serving process calls `start`.
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class DeliveryTarget:
+    """
+    A destination for alerts. `kinds` limits which alert kinds it receives
+    (None means all); `max_concurrency` bounds deliveries in flight.
+    """
+
+    def __init__(self, name, kinds=None, max_concurrency=2, max_attempts=8):
+        self.name = name
+        self.kinds = set(kinds) if kinds else None
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+
+    def accepts(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+    def deliver(self, alert_id, kind, payload):
+        raise NotImplementedError
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'type': 'custom',
+            'kinds': sorted(self.kinds) if self.kinds else None,
+            'max_concurrency': self.max_concurrency,
+            'max_attempts': self.max_attempts
+        }
+
+
+class SocketIOTarget(DeliveryTarget):
+    """Dashboard clients; the alert kind is used as the event name"""
+
+    def __init__(self, name, emit, **kwargs):
+        kwargs.setdefault('max_concurrency', 1)
+        kwargs.setdefault('max_attempts', 3)
+        super().__init__(name, **kwargs)
+        self.emit = emit
+
+    def deliver(self, alert_id, kind, payload):
+        self.emit(kind, payload)
+
+    def describe(self):
+        return {**super().describe(), 'type': 'socketio'}
+
+
+class WebhookTarget(DeliveryTarget):
+    """POSTs {"kind", "alert_id", "alert"} as JSON; 2xx is success, 4xx (except 408/429) is permanent"""
+
+    def __init__(self, name, url, headers=None, timeout=10, **kwargs):
+        super().__init__(name, **kwargs)
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def deliver(self, alert_id, kind, payload):
+        try:
+            response = self.session.post(self.url, json={'kind': kind, 'alert_id': alert_id, 'alert': payload},
+                                         headers=self.headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(str(e))
+
+        if response.status_code < 300:
+            return
+        retry_after = response.headers.get('Retry-After')
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        retryable = response.status_code >= 500 or response.status_code in (408, 429)
+        raise DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}", retryable, retry_after)
+
+    def describe(self):
+        return {**super().describe(), 'type': 'webhook', 'url': self.url, 'timeout': self.timeout}
+
+
+def target_from_config(config):
+    """Build a target from a JSON config entry ({"type": "webhook", "name", "url", ...})"""
+    if config.get('type', 'webhook') != 'webhook':
+        raise ValueError(f"Unsupported target type: {config.get('type')}")
+    if not config.get('name') or not config.get('url'):
+        raise ValueError("Webhook targets need a name and a url")
+    if not str(config['url']).startswith(('http://', 'https://')):
+        raise ValueError("Webhook url must be http(s)")
+    return WebhookTarget(
+        str(config['name']),
+        config['url'],
+        headers=config.get('headers'),
+        timeout=float(config.get('timeout', 10)),
+        kinds=config.get('kinds'),
+        max_concurrency=max(1, int(config.get('max_concurrency', 2))),
+        max_attempts=max(1, int(config.get('max_attempts', 8)))
+    )
+
+
+class AlertOutbox:
+    def __init__(self, db_path, workers=4, base_backoff=2.0, max_backoff=300.0, poll_interval=1.0,
+                 retention_seconds=7 * 24 * 3600, owner_timeout=30.0):
+        self.db_path = db_path
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.owner_timeout = owner_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.targets = {}
+        self.targets_lock = threading.Lock()
+        self.in_flight = {}  # target name -> running deliveries
+        self.local = threading.local()
+        self.wake = threading.Event()
+        self.running = False
+
+        self.metrics_lock = threading.Lock()
+        self.metrics = {}  # target name -> counters and recent latencies
+
+        self._init_db()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='alert-delivery')
+        self.dispatcher = None
+
+    def start(self):
+        """Recover orphaned deliveries and start dispatching; only the serving process calls this"""
+        if self.dispatcher is not None:
+            return
+        self.running = True
+        self._heartbeat()
+        self._recover()
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name='alert-outbox', daemon=True)
+        self.dispatcher.start()
+
+    # Database
+    def _db(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        db = self._db()
+        db.executescript('''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                alert_id TEXT NOT NULL,
+                target TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                owner TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt);
+            CREATE TABLE IF NOT EXISTS owners (
+                id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+        ''')
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(deliveries)')}
+        if 'owner' not in columns:
+            db.execute('ALTER TABLE deliveries ADD COLUMN owner TEXT')
+
+    def _heartbeat(self):
+        self._db().execute("INSERT INTO owners (id, heartbeat) VALUES (?, ?) "
+                           "ON CONFLICT(id) DO UPDATE SET heartbeat = excluded.heartbeat", (self.owner, time.time()))
+
+    def _recover(self):
+        """Re-queue deliveries claimed by dispatchers that stopped heartbeating"""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute("DELETE FROM owners WHERE heartbeat < ?", (time.time() - self.owner_timeout,))
+            recovered = db.execute(
+                "UPDATE deliveries SET status = 'pending', owner = NULL WHERE status = 'inflight' "
+                "AND (owner IS NULL OR owner NOT IN (SELECT id FROM owners))").rowcount
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        if recovered:
+            logger.info(f"Alert outbox: re-queued {recovered} interrupted deliveries")
+
+    # Targets
+    def add_target(self, target):
+        with self.targets_lock:
+            self.targets[target.name] = target
+            self.in_flight.setdefault(target.name, 0)
+        self.wake.set()
+
+    def remove_target(self, name):
+        with self.targets_lock:
+            removed = self.targets.pop(name, None)
+        if removed is not None:
+            self._db().execute(
+                "UPDATE deliveries SET status = 'failed', last_error = 'target removed', updated = ? "
+                "WHERE target = ? AND status = 'pending'", (time.time(), name))
+        return removed is not None
+
+    def list_targets(self):
+        with self.targets_lock:
+            return [target.describe() for target in self.targets.values()]
+
+    # Producer side
+    def enqueue(self, kind, payload):
+        """Persist an alert and its deliveries; never touches the network"""
+        alert_id = str(uuid.uuid4())
+        now = time.time()
+        with self.targets_lock:
+            names = [name for name, target in self.targets.items() if target.accepts(kind)]
+
+        db = self._db()
+        db.execute('BEGIN')
+        try:
+            db.execute('INSERT INTO alerts (id, kind, payload, created) VALUES (?, ?, ?, ?)',
+                       (alert_id, kind, json.dumps(payload, default=str), now))
+            db.executemany('INSERT INTO deliveries (alert_id, target, next_attempt, created, updated) '
+                           'VALUES (?, ?, ?, ?, ?)', [(alert_id, name, now, now, now) for name in names])
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+        if names:
+            self.wake.set()
+        return alert_id
+
+    # Delivery side
+    def _dispatch_loop(self):
+        last_cleanup = 0.0
+        last_heartbeat = last_recovery = time.time()
+        while self.running:
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+            try:
+                now = time.time()
+                if now - last_heartbeat > self.owner_timeout / 3:
+                    last_heartbeat = now
+                    self._heartbeat()
+                if now - last_recovery > self.owner_timeout:
+                    last_recovery = now
+                    self._recover()
+                self._dispatch_due()
+                if time.time() - last_cleanup > 3600:
+                    last_cleanup = time.time()
+                    self.cleanup()
+            except Exception as e:
+                logger.error(f"Alert outbox dispatch error: {e}")
+                time.sleep(self.poll_interval)
+
+    def _dispatch_due(self):
+        with self.targets_lock:
+            free = {name: target.max_concurrency - self.in_flight.get(name, 0)
+                    for name, target in self.targets.items()}
+        free = {name: slots for name, slots in free.items() if slots > 0}
+        if not free:
+            return
+
+        db = self._db()
+        now = time.time()
+        for name, slots in free.items():
+            # Claim and read in one write transaction so no other dispatcher can take the same rows
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                ids = [row['id'] for row in db.execute(
+                    "UPDATE deliveries SET status = 'inflight', owner = ?, updated = ? WHERE id IN ("
+                    "SELECT id FROM deliveries WHERE status = 'pending' AND target = ? AND next_attempt <= ? "
+                    "ORDER BY next_attempt LIMIT ?) RETURNING id", (self.owner, now, name, now, slots)).fetchall()]
+                placeholders = ','.join('?' * len(ids))
+                rows = db.execute(
+                    "SELECT d.id, d.alert_id, d.target, d.attempts, d.created, a.kind, a.payload "
+                    f"FROM deliveries d JOIN alerts a ON a.id = d.alert_id WHERE d.id IN ({placeholders})",
+                    ids).fetchall() if ids else []
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            if not rows:
+                continue
+            with self.targets_lock:
+                self.in_flight[name] = self.in_flight.get(name, 0) + len(rows)
+            for row in rows:
+                self.executor.submit(self._deliver, dict(row))
+
+    def _deliver(self, row):
+        name = row['target']
+        with self.targets_lock:
+            target = self.targets.get(name)
+        started = time.time()
+        error = None
+        try:
+            if target is None:
+                raise DeliveryError("target removed", retryable=False)
+            target.deliver(row['alert_id'], row['kind'], json.loads(row['payload']))
+        except DeliveryError as e:
+            error = e
+        except Exception as e:
+            error = DeliveryError(str(e))
+        finally:
+            with self.targets_lock:
+                self.in_flight[name] = max(self.in_flight.get(name, 1) - 1, 0)
+
+        finished = time.time()
+        attempts = row['attempts'] + 1
+        db = self._db()
+        # Only while this dispatcher still owns the claim
+        if error is None:
+            updated = db.execute(
+                "UPDATE deliveries SET status = 'delivered', attempts = ?, last_error = NULL, updated = ?, "
+                "owner = NULL WHERE id = ? AND owner = ?", (attempts, finished, row['id'], self.owner)).rowcount
+            self._record(name, 'delivered', finished - started, finished - row['created'])
+        elif not error.retryable or (target is not None and attempts >= target.max_attempts):
+            updated = db.execute(
+                "UPDATE deliveries SET status = 'failed', attempts = ?, last_error = ?, updated = ?, owner = NULL "
+                "WHERE id = ? AND owner = ?", (attempts, str(error)[:500], finished, row['id'], self.owner)).rowcount
+            self._record(name, 'failed', finished - started)
+            logger.error(f"Alert delivery to {name} failed permanently after {attempts} attempts: {error}")
+        else:
+            delay = error.retry_after if error.retry_after is not None else self._backoff(attempts)
+            updated = db.execute(
+                "UPDATE deliveries SET status = 'pending', attempts = ?, last_error = ?, next_attempt = ?, "
+                "updated = ?, owner = NULL WHERE id = ? AND owner = ?",
+                (attempts, str(error)[:500], finished + delay, finished, row['id'], self.owner)).rowcount
+            self._record(name, 'retried', finished - started)
+            logger.warning(f"Alert delivery to {name} failed (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+        if not updated:
+            logger.warning(f"Alert delivery {row['id']} to {name} was re-queued by another dispatcher meanwhile")
+        # A slot for this target is free again
+        self.wake.set()
+
+    def _backoff(self, attempts):
+        # Full jitter so many failed deliveries do not retry in lockstep
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)))
+
+    # Metrics and administration
+    def _record(self, name, outcome, attempt_seconds, end_to_end_seconds=None):
+        with self.metrics_lock:
+            stats = self.metrics.setdefault(name, {
+                'delivered': 0, 'failed': 0, 'retried': 0,
+                'attempt_ms': deque(maxlen=500), 'end_to_end_ms': deque(maxlen=500)
+            })
+            stats[outcome] += 1
+            stats['attempt_ms'].append(attempt_seconds * 1000)
+            if end_to_end_seconds is not None:
+                stats['end_to_end_ms'].append(end_to_end_seconds * 1000)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {'p50': None, 'p95': None}
+        p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+        return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2)}
+
+    def get_metrics(self):
+        counts = {}
+        for row in self._db().execute('SELECT target, status, COUNT(*) AS n FROM deliveries GROUP BY target, status'):
+            counts.setdefault(row['target'], {})[row['status']] = row['n']
+
+        with self.targets_lock:
+            names = set(self.targets) | set(counts)
+            in_flight = dict(self.in_flight)
+        with self.metrics_lock:
+            metrics = {}
+            for name in sorted(names):
+                stats = self.metrics.get(name, {})
+                metrics[name] = {
+                    'queued': counts.get(name, {}).get('pending', 0),
+                    'in_flight': in_flight.get(name, 0),
+                    'stored': counts.get(name, {}),
+                    'delivered': stats.get('delivered', 0),
+                    'failed': stats.get('failed', 0),
+                    'retried': stats.get('retried', 0),
+                    'attempt_ms': self._percentiles(stats.get('attempt_ms', ())),
+                    'end_to_end_ms': self._percentiles(stats.get('end_to_end_ms', ()))
+                }
+        return {'targets': metrics}
+
+    def list_deliveries(self, status=None, limit=100):
+        query = ("SELECT d.id, d.alert_id, d.target, d.status, d.attempts, d.next_attempt, d.last_error, "
+                 "d.created, d.updated, a.kind FROM deliveries d JOIN alerts a ON a.id = d.alert_id")
+        params = []
+        if status:
+            query += " WHERE d.status = ?"
+            params.append(status)
+        query += " ORDER BY d.id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._db().execute(query, params)]
+
+    def retry(self, delivery_id):
+        """Re-queue a failed delivery immediately"""
+        updated = self._db().execute(
+            "UPDATE deliveries SET status = 'pending', attempts = 0, next_attempt = ?, updated = ? "
+            "WHERE id = ? AND status = 'failed'", (time.time(), time.time(), delivery_id)).rowcount
+        if updated:
+            self.wake.set()
+        return bool(updated)
+
+    def cleanup(self):
+        """Drop delivered rows and fully delivered alerts past the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        db = self._db()
+        db.execute("DELETE FROM deliveries WHERE status = 'delivered' AND updated < ?", (cutoff,))
+        db.execute("DELETE FROM alerts WHERE created < ? AND id NOT IN (SELECT alert_id FROM deliveries)", (cutoff,))
+
+    def shutdown(self, timeout=5.0):
+        """Stop dispatching and give running deliveries a moment to finish"""
+        self.running = False
+        self.wake.set()
+        if self.dispatcher is not None:
+            self.dispatcher.join(timeout=timeout)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.dispatcher is not None:
+            # Deliveries still marked in flight are re-queued by the next dispatcher that starts
+            self._db().execute("DELETE FROM owners WHERE id = ?", (self.owner,))
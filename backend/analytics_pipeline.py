@@ -0,0 +1,692 @@
+"""
+Fused multi-model analytics pipeline.
+
+Each video source is opened and decoded once. Decoded frames fan out to
+several model stages (weapon YOLO, sliding-window violence) that each run at
+their own rate and input size. A CPU budget scheduler sheds low-priority
+stage runs while the node is saturated, a QoS controller degrades
+low-priority sources when inference misses its deadline, and every stage
+reports into one alert stream that also correlates alerts from different
+stages.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from capture_backends import CaptureSource
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+# -------------------------------
+# Stages
+# -------------------------------
+class PipelineStage:
+    """
+    One model applied to a shared decoded stream.
+
+    `process(source_id, frame, timestamp, imgsz=None)` returns (result,
+    alerts) where result is a JSON-serializable summary and alerts a list of
+    dicts. `imgsz` is a reduced model input size requested by QoS; stages
+    with a fixed input ignore it. Lower `priority` values are more
+    important; `min_fps` is the rate a stage keeps even while the scheduler
+    is shedding load.
+    """
+
+    def __init__(self, name, target_fps, priority=0, min_fps=0.5, input_size=None, max_concurrency=1):
+        self.name = name
+        self.target_fps = target_fps
+        self.priority = priority
+        self.min_fps = min_fps
+        self.input_size = input_size
+        self.slots = threading.Semaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.errors = 0
+        self.deferred = 0
+        self.skipped_busy = 0
+        self.total_ms = 0.0
+        self.avg_ms = 0.0
+
+    def process(self, source_id, frame, timestamp, imgsz=None):
+        raise NotImplementedError
+
+    def reset(self, source_id):
+        pass
+
+    def record_run(self, elapsed_ms, failed=False):
+        with self.lock:
+            self.runs += 1
+            self.errors += int(failed)
+            self.total_ms += elapsed_ms
+            # EWMA tracks the current cost; mean_ms covers the whole run
+            self.avg_ms = elapsed_ms if self.runs == 1 else 0.8 * self.avg_ms + 0.2 * elapsed_ms
+
+    def stats(self):
+        with self.lock:
+            return {
+                'target_fps': self.target_fps,
+                'min_fps': self.min_fps,
+                'priority': self.priority,
+                'input_size': list(self.input_size) if self.input_size else None,
+                'runs': self.runs,
+                'errors': self.errors,
+                'deferred': self.deferred,
+                'skipped_busy': self.skipped_busy,
+                'avg_ms': round(self.avg_ms, 2),
+                'mean_ms': round(self.total_ms / self.runs, 2) if self.runs else 0.0
+            }
+
+
+class WeaponStage(PipelineStage):
+    """YOLO weapon detection; alerts once a weapon stays in view for `alert_threshold` seconds"""
+
+    def __init__(self, detector, target_fps=10, alert_threshold=5.0, reset_after=5.0, **kwargs):
+        kwargs.setdefault('priority', 0)
+        super().__init__('weapon', target_fps, **kwargs)
+        self.detector = detector
+        self.alert_threshold = alert_threshold
+        self.reset_after = reset_after
+        self.states = {}
+
+    def reset(self, source_id):
+        self.states.pop(source_id, None)
+
+    def process(self, source_id, frame, timestamp, imgsz=None):
+        result = self.detector.detect_weapons(frame, camera_id=source_id, imgsz=imgsz)
+        if not result.get('success'):
+            raise RuntimeError(result.get('error', 'Weapon detection failed'))
+
+        state = self.states.setdefault(source_id, {'first_seen': None, 'last_seen': None, 'alerted': False})
+        alerts = []
+        if result['count'] > 0:
+            if state['first_seen'] is None:
+                state['first_seen'] = timestamp
+                state['alerted'] = False
+            state['last_seen'] = timestamp
+            duration = timestamp - state['first_seen']
+            if duration >= self.alert_threshold and not state['alerted']:
+                state['alerted'] = True
+                alerts.append({
+                    'type': 'WEAPON_DETECTED',
+                    'severity': 'high',
+                    'duration_seconds': round(duration, 2),
+                    'detections': result['detections'],
+                    'detection_count': result['count']
+                })
+        elif state['last_seen'] is not None and timestamp - state['last_seen'] > self.reset_after:
+            state.update(first_seen=None, last_seen=None, alerted=False)
+
+        summary = {
+            'detected': result['count'] > 0,
+            'count': result['count'],
+            'detections': result['detections'],
+            'duration': timestamp - state['first_seen'] if state['first_seen'] is not None else 0
+        }
+        return summary, alerts
+
+
+class ViolenceStage(PipelineStage):
+    """Feeds a ViolenceDetector; the 16-frame window advances at this stage's rate"""
+
+    def __init__(self, violence_detector, target_fps=8, **kwargs):
+        kwargs.setdefault('priority', 1)
+        kwargs.setdefault('input_size', (64, 64))
+        super().__init__('violence', target_fps, **kwargs)
+        self.violence_detector = violence_detector
+
+    def reset(self, source_id):
+        self.violence_detector.reset(source_id)
+
+    def process(self, source_id, frame, timestamp, imgsz=None):
+        record = self.violence_detector.process_frame(source_id, frame, timestamp)
+        if record is None:
+            return None, []
+
+        alerts = []
+        if record['event'] == 'started':
+            alerts.append({
+                'type': 'VIOLENCE_DETECTED',
+                'severity': 'high',
+                'score': record['score'],
+                'peak_score': record['peak_score'],
+                'event_start': datetime.fromtimestamp(record['event_start']).isoformat()
+            })
+        return record, alerts
+
+
+# -------------------------------
+# CPU budget scheduler
+# -------------------------------
+class CpuBudgetScheduler:
+    """
+    Decides whether a due stage run may start.
+
+    Node CPU utilization is sampled every `sample_interval` seconds. While it
+    stays above `budget_percent` one more priority level is shed per sample
+    (lowest priority first); once it falls below `budget_percent - hysteresis`
+    levels are restored one at a time. The most important level always runs,
+    and shed stages still run at their `min_fps` so they never starve.
+    """
+
+    def __init__(self, budget_percent=85.0, hysteresis=10.0, sample_interval=0.5, cpu_percent_fn=None):
+        self.budget_percent = budget_percent
+        self.hysteresis = hysteresis
+        self.sample_interval = sample_interval
+        self.cpu_percent_fn = cpu_percent_fn or self._default_cpu_percent
+        self.priorities = []
+        self.shed_levels = 0
+        self.utilization = 0.0
+        self.last_sample = 0.0
+        self.lock = threading.Lock()
+        self._last_times = None
+        if psutil is not None:
+            psutil.cpu_percent(interval=None)  # Prime the counter
+
+    def _default_cpu_percent(self):
+        if psutil is not None:
+            return psutil.cpu_percent(interval=None)
+        # Fallback: this process's CPU time over wall time, across all cores
+        times = os.times()
+        now = (times.user + times.system, time.monotonic())
+        previous, self._last_times = self._last_times, now
+        if previous is None or now[1] <= previous[1]:
+            return 0.0
+        return 100.0 * (now[0] - previous[0]) / ((now[1] - previous[1]) * (os.cpu_count() or 1))
+
+    def register(self, stages):
+        self.priorities = sorted({stage.priority for stage in stages})
+
+    def _sample(self, now):
+        if now - self.last_sample < self.sample_interval:
+            return
+        self.last_sample = now
+        self.utilization = self.cpu_percent_fn()
+        if self.utilization > self.budget_percent:
+            if self.shed_levels < len(self.priorities) - 1:
+                self.shed_levels += 1
+                logger.info(f"Pipeline CPU at {self.utilization:.0f}%, shedding priority "
+                            f"{self.priorities[-self.shed_levels]} stages")
+        elif self.utilization < self.budget_percent - self.hysteresis and self.shed_levels:
+            logger.info(f"Pipeline CPU at {self.utilization:.0f}%, restoring priority "
+                        f"{self.priorities[-self.shed_levels]} stages")
+            self.shed_levels -= 1
+
+    def is_shed(self, stage):
+        if not self.shed_levels:
+            return False
+        return stage.priority in self.priorities[len(self.priorities) - self.shed_levels:]
+
+    def admit(self, stage, since_last_run):
+        with self.lock:
+            self._sample(time.monotonic())
+            if not self.is_shed(stage):
+                return True
+        # Shed stages still get their guaranteed minimum rate
+        return stage.min_fps > 0 and since_last_run >= 1.0 / stage.min_fps
+
+    def stats(self):
+        with self.lock:
+            return {
+                'budget_percent': self.budget_percent,
+                'cpu_percent': round(self.utilization, 1),
+                'saturated': self.shed_levels > 0,
+                'shed_priorities': self.priorities[len(self.priorities) - self.shed_levels:]
+                if self.shed_levels else []
+            }
+
+
+# -------------------------------
+# Per-source QoS
+# -------------------------------
+# Degradation ladder, applied cumulatively from the least important source up
+QOS_LEVELS = ('full', 'reduced_fps', 'reduced_input', 'no_annotation', 'min_fps')
+MIN_FPS_FLOOR = 0.05  # Lowest guaranteed rate a source can register with
+
+
+class QosController:
+    """
+    Admission control across sources by priority and guaranteed fps.
+
+    Each finished inference reports its lag, from frame decode to result.
+    Every `sample_interval` the p95 lag of that window is compared with
+    `deadline_ms`. While it is over the deadline, the least important source
+    that can still degrade moves one step down `QOS_LEVELS`: half rate, then
+    a smaller model input, then no annotated snapshots or recordings, and
+    finally only its `min_fps`. Once the lag is below
+    `deadline_ms * recover_ratio` the most important degraded source
+    moves one step back up. Lower `priority` values are more important, as
+    for stages, and no source ever drops below its `min_fps`.
+    """
+
+    def __init__(self, deadline_ms=500.0, recover_ratio=0.5, sample_interval=1.0, fps_factor=0.5,
+                 reduced_imgsz=320, max_decisions=200):
+        self.deadline_ms = deadline_ms
+        self.recover_ratio = recover_ratio
+        self.sample_interval = sample_interval
+        self.fps_factor = fps_factor
+        self.reduced_imgsz = reduced_imgsz
+        self.sources = {}
+        self.window = []  # lags (ms) reported since the last sample
+        self.last_sample = time.monotonic()
+        self.last_p95 = None
+        self.decisions = deque(maxlen=max_decisions)
+        self.degrade_count = 0
+        self.restore_count = 0
+        self.lock = threading.Lock()
+
+    def register(self, source_id, priority=0, min_fps=1.0):
+        # A zero, negative or NaN floor would make fps() return 0 and the pacing divide by it
+        min_fps = min_fps if min_fps > MIN_FPS_FLOOR else MIN_FPS_FLOOR
+        with self.lock:
+            self.sources[source_id] = {
+                'priority': priority,
+                'min_fps': min_fps,
+                'level': 0,
+                'degraded_since': None,
+                'degraded_seconds': 0.0,
+                'lag_ms': deque(maxlen=100)
+            }
+
+    def unregister(self, source_id):
+        with self.lock:
+            self.sources.pop(source_id, None)
+
+    def level(self, source_id):
+        with self.lock:
+            state = self.sources.get(source_id)
+            return state['level'] if state else 0
+
+    def mode(self, source_id):
+        return QOS_LEVELS[self.level(source_id)]
+
+    def fps(self, source_id, target_fps):
+        """Rate this source may run a stage targeting `target_fps`"""
+        with self.lock:
+            state = self.sources.get(source_id)
+            if state is None or not state['level']:
+                return target_fps
+            floor = min(state['min_fps'], target_fps)
+            if state['level'] >= QOS_LEVELS.index('min_fps'):
+                return floor
+            return max(target_fps * self.fps_factor, floor)
+
+    def imgsz(self, source_id):
+        """Model input size override, or None for the default"""
+        return self.reduced_imgsz if self.level(source_id) >= QOS_LEVELS.index('reduced_input') else None
+
+    def annotate(self, source_id):
+        return self.level(source_id) < QOS_LEVELS.index('no_annotation')
+
+    def record(self, source_id, lag_ms):
+        with self.lock:
+            state = self.sources.get(source_id)
+            if state is not None:
+                state['lag_ms'].append(lag_ms)
+            self.window.append(lag_ms)
+            now = time.monotonic()
+            if now - self.last_sample >= self.sample_interval:
+                self.last_sample = now
+                self._evaluate()
+
+    def _evaluate(self):
+        if not self.window:
+            return
+        p95 = float(np.percentile(self.window, 95))
+        self.window = []
+        self.last_p95 = p95
+        if p95 > self.deadline_ms:
+            # Least important first; among equals, the least degraded so the cost is spread
+            candidates = [(-state['priority'], state['level'], source_id)
+                          for source_id, state in self.sources.items() if state['level'] < len(QOS_LEVELS) - 1]
+            if candidates:
+                self._step(min(candidates)[2], 1, p95)
+        elif p95 < self.deadline_ms * self.recover_ratio:
+            candidates = [(state['priority'], -state['level'], source_id)
+                          for source_id, state in self.sources.items() if state['level']]
+            if candidates:
+                self._step(min(candidates)[2], -1, p95)
+
+    def _step(self, source_id, delta, p95):
+        state = self.sources[source_id]
+        state['level'] += delta
+        now = time.time()
+        if delta > 0:
+            self.degrade_count += 1
+            if state['degraded_since'] is None:
+                state['degraded_since'] = now
+        else:
+            self.restore_count += 1
+            if not state['level']:
+                state['degraded_seconds'] += now - state['degraded_since']
+                state['degraded_since'] = None
+        mode = QOS_LEVELS[state['level']]
+        self.decisions.append({
+            'time': datetime.fromtimestamp(now).isoformat(),
+            'source': source_id,
+            'action': 'degrade' if delta > 0 else 'restore',
+            'mode': mode,
+            'priority': state['priority'],
+            'p95_lag_ms': round(p95, 1)
+        })
+        logger.info(f"QoS: p95 lag {p95:.0f}ms, {'degrading' if delta > 0 else 'restoring'} "
+                    f"{source_id} (priority {state['priority']}) to {mode}")
+
+    def source_stats(self, source_id):
+        with self.lock:
+            state = self.sources.get(source_id)
+            return self._source_stats(state) if state else None
+
+    def _source_stats(self, state):
+        degraded_seconds = state['degraded_seconds']
+        if state['degraded_since'] is not None:
+            degraded_seconds += time.time() - state['degraded_since']
+        lags = state['lag_ms']
+        p50, p95 = np.percentile(lags, [50, 95]) if lags else (None, None)
+        return {
+            'priority': state['priority'],
+            'min_fps': state['min_fps'],
+            'mode': QOS_LEVELS[state['level']],
+            'level': state['level'],
+            'degraded_seconds': round(degraded_seconds, 1),
+            'lag_ms': {'p50': round(float(p50), 1) if p50 is not None else None,
+                       'p95': round(float(p95), 1) if p95 is not None else None}
+        }
+
+    def stats(self):
+        with self.lock:
+            return {
+                'deadline_ms': self.deadline_ms,
+                'p95_lag_ms': round(self.last_p95, 1) if self.last_p95 is not None else None,
+                'saturated': any(state['level'] for state in self.sources.values()),
+                'degrade_events': self.degrade_count,
+                'restore_events': self.restore_count,
+                'sources': {source_id: self._source_stats(state) for source_id, state in self.sources.items()},
+                'decisions': list(self.decisions)[-50:]
+            }
+
+
+# -------------------------------
+# Unified alert stream
+# -------------------------------
+class AlertStream:
+    """
+    Sequence-numbered alerts from every stage. Alerts from different stages on
+    the same source within `correlation_seconds` also raise a combined alert.
+    """
+
+    def __init__(self, logs_folder, max_alerts=1000, correlation_seconds=10.0):
+        self.logs_folder = logs_folder
+        self.correlation_seconds = correlation_seconds
+        self.alerts = deque(maxlen=max_alerts)
+        self.next_seq = 1
+        self.recent = {}  # source -> {stage: (timestamp, seq)}
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, callback):
+        self.listeners.append(callback)
+
+    def _append(self, alert):
+        alert['seq'] = self.next_seq
+        self.next_seq += 1
+        self.alerts.append(alert)
+        return alert
+
+    def publish(self, source_id, stage_name, timestamp, alert):
+        published = []
+        with self.lock:
+            published.append(self._append({
+                'id': str(uuid.uuid4())[:8],
+                'source': source_id,
+                'stage': stage_name,
+                'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+                **alert
+            }))
+
+            recent = self.recent.setdefault(source_id, {})
+            recent[stage_name] = (timestamp, published[0]['seq'])
+            related = {stage: seq for stage, (seen, seq) in recent.items()
+                       if stage != stage_name and timestamp - seen <= self.correlation_seconds}
+            if related:
+                published.append(self._append({
+                    'id': str(uuid.uuid4())[:8],
+                    'source': source_id,
+                    'stage': 'combined',
+                    'timestamp': published[0]['timestamp'],
+                    'type': 'COMBINED_THREAT',
+                    'severity': 'critical',
+                    'stages': sorted([stage_name, *related]),
+                    'related_seqs': sorted([published[0]['seq'], *related.values()])
+                }))
+
+        for item in published:
+            self._write_log(item)
+            logger.warning(f"PIPELINE ALERT [{item['source']}] {item['type']} ({item['stage']})")
+            for callback in self.listeners:
+                try:
+                    callback(item)
+                except Exception as e:
+                    logger.error(f"Alert listener error: {e}")
+        return published
+
+    def _write_log(self, alert):
+        try:
+            log_filename = f"pipeline_alerts_{datetime.now().strftime('%Y%m%d')}.json"
+            with open(os.path.join(self.logs_folder, log_filename), 'a') as f:
+                f.write(json.dumps(alert) + '\n')
+        except Exception as e:
+            logger.error(f"Failed to log pipeline alert: {e}")
+
+    def since(self, seq=0, limit=100):
+        with self.lock:
+            alerts = [alert for alert in self.alerts if alert['seq'] > seq][:limit]
+            return alerts, self.next_seq - 1
+
+    def forget(self, source_id):
+        with self.lock:
+            self.recent.pop(source_id, None)
+
+
+# -------------------------------
+# Sources
+# -------------------------------
+class _Source:
+    def __init__(self, source_id, uri, capture):
+        self.source_id = source_id
+        self.uri = uri
+        self.running = True
+        self.thread = None
+        self.capture = capture
+        self.frames = 0
+        self.started = time.time()
+        self.last_frame_time = None
+        self.error = None
+        # stage name -> {'last_run', 'next_due', 'busy', 'runs', 'result'}
+        self.stages = {}
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {
+            'uri': str(self.uri),
+            'running': self.running,
+            'frames_decoded': self.frames,
+            'decode_fps': round(self.frames / elapsed, 2),
+            'error': self.error,
+            'capture': self.capture.stats(),
+            'stages': {
+                name: {
+                    'runs': state['runs'],
+                    'effective_fps': round(state['runs'] / elapsed, 2),
+                    'last_result': state['result']
+                }
+                for name, state in self.stages.items()
+            }
+        }
+
+
+class AnalyticsPipeline:
+    """Decode each source once and fan frames out to the registered stages"""
+
+    def __init__(self, stages, scheduler=None, alert_stream=None, max_workers=4, on_result=None, qos=None):
+        self.stages = list(stages)
+        self.scheduler = scheduler or CpuBudgetScheduler()
+        self.scheduler.register(self.stages)
+        self.qos = qos or QosController()
+        self.alerts = alert_stream
+        self.on_result = on_result
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline-stage')
+
+    # Source management
+    def add_source(self, uri, source_id=None, loop=False, realtime=True, backend='auto', reconnect_max=30.0,
+                   priority=0, min_fps=1.0):
+        source_id = source_id or str(uuid.uuid4())[:8]
+        with self.lock:
+            if source_id in self.sources and self.sources[source_id].running:
+                return None, f"Source {source_id} is already running"
+
+            # Files replay at native rate when realtime, otherwise losslessly as fast as stages allow
+            capture = CaptureSource(uri, backend=backend, loop=loop, realtime=realtime,
+                                    reconnect_max=reconnect_max, name=source_id)
+            if not capture.start():
+                return None, f"Could not open source {uri}"
+
+            source = _Source(source_id, uri, capture)
+            source.stages = {stage.name: {'last_run': 0.0, 'next_due': 0.0, 'busy': False,
+                                          'runs': 0, 'result': None}
+                             for stage in self.stages}
+            source.thread = threading.Thread(target=self._decode_loop, args=(source,),
+                                             name=f"pipeline-{source_id}", daemon=True)
+            self.sources[source_id] = source
+            self.qos.register(source_id, priority=priority, min_fps=min_fps)
+            source.thread.start()
+
+        logger.info(f"Pipeline source {source_id} started ({uri})")
+        return source_id, None
+
+    def remove_source(self, source_id):
+        with self.lock:
+            source = self.sources.pop(source_id, None)
+        if source is None:
+            return False
+        source.running = False
+        if source.thread is not None and source.thread is not threading.current_thread():
+            source.thread.join(timeout=5)
+        for stage in self.stages:
+            stage.reset(source_id)
+        self.qos.unregister(source_id)
+        if self.alerts is not None:
+            self.alerts.forget(source_id)
+        logger.info(f"Pipeline source {source_id} removed")
+        return True
+
+    def _decode_loop(self, source):
+        try:
+            while source.running:
+                # The capture thread paces files, drains live buffers and reconnects dropped streams
+                ret, frame = source.capture.read()
+                if not ret:
+                    if not source.capture.isOpened():
+                        break
+                    continue
+
+                source.frames += 1
+                source.last_frame_time = time.time()
+                self._dispatch(source, frame, source.last_frame_time)
+        except Exception as e:
+            source.error = str(e)
+            logger.error(f"Pipeline source {source.source_id} error: {e}")
+        finally:
+            source.running = False
+            source.capture.release()
+            logger.info(f"Pipeline source {source.source_id} finished after {source.frames} frames")
+
+    # Fan-out
+    def _dispatch(self, source, frame, timestamp):
+        resized = {}
+        for stage in self.stages:
+            state = source.stages[stage.name]
+            if timestamp < state['next_due']:
+                continue
+            since_last_run = timestamp - state['last_run']
+            if state['busy']:
+                # Previous run of this stage is still going; drop rather than queue stale frames
+                stage.skipped_busy += 1
+                continue
+            if not self.scheduler.admit(stage, since_last_run):
+                stage.deferred += 1
+                continue
+
+            stage_frame = frame
+            if stage.input_size:
+                # Stages asking for the same downsample share one resize
+                stage_frame = resized.get(stage.input_size)
+                if stage_frame is None:
+                    stage_frame = resized[stage.input_size] = cv2.resize(
+                        frame, stage.input_size, interpolation=cv2.INTER_AREA)
+
+            state['busy'] = True
+            state['last_run'] = timestamp
+            # Advance on a fixed grid so the stage holds its rate regardless of source fps
+            fps = self.qos.fps(source.source_id, stage.target_fps)
+            state['next_due'] = max(state['next_due'] + 1.0 / fps, timestamp)
+            self.executor.submit(self._run_stage, source, stage, stage_frame, timestamp,
+                                 self.qos.imgsz(source.source_id))
+
+    def _run_stage(self, source, stage, frame, timestamp, imgsz=None):
+        state = source.stages[stage.name]
+        started = time.perf_counter()
+        failed = False
+        try:
+            with stage.slots:
+                result, alerts = stage.process(source.source_id, frame, timestamp, imgsz=imgsz)
+            state['runs'] += 1
+            # Decode-to-result lag includes time spent queued behind other sources
+            self.qos.record(source.source_id, (time.time() - timestamp) * 1000)
+            if result is not None:
+                state['result'] = result
+                if self.on_result is not None:
+                    # A degraded source gets no frame, so nothing is annotated for it
+                    annotate = self.qos.annotate(source.source_id)
+                    self.on_result(source.source_id, stage.name, timestamp, result, frame if annotate else None)
+            if self.alerts is not None:
+                for alert in alerts:
+                    self.alerts.publish(source.source_id, stage.name, timestamp, alert)
+        except Exception as e:
+            failed = True
+            logger.error(f"Pipeline stage {stage.name} failed on {source.source_id}: {e}")
+        finally:
+            stage.record_run((time.perf_counter() - started) * 1000, failed)
+            state['busy'] = False
+
+    def get_status(self):
+        with self.lock:
+            sources = {source_id: source.stats() for source_id, source in self.sources.items()}
+        return {
+            'sources': sources,
+            'stages': {stage.name: stage.stats() for stage in self.stages},
+            'scheduler': self.scheduler.stats(),
+            'qos': self.qos.stats()
+        }
+
+    def shutdown(self):
+        for source_id in list(self.sources):
+            self.remove_source(source_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, Request, request, jsonify, Response, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 import cv2
@@ -8,18 +8,44 @@ import base64
 import io
 from PIL import Image
 import os
+import sys
 import logging
+from werkzeug.http import http_date
 from werkzeug.utils import secure_filename
 import uuid
 from datetime import datetime, timedelta
 import threading
 import time
+import math
 import json
+from concurrent.futures import ThreadPoolExecutor
+from batch_jobs import BatchJobManager
+from detection_cache import DetectionCache
+from analytics_pipeline import (AlertStream, AnalyticsPipeline, CpuBudgetScheduler, QosController, ViolenceStage,
+                                WeaponStage)
+from sos_ingest import SosStore, UploadError
+from tiling import RoiMasks, nms
+from alert_outbox import AlertOutbox, SocketIOTarget, target_from_config
+from detection_store import DetectionStore
+from capture_backends import CAPTURE_BACKENDS, CaptureSource
+from snapshot_cache import SnapshotCache
+from dvr import SegmentedDvr
+from event_journal import EventJournal
+from recording_index import RecordingIndex, extract_still, extract_subclip, index_path
+from model_registry import ModelRegistry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class InMemoryRequest(Request):
+    """Keep uploaded files in memory instead of spooling them to disk"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploads are already bounded by MAX_CONTENT_LENGTH
+        return io.BytesIO()
+
 app = Flask(__name__)
+app.request_class = InMemoryRequest
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
@@ -30,134 +56,373 @@ RESULTS_FOLDER = './results'
 LOGS_FOLDER = './logs'
 RECORDINGS_FOLDER = './recordings'
 MODEL_PATH = '../Hardware-utilities/weapon/model/best.pt'
+MODELS_FOLDER = './models'  # New weapon model versions are loaded from here; holds registry.json
+MODEL_WARMUP_RUNS = 3  # Blank frames run through a new version before it can shadow or go live
+MODEL_SHADOW_IOU = 0.5  # Live and candidate boxes of the same class at this IoU count as agreeing
 WEAPON_ALERT_THRESHOLD = 5.0
 RECORDING_BUFFER_SECONDS = 10  # Record 10 seconds before and after alert
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(RESULTS_FOLDER, exist_ok=True)
-os.makedirs(LOGS_FOLDER, exist_ok=True)
-os.makedirs(RECORDINGS_FOLDER, exist_ok=True)
-
-try:
-    model = YOLO(MODEL_PATH)
-    logger.info("YOLO model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load YOLO model: {e}")
-    model = None
+MONITOR_FRAME_INTERVAL = 0.1  # Pause between monitor loop iterations
+STREAM_FRAME_INTERVAL = 0.033  # ~30 FPS for MJPEG stream clients
+JOBS_FOLDER = os.path.join(RESULTS_FOLDER, 'jobs')
+HIGHLIGHTS_FOLDER = os.path.join(RESULTS_FOLDER, 'highlights')  # Sub-clips cut around detections
+HIGHLIGHT_MAX_SECONDS = 30
+RECORDING_INDEX_MAX_DETECTIONS = 100000  # Detection rows written to one recording sidecar
+BATCH_JOB_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+BATCH_SHARD_SECONDS = 300  # Split long videos into 5 minute shards
+DETECT_BATCH_SIZE = 16  # Images per inference batch on /detect/batch
+DECODE_WORKERS = 4
+DETECTION_CONFIDENCE = 0.25
+DETECTION_IOU = 0.7
+DETECTION_CACHE_MAX_MB = 64
+DETECTION_CACHE_TTL_SECONDS = 600
+VIOLENCE_DETECTION_ENABLED = True
+VIOLENCE_MODULE_DIR = '../Assault_detection_DL_model'
+VIOLENCE_MODEL_PATH = '../Assault_detection_DL_model/MoBiLSTM_model.h5'
+VIOLENCE_SAMPLE_INTERVAL = 1  # Feed every monitored frame into the 16-frame window
+VIOLENCE_STRIDE = 4  # Score the window every 4 new frames
+VIOLENCE_MAX_BATCH = 16  # Clips batched across sources per inference call
+# Exported TFLite/ONNX model (export_model.py); used instead of Keras when present
+# Exports of export_model.py, first found wins; any of them avoids importing TensorFlow
+VIOLENCE_RUNTIME_MODEL_PATHS = tuple(f'../Assault_detection_DL_model/MoBiLSTM_model{suffix}'
+                                     for suffix in ('_int8.tflite', '_float16.tflite', '_none.tflite', '.onnx'))
+PIPELINE_WORKERS = max(2, (os.cpu_count() or 2) // 2)
+PIPELINE_WEAPON_FPS = 10  # YOLO runs per second per pipeline source
+PIPELINE_VIOLENCE_FPS = 8  # Frames per second fed into the 16-frame violence window
+PIPELINE_CPU_BUDGET_PERCENT = 85  # Shed low-priority stages above this node CPU usage
+PIPELINE_CORRELATION_SECONDS = 10  # Weapon + violence alerts this close raise a combined alert
+EDGE_MAX_CLOCK_SKEW_SECONDS = 300  # Edge timestamps further in the future fall back to server time
+QOS_DEADLINE_MS = 500  # Decode-to-result lag above this degrades low-priority sources
+QOS_REDUCED_IMGSZ = 320  # YOLO input size for sources degraded to reduced_input
+QOS_DEFAULT_MIN_FPS = 1.0  # Guaranteed inference rate per source, however loaded the node
+SOS_FOLDER = './sos'
+SOS_MAX_ACTIVE_UPLOADS = 32  # Chunk writes in flight; extra devices are told to retry later
+TILED_INFERENCE_ENABLED = True
+TILING_MIN_SIDE = 2560  # Frames at least this wide/tall (e.g. 4K) are tiled
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_MAX_TILES = 12  # Tiles grow until the plan fits, bounding cost per frame
+TILE_INCLUDE_FULL_FRAME = True  # Extra downscaled full-frame pass for large, close weapons
+TILE_MERGE_IOS = 0.7  # Also merge boxes whose intersection covers this much of the smaller one
+ROI_MASKS_PATH = './roi_masks.json'
+ALERT_OUTBOX_PATH = os.path.join(LOGS_FOLDER, 'alert_outbox.db')
+ALERT_TARGETS_PATH = './alert_targets.json'  # Webhook targets, managed through /alerts/targets
+ALERT_DELIVERY_WORKERS = 4
+EVENTS_FOLDER = os.path.join(LOGS_FOLDER, 'events')  # Event journal segments for reconnecting dashboards
+EVENT_JOURNAL_MAX_EVENTS = 2000  # Kept in memory; older events are read back from disk
+EVENT_REPLAY_LIMIT = 500  # Events per replay batch
+HISTORY_FOLDER = './history'  # Per-frame detection log and rollups for the history dashboard
+HISTORY_MAX_BUCKETS = 10000
+CAPTURE_RECONNECT_MAX_SECONDS = 30  # Backoff cap when a camera or stream drops
+CAPTURE_STALL_SECONDS = 5  # No frame for this long counts as a dropped stream
+DVR_FOLDER = './dvr'  # Rolling per-camera segments; alert clips are cut from these
+DVR_SEGMENT_SECONDS = 4
+DVR_FPS = 15  # Constant segment frame rate, independent of the camera's
+DVR_RETENTION_SECONDS = 900  # Longest pre-roll an alert clip or /dvr export can reach back
+DVR_MAX_MB_PER_CAMERA = 2048
+FFMPEG_BINARY = 'ffmpeg'  # Used to concatenate segments without re-encoding
+SNAPSHOT_SIZES = {'thumb': 320, 'medium': 640, 'full': None}  # Max width per variant
+SNAPSHOT_MAX_AGE = 2  # Cache-Control max-age for snapshot responses, seconds
+SNAPSHOT_JPEG_QUALITY = 80
 
 class WeaponDetector:
-    def __init__(self, model):
+    def __init__(self, model, cache=None, roi_masks=None):
         self.model = model
+        self.cache = cache
+        self.roi_masks = roi_masks
+        self.conf = DETECTION_CONFIDENCE
+        self.iou = DETECTION_IOU
+        self.on_inference = None  # on_inference(image, detections, elapsed_ms, params) after full-frame runs
+
+    def inference_params(self):
+        return {"conf": self.conf, "iou": self.iou}
+
+    def model_fingerprint(self):
+        """Identifies the loaded weights and backend; changes invalidate cached results"""
+        model_file = getattr(self.model, 'ckpt_path', None) or MODEL_PATH
+        try:
+            stat = os.stat(model_file)
+            file_version = (model_file, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_version = (model_file, None, None)
+        device = getattr(self.model, 'device', None)
+        return (id(self.model), type(self.model).__name__, str(device)) + file_version
 
-    def detect_weapons(self, image):
-        if self.model is None:
+    def _make_detection(self, names, class_id, confidence, bbox):
+        class_name = names[class_id].lower()
+
+        if class_name == "pistol":
+            class_name = "gun"
+
+        return {
+            "class": class_name,
+            "confidence": float(confidence),
+            "bbox": {
+                "x1": float(bbox[0]),
+                "y1": float(bbox[1]),
+                "x2": float(bbox[2]),
+                "y2": float(bbox[3])
+            }
+        }
+
+    def _parse_result(self, r):
+        detections = []
+        boxes = r.boxes
+        if boxes is not None:
+            for i in range(len(boxes.cls)):
+                detections.append(self._make_detection(
+                    r.names, int(boxes.cls[i]), float(boxes.conf[i]), boxes.xyxy[i].cpu().numpy().tolist()))
+        return detections
+
+    def infer_with(self, model, image, params=None):
+        """Full-frame detections from `model`, which need not be the live one"""
+        detections = []
+        for r in model(image, **(params or self.inference_params())):
+            detections.extend(self._parse_result(r))
+        return detections
+
+    def should_tile(self, image):
+        return TILED_INFERENCE_ENABLED and self.roi_masks is not None and max(image.shape[:2]) >= TILING_MIN_SIDE
+
+    def _apply_roi(self, detections, camera_id, image):
+        """Drop detections whose centre lies outside the camera's ROI mask"""
+        if not detections or self.roi_masks is None or self.roi_masks.get(camera_id) is None:
+            return detections
+        boxes = np.array([[d["bbox"]["x1"], d["bbox"]["y1"], d["bbox"]["x2"], d["bbox"]["y2"]]
+                          for d in detections], dtype=np.float32)
+        inside = self.roi_masks.inside(camera_id, image.shape[1], image.shape[0], boxes)
+        return [d for d, keep in zip(detections, inside) if keep]
+
+    def _detect_tiled(self, model, image, camera_id=None):
+        """Run all ROI tiles (plus the full frame) as one batch and merge the boxes with NMS"""
+        height, width = image.shape[:2]
+        tiles = self.roi_masks.plan(camera_id, width, height)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        offsets = [(x1, y1) for x1, y1, _, _ in tiles]
+        if TILE_INCLUDE_FULL_FRAME:
+            crops.append(image)
+            offsets.append((0, 0))
+        if not crops:
+            return [], 0
+
+        boxes, scores, classes, names = [], [], [], {}
+        for (dx, dy), r in zip(offsets, model(crops, **self.inference_params())):
+            names = r.names
+            if r.boxes is None or not len(r.boxes.cls):
+                continue
+            boxes.append(r.boxes.xyxy.cpu().numpy() + np.array([dx, dy, dx, dy], dtype=np.float32))
+            scores.append(r.boxes.conf.cpu().numpy())
+            classes.append(r.boxes.cls.cpu().numpy().astype(np.int64))
+        if not boxes:
+            return [], len(tiles)
+
+        boxes, scores, classes = np.concatenate(boxes), np.concatenate(scores), np.concatenate(classes)
+        inside = self.roi_masks.inside(camera_id, width, height, boxes)
+        boxes, scores, classes = boxes[inside], scores[inside], classes[inside]
+        keep = nms(boxes, scores, classes, iou_threshold=self.iou, ios_threshold=TILE_MERGE_IOS)
+        return [self._make_detection(names, int(classes[i]), scores[i], boxes[i]) for i in keep], len(tiles)
+
+    def detect_weapons(self, image, use_cache=False, camera_id=None, tiled=None, imgsz=None):
+        """
+        Full-frame detection, or tiled detection for high-resolution frames (`tiled=None` decides by size).
+        `imgsz` lowers the model input size for load shedding and disables tiling.
+        """
+        # One model for the whole frame, even if a new version is swapped in meanwhile
+        model = self.model
+        if model is None:
             return {"error": "Model not loaded"}
+        if tiled is None:
+            tiled = imgsz is None and self.should_tile(image)
+        params = self.inference_params()
+        if imgsz:
+            params['imgsz'] = imgsz
+
+        cache_key = None
+        if use_cache and self.cache is not None:
+            key_params = params
+            if tiled or camera_id is not None:
+                roi_version = self.roi_masks.version(camera_id) if self.roi_masks is not None else 0
+                key_params = {**params, "tiled": bool(tiled), "camera_id": camera_id, "roi_version": roi_version}
+            cache_key = self.cache.make_key(image, key_params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True}
 
         try:
-            results = self.model(image)
-            detections = []
-
-            for r in results:
-                boxes = r.boxes
-                if boxes is not None:
-                    for i in range(len(boxes.cls)):
-                        class_id = int(boxes.cls[i])
-                        class_name = r.names[class_id].lower()
-
-                        if class_name == "pistol":
-                            class_name = "gun"
-
-                        confidence = float(boxes.conf[i])
-                        bbox = boxes.xyxy[i].cpu().numpy().tolist()
-
-                        detection = {
-                            "class": class_name,
-                            "confidence": confidence,
-                            "bbox": {
-                                "x1": bbox[0],
-                                "y1": bbox[1],
-                                "x2": bbox[2],
-                                "y2": bbox[3]
-                            }
-                        }
-                        detections.append(detection)
-
-            return {
+            if tiled:
+                detections, tile_count = self._detect_tiled(model, image, camera_id)
+            else:
+                started = time.perf_counter()
+                detections = self.infer_with(model, image, params)
+                if self.on_inference is not None:
+                    self.on_inference(image, detections, (time.perf_counter() - started) * 1000, params)
+                detections = self._apply_roi(detections, camera_id, image)
+
+            result = {
                 "success": True,
                 "detections": detections,
                 "count": len(detections)
             }
+            if tiled:
+                result["tiles"] = tile_count
+            if cache_key is not None:
+                self.cache.put(cache_key, result)
+            return result
 
         except Exception as e:
             logger.error(f"Detection error: {e}")
             return {"error": str(e)}
 
-    def annotate_image(self, image):
-        if self.model is None:
-            return image
+    def detect_batch(self, images, use_cache=False):
+        """Run one inference call over a list of images, skipping cached ones"""
+        model = self.model
+        if model is None:
+            return [{"error": "Model not loaded"} for _ in images]
+        if not images:
+            return []
+
+        output = [None] * len(images)
+        cache_keys = [None] * len(images)
+        if use_cache and self.cache is not None:
+            params = self.inference_params()
+            for i, image in enumerate(images):
+                cache_keys[i] = self.cache.make_key(image, params)
+                cached = self.cache.get(cache_keys[i])
+                if cached is not None:
+                    output[i] = {**cached, "cached": True}
+
+        # High-resolution images each need their own tile batch
+        for i, result in enumerate(output):
+            if result is None and self.should_tile(images[i]):
+                output[i] = self.detect_weapons(images[i], use_cache=use_cache, tiled=True)
+
+        pending = [i for i, result in enumerate(output) if result is None]
+        if not pending:
+            return output
 
         try:
-            results = self.model(image)
-            annotated_image = image.copy()
+            results = model([images[i] for i in pending], **self.inference_params())
+            for i, r in zip(pending, results):
+                detections = self._parse_result(r)
+                output[i] = {
+                    "success": True,
+                    "detections": detections,
+                    "count": len(detections)
+                }
+                if cache_keys[i] is not None:
+                    self.cache.put(cache_keys[i], output[i])
+            return output
 
-            for r in results:
-                boxes = r.boxes
-                if boxes is not None:
-                    for i in range(len(boxes.cls)):
-                        class_id = int(boxes.cls[i])
-                        class_name = r.names[class_id].lower()
+        except Exception as e:
+            logger.error(f"Batch detection error: {e}")
+            return [result or {"error": str(e)} for result in output]
 
-                        if class_name == "pistol":
-                            class_name = "gun"
+    def draw_detections(self, image, detections):
+        """Draw already computed detections onto a copy of the image"""
+        annotated_image = image.copy()
 
-                        confidence = float(boxes.conf[i])
-                        bbox = boxes.xyxy[i].cpu().numpy().astype(int)
+        for detection in detections:
+            bbox = detection["bbox"]
+            x1, y1, x2, y2 = int(bbox["x1"]), int(bbox["y1"]), int(bbox["x2"]), int(bbox["y2"])
 
-                        cv2.rectangle(annotated_image, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 0, 255), 2)
+            cv2.rectangle(annotated_image, (x1, y1), (x2, y2), (0, 0, 255), 2)
 
-                        label = f"{class_name}: {confidence:.2f}"
-                        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+            label = f"{detection['class']}: {detection['confidence']:.2f}"
+            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
 
-                        cv2.rectangle(annotated_image,
-                                    (bbox[0], bbox[1] - label_size[1] - 10),
-                                    (bbox[0] + label_size[0], bbox[1]),
-                                    (0, 0, 255), -1)
+            cv2.rectangle(annotated_image,
+                        (x1, y1 - label_size[1] - 10),
+                        (x1 + label_size[0], y1),
+                        (0, 0, 255), -1)
 
-                        cv2.putText(annotated_image, label,
-                                  (bbox[0], bbox[1] - 5),
-                                  cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            cv2.putText(annotated_image, label,
+                      (x1, y1 - 5),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
 
-            return annotated_image
+        return annotated_image
+
+    def annotate_image(self, image, camera_id=None):
+        if self.model is None:
+            return image
+
+        try:
+            results = self.detect_weapons(image, camera_id=camera_id)
+            if not results.get('success'):
+                return image
+            return self.draw_detections(image, results['detections'])
 
         except Exception as e:
             logger.error(f"Annotation error: {e}")
             return image
 
-detector = WeaponDetector(model)
+# Dashboard events and alert delivery
+def publish_event(event, data):
+    """Journal an event and broadcast it with its sequence number"""
+    entry = event_journal.append(event, data)
+    socketio.emit(event, {**data, 'seq': entry['seq']})
+
+def load_alert_targets():
+    if not os.path.exists(ALERT_TARGETS_PATH):
+        return
+    try:
+        with open(ALERT_TARGETS_PATH) as f:
+            for config in json.load(f):
+                alert_outbox.add_target(target_from_config(config))
+                alert_target_configs[config['name']] = config
+    except Exception as e:
+        logger.error(f"Failed to load alert targets: {e}")
+
+def save_alert_targets():
+    tmp_path = ALERT_TARGETS_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(list(alert_target_configs.values()), f, indent=2)
+    os.replace(tmp_path, ALERT_TARGETS_PATH)
+
+def index_recording(clip):
+    """Write the detection sidecar for a finished DVR clip from the detection history"""
+    if clip['status'] != 'done':
+        return
+    try:
+        detections = detection_store.events(clip['clip_start'], clip['clip_end'], camera_id=clip['camera_id'],
+                                            limit=RECORDING_INDEX_MAX_DETECTIONS)
+        index = RecordingIndex.build(clip['path'], clip['clip_start'], dvr.fps, detections, clip.get('spans'))
+        index.save(index_path(clip['path']))
+        logger.info(f"Indexed {os.path.basename(clip['path'])}: {len(index.keyframes)} keyframes, "
+                    f"{len(index.detections)} detections")
+    except Exception as e:
+        logger.error(f"Failed to index recording {clip['path']}: {e}")
 
 # Camera monitoring system
 class CameraMonitor:
-    def __init__(self, detector):
+    def __init__(self, detector, violence_detector=None, qos=None):
         self.detector = detector
+        self.qos = qos or QosController()
+        self.violence_detector = violence_detector
         self.camera = None
+        self.camera_id = None  # ROI mask key, "camera:<index>"
         self.is_monitoring = False
         self.weapon_detected_time = None
         self.last_detection_time = None
         self.alert_logged = False
         self.monitoring_thread = None
         self.is_recording = False
-        self.video_writer = None
         self.recording_filename = None
-        self.frame_buffer = []  # Buffer to store frames before alert
-        self.max_buffer_size = int(30 * RECORDING_BUFFER_SECONDS)  # 30 FPS * buffer seconds
+        self.recording_clip_id = None  # Open DVR clip for the current alert
         self.recording_session_id = None  # Track recording sessions
 
-    def start_monitoring(self, camera_index=0):
+    def start_monitoring(self, camera_index=0, backend='auto', camera_id=None, priority=0,
+                         min_fps=QOS_DEFAULT_MIN_FPS):
+        """`camera_index` may also be an RTSP/HTTP URL, a GStreamer pipeline or a video file"""
         try:
-            self.camera = cv2.VideoCapture(camera_index)
-            if not self.camera.isOpened():
+            self.camera = CaptureSource(camera_index, backend=backend, reconnect_max=CAPTURE_RECONNECT_MAX_SECONDS,
+                                        stall_seconds=CAPTURE_STALL_SECONDS, name=camera_id or str(camera_index))
+            if not self.camera.start():
                 logger.error(f"Could not open camera {camera_index}")
+                self.camera = None
                 return False
+            self.camera_id = camera_id or f"camera:{camera_index}"
+            self.qos.register(self.camera_id, priority=priority, min_fps=min_fps)
+            # Encoded once into the segment ring; alert clips are cut from it
+            dvr.start(self.camera_id, self.camera)
 
             self.is_monitoring = True
             self.monitoring_thread = threading.Thread(target=self._monitor_loop)
@@ -176,11 +441,16 @@ class CameraMonitor:
         self._complete_recording()
 
         if self.camera:
+            dvr.stop(self.camera_id)
             self.camera.release()
             self.camera = None
+        snapshot_cache.remove(self.camera_id)
+        self.qos.unregister(self.camera_id)
 
         # Complete reset for fresh start
         self._reset_detection_state()
+        if self.violence_detector is not None:
+            self.violence_detector.reset()
 
         logger.info("Camera monitoring COMPLETELY stopped and reset")
 
@@ -189,17 +459,27 @@ class CameraMonitor:
             try:
                 ret, frame = self.camera.read()
                 if not ret:
-                    logger.warning("Failed to read from camera")
-                    time.sleep(1)
+                    # The capture thread reconnects on its own; a finished file ends monitoring
+                    if not self.camera.isOpened():
+                        logger.warning("Camera source ended")
+                        self.stop_monitoring()
+                        break
                     continue
 
-                results = self.detector.detect_weapons(frame)
+                frame_time = self.camera.last_frame_time()
+                results = self.detector.detect_weapons(frame, camera_id=self.camera_id,
+                                                       imgsz=self.qos.imgsz(self.camera_id))
+                self.qos.record(self.camera_id, (time.perf_counter() - frame_time) * 1000)
+                annotate = self.qos.annotate(self.camera_id)
                 current_time = time.time()
+                if results.get('success'):
+                    detection_store.record(self.camera_id, current_time, results['detections'])
+                # A degraded source still refreshes its snapshot, just without boxes drawn on it
+                snapshot_cache.update(self.camera_id, frame,
+                                      results.get('detections') if annotate else [], current_time)
 
-                # Add frame to buffer for potential recording
-                if len(self.frame_buffer) >= self.max_buffer_size:
-                    self.frame_buffer.pop(0)  # Remove oldest frame
-                self.frame_buffer.append(frame.copy())
+                if self.violence_detector is not None:
+                    self._process_violence(frame, current_time)
 
                 # Process detection results
                 weapon_detected = results.get('success') and results.get('count', 0) > 0
@@ -222,11 +502,6 @@ class CameraMonitor:
                         self.alert_logged = True
                         logger.info(f"NEW Recording started [Session: {self.recording_session_id}] after {detection_duration:.1f}s")
 
-                    # Write frame to recording if active
-                    if self.is_recording and self.video_writer:
-                        annotated_frame = self.detector.annotate_image(frame)
-                        self.video_writer.write(annotated_frame)
-
                     # Emit detection data
                     socketio.emit('weapon_detection', {
                         'detected': True,
@@ -242,15 +517,10 @@ class CameraMonitor:
                     if self.last_detection_time is not None:
                         time_since_last_detection = current_time - self.last_detection_time
 
-                        # Continue recording for buffer time after detection stops
-                        if self.is_recording and self.video_writer:
-                            annotated_frame = self.detector.annotate_image(frame)
-                            self.video_writer.write(annotated_frame)
-
-                            # Stop recording after buffer time
-                            if time_since_last_detection > RECORDING_BUFFER_SECONDS:
-                                self._complete_recording()
-                                logger.info(f"Recording completed [Session: {self.recording_session_id}] after buffer time")
+                        # The DVR keeps recording; the clip ends after the buffer time
+                        if self.is_recording and time_since_last_detection > RECORDING_BUFFER_SECONDS:
+                            self._complete_recording()
+                            logger.info(f"Recording completed [Session: {self.recording_session_id}] after buffer time")
 
                         # COMPLETE RESET after grace period for totally fresh cycle
                         if time_since_last_detection > 5.0:
@@ -263,12 +533,58 @@ class CameraMonitor:
                         'timestamp': datetime.now().isoformat()
                     })
 
-                time.sleep(0.1)
+                # A degraded camera runs at its reduced (or guaranteed minimum) rate; an interval of 0 means no pacing
+                if MONITOR_FRAME_INTERVAL > 0:
+                    if self.qos.level(self.camera_id):
+                        time.sleep(1.0 / self.qos.fps(self.camera_id, 1.0 / MONITOR_FRAME_INTERVAL))
+                    else:
+                        time.sleep(MONITOR_FRAME_INTERVAL)
 
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
                 time.sleep(1)
 
+    def _process_violence(self, frame, current_time):
+        """Run the sliding-window violence stage on the same decoded frame"""
+        try:
+            record = self.violence_detector.process_frame('camera', frame, current_time)
+            if record is None:
+                return
+
+            record['timestamp'] = datetime.now().isoformat()
+            socketio.emit('violence_detection', record)
+
+            if record['event'] == 'started':
+                self._log_violence_alert(record)
+            elif record['event'] == 'ended':
+                logger.info(f"Violence event ended after {record['duration_seconds']:.1f}s")
+
+        except Exception as e:
+            logger.error(f"Violence detection error: {e}")
+
+    def _log_violence_alert(self, record):
+        try:
+            alert_data = {
+                'timestamp': record['timestamp'],
+                'alert_type': 'VIOLENCE_DETECTED',
+                'score': record['score'],
+                'peak_score': record['peak_score'],
+                'event_start': datetime.fromtimestamp(record['event_start']).isoformat(),
+                'window_start': datetime.fromtimestamp(record['window_start']).isoformat(),
+                'window_end': datetime.fromtimestamp(record['window_end']).isoformat()
+            }
+
+            log_filename = f"violence_alerts_{datetime.now().strftime('%Y%m%d')}.json"
+            log_path = os.path.join(LOGS_FOLDER, log_filename)
+            with open(log_path, 'a') as f:
+                f.write(json.dumps(alert_data) + '\n')
+            logger.warning(f"VIOLENCE ALERT: score {record['score']:.2f} at {alert_data['timestamp']}")
+
+            alert_outbox.enqueue('violence_alert', alert_data)
+
+        except Exception as e:
+            logger.error(f"Failed to log violence alert: {e}")
+
     def _log_weapon_alert(self, results, duration):
         try:
             alert_data = {
@@ -290,7 +606,7 @@ class CameraMonitor:
             # console
             logger.warning(f"WEAPON ALERT: Detected for {duration:.2f} seconds at {alert_data['timestamp']}")
 
-            socketio.emit('weapon_alert', alert_data)
+            alert_outbox.enqueue('weapon_alert', alert_data)
 
         except Exception as e:
             logger.error(f"Failed to log weapon alert: {e}")
@@ -300,78 +616,40 @@ class CameraMonitor:
         self._start_new_recording()
 
     def stop_recording(self):
-        """Stop video recording"""
-        try:
-            if not self.is_recording:
-                return
-
-            self.is_recording = False
-            if self.video_writer:
-                self.video_writer.release()
-                self.video_writer = None
-
-            logger.info(f"Recording stopped: {self.recording_filename}")
-
-            # Emit recording stopped event with file info
-            if self.recording_filename:
-                recording_path = os.path.join(RECORDINGS_FOLDER, self.recording_filename)
-                file_size = os.path.getsize(recording_path) if os.path.exists(recording_path) else 0
-
-                socketio.emit('recording_stopped', {
-                    'filename': self.recording_filename,
-                    'file_size': file_size,
-                    'timestamp': datetime.now().isoformat()
-                })
-
-            self.recording_filename = None
-
-        except Exception as e:
-            logger.error(f"Failed to stop recording: {e}")
+        """Stop video recording; the clip is assembled from DVR segments"""
+        self._complete_recording()
 
     def force_stop_recording(self):
         """Force stop recording with complete cleanup"""
         try:
-            self.is_recording = False
-            if self.video_writer:
-                self.video_writer.release()
-                self.video_writer = None
+            self._complete_recording()
             self.recording_filename = None
             logger.info("Recording force stopped and cleaned up")
         except Exception as e:
             logger.error(f"Failed to force stop recording: {e}")
 
     def _start_new_recording(self):
-        """Start completely new recording session"""
+        """Start completely new recording session: an open DVR clip with pre-roll from the segment ring"""
         try:
             # Force cleanup any existing recording
             self._complete_recording()
-            time.sleep(0.1)
 
             # Create new recording with session ID
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
             self.recording_filename = f"weapon_alert_{timestamp}_{self.recording_session_id}.mp4"
             recording_path = os.path.join(RECORDINGS_FOLDER, self.recording_filename)
 
-            # Get frame dimensions
-            height, width = self.frame_buffer[0].shape[:2] if self.frame_buffer else (480, 640)
-
-            # Initialize NEW video writer
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            self.video_writer = cv2.VideoWriter(recording_path, fourcc, 30.0, (width, height))
-
-            if not self.video_writer.isOpened():
-                raise Exception("Failed to open video writer")
-
-            # Write buffered frames (pre-alert footage)
-            for buffered_frame in self.frame_buffer:
-                annotated_frame = self.detector.annotate_image(buffered_frame)
-                self.video_writer.write(annotated_frame)
+            session_id = self.recording_session_id
+            clip_start = (self.weapon_detected_time or time.time()) - RECORDING_BUFFER_SECONDS
+            self.recording_clip_id = dvr.request_clip(
+                self.camera_id, clip_start, path=recording_path,
+                on_done=lambda clip: self._on_clip_ready(clip, session_id))
 
             self.is_recording = True
             logger.info(f"NEW recording session started: {self.recording_filename}")
 
             # Emit recording started event
-            socketio.emit('recording_started', {
+            publish_event('recording_started', {
                 'filename': self.recording_filename,
                 'session_id': self.recording_session_id,
                 'timestamp': datetime.now().isoformat()
@@ -388,27 +666,28 @@ class CameraMonitor:
                 return
 
             self.is_recording = False
-            if self.video_writer:
-                self.video_writer.release()
-                self.video_writer = None
-
-            logger.info(f"Recording session completed: {self.recording_filename}")
-
-            # Emit recording completed event
-            if self.recording_filename:
-                recording_path = os.path.join(RECORDINGS_FOLDER, self.recording_filename)
-                file_size = os.path.getsize(recording_path) if os.path.exists(recording_path) else 0
-
-                socketio.emit('recording_stopped', {
-                    'filename': self.recording_filename,
-                    'session_id': self.recording_session_id,
-                    'file_size': file_size,
-                    'timestamp': datetime.now().isoformat()
-                })
+            dvr.finish_clip(self.recording_clip_id)
+            self.recording_clip_id = None
+            logger.info(f"Recording session completed: {self.recording_filename} (assembling from DVR segments)")
 
         except Exception as e:
             logger.error(f"Failed to complete recording: {e}")
 
+    def _on_clip_ready(self, clip, session_id):
+        """Emit recording completed event once the DVR has written the clip"""
+        if clip['status'] != 'done':
+            logger.error(f"Recording {os.path.basename(clip['path'] or '')} failed: {clip.get('error')}")
+            return
+        index_recording(clip)
+        publish_event('recording_stopped', {
+            'filename': os.path.basename(clip['path']),
+            'session_id': session_id,
+            'file_size': clip['size'],
+            'clip_start': datetime.fromtimestamp(clip['clip_start']).isoformat(),
+            'clip_end': datetime.fromtimestamp(clip['clip_end']).isoformat(),
+            'timestamp': datetime.now().isoformat()
+        })
+
     def _reset_detection_state(self):
         """Completely reset detection state for fresh cycle"""
         try:
@@ -423,9 +702,6 @@ class CameraMonitor:
             self.recording_session_id = None
             self.recording_filename = None
 
-            # Clear frame buffer for fresh start
-            self.frame_buffer.clear()
-
             logger.info("Detection state COMPLETELY RESET - Ready for new cycle")
 
         except Exception as e:
@@ -434,14 +710,33 @@ class CameraMonitor:
     def get_status(self):
         return {
             'monitoring': self.is_monitoring,
-            'camera_connected': self.camera is not None and self.camera.isOpened() if self.camera else False,
+            'camera_connected': self.camera.connected if self.camera else False,
+            'capture': self.camera.stats() if self.camera else None,
+            'qos': self.qos.source_stats(self.camera_id) if self.camera else None,
             'weapon_detected': self.weapon_detected_time is not None,
             'detection_duration': time.time() - self.weapon_detected_time if self.weapon_detected_time else 0,
             'recording': self.is_recording,
-            'current_recording': self.recording_filename
+            'current_recording': self.recording_filename,
+            'violence_detection': self.violence_detector.get_status() if self.violence_detector else None
         }
 
-camera_monitor = CameraMonitor(detector)
+def install_model(new_model, path):
+    """Hot-swap the weapon model; calls already running finish on the old one"""
+    detector.model = new_model
+    detection_cache.clear()
+    batch_jobs.set_model_path(path)
+
+def on_pipeline_result(source_id, stage, timestamp, result, frame):
+    if stage == 'weapon':
+        detection_store.record(source_id, timestamp, result['detections'])
+        if frame is not None:
+            snapshot_cache.update(source_id, frame, result['detections'], timestamp)
+    socketio.emit('pipeline_detection', {
+        'source': source_id,
+        'stage': stage,
+        'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+        'result': result
+    })
 
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
@@ -465,6 +760,73 @@ def base64_to_image(base64_string):
         logger.error(f"Base64 decode error: {e}")
         return None
 
+def bytes_to_image(data):
+    try:
+        nparr = np.frombuffer(data, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    except Exception as e:
+        logger.error(f"Image decode error: {e}")
+        return None
+
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='decode')
+
+def collect_image_payloads(field):
+    """Gather (name, kind, payload) tuples from a multipart or JSON request without touching disk"""
+    payloads = []
+    if request.files:
+        for index, upload in enumerate(request.files.getlist(field)):
+            name = secure_filename(upload.filename or '') or f"image_{index}"
+            if upload.filename and not allowed_file(upload.filename):
+                payloads.append((name, 'invalid', None))
+                continue
+            payloads.append((name, 'bytes', upload.read()))
+    elif request.is_json:
+        data = request.get_json(silent=True)
+        items = data.get(field) if isinstance(data, dict) else None
+        if isinstance(items, str):
+            items = [items]
+        if not isinstance(items, list):
+            return payloads
+        for index, item in enumerate(items):
+            if isinstance(item, dict):
+                name = str(item.get('name') or f"image_{index}")
+                data = item.get('data', '')
+                payloads.append((name, 'base64', data) if isinstance(data, str) else (name, 'invalid', None))
+            elif isinstance(item, str):
+                payloads.append((f"image_{index}", 'base64', item))
+            else:
+                payloads.append((f"image_{index}", 'invalid', None))
+    return payloads
+
+def decode_payload(payload):
+    name, kind, data = payload
+    if kind == 'bytes':
+        return bytes_to_image(data)
+    if kind == 'base64':
+        return base64_to_image(data)
+    return None
+
+def request_flag(name):
+    value = request.args.get(name)
+    if value is None and request.form:
+        value = request.form.get(name)
+    if value is None and request.is_json:
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def detection_record(index, name, image, result, annotate):
+    record = {'index': index, 'name': name}
+    if image is None:
+        record['error'] = "Invalid or unsupported image"
+        return record
+
+    record.update(result)
+    record['width'], record['height'] = image.shape[1], image.shape[0]
+    if annotate and result.get('success'):
+        record['annotated_image'] = image_to_base64(detector.draw_detections(image, result['detections']))
+    return record
+
 def generate_frames():
     """Generate video frames for streaming"""
     try:
@@ -478,7 +840,7 @@ def generate_frames():
 
                 # Annotate frame with detections
                 try:
-                    annotated_frame = detector.annotate_image(frame)
+                    annotated_frame = detector.annotate_image(frame, camera_monitor.camera_id)
                 except Exception as e:
                     logger.warning(f"Frame annotation error: {e}")
                     annotated_frame = frame  # Use original frame if annotation fails
@@ -503,7 +865,7 @@ def generate_frames():
                        b'Content-Length: ' + str(len(frame_bytes)).encode() + b'\r\n\r\n' +
                        frame_bytes + b'\r\n')
 
-                time.sleep(0.033)  # ~30 FPS
+                time.sleep(STREAM_FRAME_INTERVAL)
 
             except Exception as e:
                 logger.error(f"Frame processing error: {e}")
@@ -521,21 +883,265 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "Safyra Weapon Detection API",
-        "model_loaded": model is not None,
+        "model_loaded": detector.model is not None,
+        "model_version": model_registry.live_id,
+        "violence_model_loaded": violence_detector is not None,
         "timestamp": datetime.now().isoformat()
     })
 
+# Image detection endpoints
+@app.route('/detect', methods=['POST'])
+def detect_image():
+    """Detect weapons in a single uploaded or base64 encoded image"""
+    try:
+        payloads = collect_image_payloads('image')
+        if not payloads:
+            return jsonify({"error": "No image provided"}), 400
+
+        name = payloads[0][0]
+        image = decode_payload(payloads[0])
+        if image is None:
+            return jsonify({"error": "Invalid or unsupported image"}), 400
+
+        tiled = request.args.get('tiled')
+        result = detector.detect_weapons(image, use_cache=True, camera_id=request.args.get('camera_id'),
+                                         tiled=None if tiled is None else tiled.lower() in ('1', 'true', 'yes'))
+        if 'error' in result:
+            return jsonify(result), 500
+
+        return jsonify(detection_record(0, name, image, result, request_flag('annotate')))
+
+    except Exception as e:
+        logger.error(f"Detect image error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_image_batch():
+    """Detect weapons in many images, streaming one NDJSON record per image"""
+    try:
+        payloads = collect_image_payloads('images')
+        if not payloads:
+            return jsonify({"error": "No images provided"}), 400
+        annotate = request_flag('annotate')
+
+    except Exception as e:
+        logger.error(f"Detect batch error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def generate_results():
+        total_detections = 0
+        failed = 0
+        started = time.time()
+
+        for start in range(0, len(payloads), DETECT_BATCH_SIZE):
+            chunk = payloads[start:start + DETECT_BATCH_SIZE]
+            images = list(decode_pool.map(decode_payload, chunk))
+
+            valid = [i for i, image in enumerate(images) if image is not None]
+            results = dict(zip(valid, detector.detect_batch([images[i] for i in valid], use_cache=True)))
+
+            for offset, (name, _, _) in enumerate(chunk):
+                record = detection_record(start + offset, name, images[offset], results.get(offset, {}), annotate)
+                total_detections += record.get('count', 0)
+                failed += 'error' in record
+                yield json.dumps(record) + '\n'
+
+            # Drop decoded frames before the next chunk
+            del images, results
+
+        yield json.dumps({
+            'summary': True,
+            'images': len(payloads),
+            'failed': failed,
+            'detections': total_detections,
+            'elapsed_seconds': round(time.time() - started, 3)
+        }) + '\n'
+
+    return Response(generate_results(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/detect/cache', methods=['GET'])
+def get_detection_cache_stats():
+    """Hit/miss metrics for the detection result cache"""
+    return jsonify({"success": True, "cache": detection_cache.stats()})
+
+@app.route('/detect/cache', methods=['DELETE'])
+def clear_detection_cache():
+    """Drop all cached detection results"""
+    detection_cache.clear()
+    return jsonify({"success": True, "cache": detection_cache.stats()})
+
+# Model registry endpoints
+def resolve_model_path(name):
+    """Absolute weights path inside the models folder or next to the base model, else None"""
+    path = os.path.abspath(name if os.path.isabs(name) else os.path.join(MODELS_FOLDER, name))
+    for folder in (MODELS_FOLDER, os.path.dirname(MODEL_PATH)):
+        folder = os.path.abspath(folder)
+        if os.path.commonpath([path, folder]) == folder:
+            return path
+    return None
+
+@app.route('/models', methods=['GET'])
+def get_models():
+    """Live, standby and candidate weapon model versions with shadow metrics"""
+    return jsonify({"success": True, **model_registry.status()})
+
+@app.route('/models', methods=['POST'])
+def load_model_version():
+    """Load weights in the background: {"path", "shadow_fraction", "promote"}; paths are relative to the models folder"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('path'):
+            return jsonify({"error": "path is required"}), 400
+        path = resolve_model_path(str(data['path']))
+        if path is None:
+            return jsonify({"error": "Model files must be inside the models folder"}), 400
+        try:
+            shadow_fraction = float(data.get('shadow_fraction', 0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "shadow_fraction must be a number"}), 400
+        version = model_registry.stage(path, shadow_fraction=shadow_fraction,
+                                       promote=bool(data.get('promote', False)))
+        return jsonify({"success": True, "version": version}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Load model version error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/models/<version_id>/shadow', methods=['POST'])
+def shadow_model_version(version_id):
+    """Run a loaded version on a fraction of live frames: {"fraction": 0.1}; 0 stops shadowing"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            fraction = float(data.get('fraction', 0.1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "fraction must be a number"}), 400
+        version = model_registry.start_shadow(version_id, fraction)
+        return jsonify({"success": True, "version": version, "shadow": model_registry.shadow_id})
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/models/<version_id>/promote', methods=['POST'])
+def promote_model_version(version_id):
+    """Swap a loaded version in as the live model"""
+    try:
+        return jsonify({"success": True, "version": model_registry.promote(version_id)})
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logger.error(f"Promote model error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback_model_version():
+    """Swap the previous live version back in"""
+    try:
+        return jsonify({"success": True, "version": model_registry.rollback()})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        logger.error(f"Rollback model error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/models/<version_id>', methods=['DELETE'])
+def unload_model_version(version_id):
+    """Free the memory of a candidate or standby version"""
+    try:
+        return jsonify({"success": True, "version": model_registry.unload(version_id)})
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+# ROI mask endpoints
+@app.route('/roi', methods=['GET'])
+def list_roi_masks():
+    """ROI polygons for every camera"""
+    return jsonify({"success": True, "roi": roi_masks.all()})
+
+@app.route('/roi/<camera_id>', methods=['PUT'])
+def set_roi_mask(camera_id):
+    """Set a camera's ROI as normalised polygons: {"polygons": [[[x, y], ...], ...]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        polygons = roi_masks.set(camera_id, data.get('polygons'))
+        return jsonify({"success": True, "camera_id": camera_id, "polygons": polygons})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Set ROI mask error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/roi/<camera_id>', methods=['DELETE'])
+def delete_roi_mask(camera_id):
+    """Remove a camera's ROI so the whole frame is analysed again"""
+    if not roi_masks.remove(camera_id):
+        return jsonify({"error": "No ROI for this camera"}), 404
+    return jsonify({"success": True, "camera_id": camera_id})
+
+@app.route('/roi/<camera_id>/tiles', methods=['GET'])
+def get_roi_tiles(camera_id):
+    """Tile plan the camera's ROI produces for a frame size, e.g. ?width=3840&height=2160"""
+    try:
+        width = int(request.args.get('width', 3840))
+        height = int(request.args.get('height', 2160))
+        if not (0 < width <= 16384 and 0 < height <= 16384):
+            return jsonify({"error": "Invalid frame size"}), 400
+        tiles = roi_masks.plan(camera_id, width, height)
+        return jsonify({
+            "success": True,
+            "camera_id": camera_id,
+            "tiled": TILED_INFERENCE_ENABLED and max(width, height) >= TILING_MIN_SIDE,
+            "tile_count": len(tiles),
+            "tiles": tiles.tolist()
+        })
+    except ValueError:
+        return jsonify({"error": "width and height must be integers"}), 400
+    except Exception as e:
+        logger.error(f"Get ROI tiles error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # Camera monitoring endpoints
+def parse_qos_args(data):
+    """(priority, min_fps) from a request body; ValueError unless min_fps is a positive number"""
+    try:
+        priority = int(data.get('priority', 0))
+        min_fps = float(data.get('min_fps', QOS_DEFAULT_MIN_FPS))
+    except (TypeError, ValueError):
+        raise ValueError("priority must be an integer and min_fps a number")
+    if not math.isfinite(min_fps) or min_fps <= 0:
+        raise ValueError("min_fps must be greater than 0")
+    return priority, min_fps
+
 @app.route('/camera/start', methods=['POST'])
 def start_camera_monitoring():
     try:
         data = request.get_json() if request.is_json else {}
-        camera_index = data.get('camera_index', 0)
+        camera_index = data.get('source', data.get('camera_index', 0))
+        backend = data.get('backend', 'auto')
+        if backend != 'auto' and backend not in CAPTURE_BACKENDS:
+            return jsonify({"error": f"Unknown capture backend; use auto or one of {sorted(CAPTURE_BACKENDS)}"}), 400
+        try:
+            priority, min_fps = parse_qos_args(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         if camera_monitor.is_monitoring:
             return jsonify({"error": "Camera monitoring is already running"}), 400
 
-        success = camera_monitor.start_monitoring(camera_index)
+        success = camera_monitor.start_monitoring(
+            camera_index,
+            backend=backend,
+            camera_id=data.get('camera_id'),
+            priority=priority,
+            min_fps=min_fps
+        )
         if success:
             return jsonify({
                 "success": True,
@@ -608,6 +1214,43 @@ def video_stream():
         logger.error(f"Video stream error: {e}")
         return jsonify({"error": f"Video stream failed: {str(e)}"}), 500
 
+# Snapshot endpoints
+@app.route('/cameras', methods=['GET'])
+def list_camera_snapshots():
+    """Cameras and pipeline sources with a snapshot, and the snapshot cache counters"""
+    return jsonify({"success": True, "cameras": snapshot_cache.cameras(), "cache": snapshot_cache.stats()})
+
+@app.route('/cameras/<camera_id>/snapshot.jpg', methods=['GET'])
+def get_camera_snapshot(camera_id):
+    """Most recent annotated frame: ?size=thumb|medium|full, with ETag / If-None-Match support"""
+    try:
+        size = request.args.get('size', 'medium')
+        if size not in SNAPSHOT_SIZES:
+            return jsonify({"error": f"Unknown size; use one of {sorted(SNAPSHOT_SIZES)}"}), 400
+
+        headers = {'Cache-Control': f'max-age={SNAPSHOT_MAX_AGE}'}
+        etag = snapshot_cache.etag(camera_id, size)
+        if etag is None:
+            return jsonify({"error": "No snapshot for this camera"}), 404
+        if etag in request.headers.get('If-None-Match', ''):
+            snapshot_cache.record_not_modified()
+            return Response(status=304, headers={**headers, 'ETag': etag})
+
+        snapshot = snapshot_cache.get(camera_id, size)
+        if snapshot is None:
+            return jsonify({"error": "No snapshot for this camera"}), 404
+        jpeg, etag, timestamp = snapshot
+        return Response(jpeg, mimetype='image/jpeg', headers={
+            **headers,
+            'ETag': etag,
+            'Last-Modified': http_date(timestamp),
+            'X-Snapshot-Age': f"{max(time.time() - timestamp, 0):.2f}"
+        })
+
+    except Exception as e:
+        logger.error(f"Get camera snapshot error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/logs/weapon-alerts', methods=['GET'])
 def get_weapon_alert_logs():
     try:
@@ -661,6 +1304,116 @@ def get_weapon_alert_summary():
         logger.error(f"Get weapon alert summary error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Detection history endpoints
+def parse_time_arg(name, default, source=None):
+    """Epoch seconds or ISO 8601 query argument (or field of `source`)"""
+    value = (request.args if source is None else source).get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/history/detections', methods=['GET'])
+def get_detection_history():
+    """Activity histogram: ?start=&end=&bucket=<seconds>&camera=<id> (defaults to the last 24 hours by hour)"""
+    try:
+        started = time.perf_counter()
+        end = parse_time_arg('end', time.time())
+        start = parse_time_arg('start', end - 24 * 3600)
+        bucket = int(request.args.get('bucket', 3600))
+        if end <= start or bucket <= 0:
+            return jsonify({"error": "end must be after start and bucket positive"}), 400
+        if (end - start) / bucket > HISTORY_MAX_BUCKETS:
+            return jsonify({"error": f"Too many buckets; use a bucket of at least "
+                                     f"{int((end - start) // HISTORY_MAX_BUCKETS) + 1} seconds"}), 400
+
+        histogram = detection_store.histogram(start, end, bucket, camera_id=request.args.get('camera'))
+        return jsonify({
+            "success": True,
+            "camera": request.args.get('camera'),
+            **histogram,
+            "query_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Get detection history error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/history/detections/events', methods=['GET'])
+def get_detection_events():
+    """Individual detections: ?start=&end=&camera=&class=&limit= (defaults to the last hour)"""
+    try:
+        end = parse_time_arg('end', time.time())
+        start = parse_time_arg('start', end - 3600)
+        limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+        events = detection_store.events(start, end, camera_id=request.args.get('camera'),
+                                        class_name=request.args.get('class'), limit=limit)
+        return jsonify({"success": True, "events": events, "count": len(events)})
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Get detection events error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/history/cameras', methods=['GET'])
+def get_history_cameras():
+    """Cameras and classes present in the detection history"""
+    cameras, classes = detection_store.list_cameras()
+    return jsonify({"success": True, "cameras": sorted(cameras), "classes": sorted(classes)})
+
+# DVR endpoints
+@app.route('/dvr', methods=['GET'])
+def get_dvr_status():
+    """Segment ring per camera, pending and recent clip exports"""
+    return jsonify({"success": True, "dvr": dvr.stats()})
+
+@app.route('/dvr/<camera_id>/segments', methods=['GET'])
+def get_dvr_segments(camera_id):
+    """Segments on disk for a camera: ?start=&end="""
+    try:
+        segments = dvr.segments(camera_id, parse_time_arg('start', None), parse_time_arg('end', None))
+        return jsonify({"success": True, "camera_id": camera_id, "segments": segments, "count": len(segments)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/dvr/<camera_id>/clips', methods=['POST'])
+def create_dvr_clip(camera_id):
+    """Cut a clip from the segment ring into the recordings folder: {"start": ..., "end": ...}"""
+    try:
+        data = request.get_json() if request.is_json else {}
+        end = parse_time_arg('end', time.time(), data)
+        start = parse_time_arg('start', end - RECORDING_BUFFER_SECONDS, data)
+        if end <= start:
+            return jsonify({"error": "end must be after start"}), 400
+
+        filename = secure_filename(f"dvr_{camera_id}_{datetime.fromtimestamp(start).strftime('%Y%m%d_%H%M%S')}"
+                                   f"_{int(end - start)}s.mp4")
+        clip_id = dvr.request_clip(camera_id, start, end, path=os.path.join(RECORDINGS_FOLDER, filename),
+                                   on_done=index_recording)
+        return jsonify({"success": True, "clip_id": clip_id, "filename": filename,
+                        "status_url": f"/dvr/clips/{clip_id}"}), 202
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Create DVR clip error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/dvr/clips/<clip_id>', methods=['GET'])
+def get_dvr_clip(clip_id):
+    """Export status of a clip; `done` clips are downloadable from /recordings"""
+    clip = dvr.get_clip(clip_id)
+    if clip is None:
+        return jsonify({"error": "Clip not found"}), 404
+    if clip['status'] == 'done':
+        clip['download_url'] = f"/recordings/download/{os.path.basename(clip['path'])}"
+    return jsonify({"success": True, "clip": clip})
+
 # Recording management endpoints
 @app.route('/recordings', methods=['GET'])
 def get_recordings():
@@ -680,6 +1433,8 @@ def get_recordings():
                         'modified_at': datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
                         'download_url': f'/recordings/download/{filename}'
                     }
+                    if os.path.exists(index_path(file_path)):
+                        recording_info['index_url'] = f'/recordings/index/{filename}'
                     recordings.append(recording_info)
 
         # Sort by creation date (newest first)
@@ -803,6 +1558,8 @@ def delete_recording(filename):
             return jsonify({"error": "Recording not found"}), 404
 
         os.remove(file_path)
+        if os.path.exists(index_path(file_path)):
+            os.remove(index_path(file_path))
         logger.info(f"Recording deleted: {filename}")
 
         return jsonify({
@@ -846,29 +1603,710 @@ def stream_recording(filename):
         logger.error(f"Stream recording error: {e}")
         return jsonify({"error": str(e)}), 500
 
+def load_recording_index(filename):
+    """(video path, RecordingIndex) or a Flask error response"""
+    if not filename.endswith('.mp4') or '..' in filename or '/' in filename:
+        return None, (jsonify({"error": "Invalid filename"}), 400)
+    file_path = os.path.join(RECORDINGS_FOLDER, filename)
+    if not os.path.exists(file_path):
+        return None, (jsonify({"error": "Recording not found"}), 404)
+    if not os.path.exists(index_path(file_path)):
+        return None, (jsonify({"error": "Recording has no detection index"}), 404)
+    return (file_path, RecordingIndex.load(index_path(file_path))), None
+
+def recording_frame_arg(index):
+    """?frame=N or ?t=<seconds into the clip>; defaults to the most confident detection"""
+    if request.args.get('frame') is not None:
+        return min(max(int(request.args['frame']), 0), len(index.frame_times) - 1)
+    if request.args.get('t') is not None:
+        return index.frame_at(float(request.args['t']))
+    if len(index.detections):
+        return int(index.detections[index.detections['conf'].argmax()]['frame'])
+    return 0
+
+@app.route('/recordings/index/<filename>', methods=['GET'])
+def get_recording_index(filename):
+    """Detection timeline of a recording with keyframe byte ranges to seek to"""
+    try:
+        loaded, error = load_recording_index(filename)
+        if error:
+            return error
+        return jsonify({"success": True, "filename": filename, **loaded[1].timeline()})
+    except Exception as e:
+        logger.error(f"Get recording index error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recordings/still/<filename>', methods=['GET'])
+def get_recording_still(filename):
+    """JPEG of one frame (?frame= or ?t=), decoded from the nearest keyframe; ?annotate=false for the raw frame"""
+    try:
+        loaded, error = load_recording_index(filename)
+        if error:
+            return error
+        file_path, index = loaded
+        frame = recording_frame_arg(index)
+        image = extract_still(file_path, index, frame)
+        if request.args.get('annotate', 'true').lower() not in ('0', 'false', 'no'):
+            image = detector.draw_detections(image, index.detections_at(frame))
+        _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_JPEG_QUALITY])
+        return Response(buffer.tobytes(), mimetype='image/jpeg', headers={'X-Frame': str(frame)})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Get recording still error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/recordings/highlight/<filename>', methods=['GET'])
+def get_recording_highlight(filename):
+    """Short sub-clip around a frame (?frame= or ?t=, ?before=2&after=2 seconds), cut from the nearest keyframe"""
+    try:
+        loaded, error = load_recording_index(filename)
+        if error:
+            return error
+        file_path, index = loaded
+        frame = recording_frame_arg(index)
+        before = float(request.args.get('before', 2))
+        after = float(request.args.get('after', 2))
+        if before < 0 or after < 0 or before + after > HIGHLIGHT_MAX_SECONDS:
+            return jsonify({"error": f"before and after must be non-negative and total at most "
+                                     f"{HIGHLIGHT_MAX_SECONDS}s"}), 400
+
+        start_frame = max(frame - int(before * index.fps), 0)
+        end_frame = min(frame + int(after * index.fps), len(index.frame_times) - 1)
+        os.makedirs(HIGHLIGHTS_FOLDER, exist_ok=True)
+        output = os.path.join(HIGHLIGHTS_FOLDER, f"{filename[:-4]}_{start_frame}_{end_frame}.mp4")
+        if not os.path.exists(output) or os.path.getmtime(output) < os.path.getmtime(file_path):
+            extract_subclip(file_path, index, start_frame, end_frame, output, ffmpeg=FFMPEG_BINARY)
+        # send_file resolves relative paths against the app root, not the working directory
+        return send_file(os.path.abspath(output), mimetype='video/mp4', download_name=os.path.basename(output))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Get recording highlight error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Batch analysis endpoints
+@app.route('/jobs/analyze', methods=['POST'])
+def create_analysis_job():
+    """Queue archived video files or directories for offline weapon detection"""
+    try:
+        data = request.get_json() if request.is_json else {}
+        paths = data.get('paths') or ([data['path']] if data.get('path') else [])
+        if not paths:
+            return jsonify({"error": "No video paths provided"}), 400
+
+        options = {
+            'recursive': bool(data.get('recursive', True)),
+            'frame_stride': int(data.get('frame_stride', 1)),
+            'conf': float(data.get('conf', 0.25)),
+            'batch_size': int(data.get('batch_size', 8)),
+            'clips': bool(data.get('clips', True)),
+            'clip_padding_seconds': float(data.get('clip_padding_seconds', 3.0)),
+            'clip_gap_seconds': float(data.get('clip_gap_seconds', 2.0))
+        }
+
+        job_id, error = batch_jobs.submit(paths, options)
+        if job_id is None:
+            return jsonify({"error": error}), 400
+
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}",
+            "job": batch_jobs.get_job(job_id)
+        }), 202
+
+    except Exception as e:
+        logger.error(f"Create analysis job error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs', methods=['GET'])
+def list_analysis_jobs():
+    """List batch analysis jobs"""
+    jobs = batch_jobs.list_jobs()
+    return jsonify({"success": True, "jobs": jobs, "count": len(jobs)})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Job progress plus detections found since the `since` cursor"""
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+        job = batch_jobs.get_job(job_id, since)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify({"success": True, "job": job})
+
+    except Exception as e:
+        logger.error(f"Get analysis job error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>/stream', methods=['GET'])
+def stream_analysis_job(job_id):
+    """Stream job progress and new detections as NDJSON until the job ends"""
+    if batch_jobs.get_job(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate_updates():
+        since = 0
+        while True:
+            job = batch_jobs.get_job(job_id, since)
+            for result in job['results']:
+                yield json.dumps({'type': 'detection', **result}) + '\n'
+            since = job['next_since']
+            yield json.dumps({'type': 'progress', 'status': job['status'], 'progress': job['progress']}) + '\n'
+            if job['status'] != 'running':
+                yield json.dumps({'type': 'done', 'status': job['status'], 'clips': job['clips'],
+                                  'errors': job['errors']}) + '\n'
+                break
+            time.sleep(1)
+
+    return Response(generate_updates(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_analysis_job(job_id):
+    """Cancel a running batch analysis job"""
+    if not batch_jobs.cancel(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"success": True, "job": batch_jobs.get_job(job_id)})
+
+@app.route('/jobs/<job_id>/clips/<filename>', methods=['GET'])
+def download_job_clip(job_id, filename):
+    """Download a clip cut around detections by a batch job"""
+    try:
+        if not filename.endswith('.mp4') or '..' in filename or '/' in filename:
+            return jsonify({"error": "Invalid filename"}), 400
+
+        clip_path = batch_jobs.clip_path(job_id, filename)
+        if clip_path is None or not os.path.exists(clip_path):
+            return jsonify({"error": "Clip not found"}), 404
+
+        with open(clip_path, 'rb') as f:
+            data = f.read()
+        return Response(data, headers={
+            'Content-Type': 'video/mp4',
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+
+    except Exception as e:
+        logger.error(f"Download job clip error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Alert delivery endpoints
+@app.route('/alerts/targets', methods=['GET'])
+def list_alert_targets():
+    """Configured delivery targets (the dashboard plus webhooks)"""
+    return jsonify({"success": True, "targets": alert_outbox.list_targets()})
+
+@app.route('/alerts/targets', methods=['POST'])
+def add_alert_target():
+    """Add or replace a webhook target: {"name", "url", "headers", "kinds", "max_concurrency", "max_attempts"}"""
+    try:
+        config = request.get_json(silent=True) or {}
+        if config.get('name') == 'dashboard':
+            return jsonify({"error": "The dashboard target cannot be replaced"}), 400
+        target = target_from_config(config)
+        alert_outbox.add_target(target)
+        alert_target_configs[target.name] = config
+        save_alert_targets()
+        return jsonify({"success": True, "target": target.describe()}), 201
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Add alert target error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/alerts/targets/<name>', methods=['DELETE'])
+def delete_alert_target(name):
+    """Remove a webhook target; its pending deliveries are marked failed"""
+    if name == 'dashboard' or name not in alert_target_configs:
+        return jsonify({"error": "Target not found"}), 404
+    alert_outbox.remove_target(name)
+    del alert_target_configs[name]
+    save_alert_targets()
+    return jsonify({"success": True, "name": name})
+
+@app.route('/alerts/outbox', methods=['GET'])
+def get_alert_outbox():
+    """Recent deliveries, optionally filtered by ?status=pending|inflight|delivered|failed"""
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        deliveries = alert_outbox.list_deliveries(request.args.get('status'), limit)
+        return jsonify({"success": True, "deliveries": deliveries, "count": len(deliveries)})
+    except Exception as e:
+        logger.error(f"Get alert outbox error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/alerts/outbox/metrics', methods=['GET'])
+def get_alert_outbox_metrics():
+    """Per-target queue depth, in-flight count, outcomes and delivery latency percentiles"""
+    try:
+        return jsonify({"success": True, **alert_outbox.get_metrics()})
+    except Exception as e:
+        logger.error(f"Get alert outbox metrics error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/alerts/outbox/<int:delivery_id>/retry', methods=['POST'])
+def retry_alert_delivery(delivery_id):
+    """Re-queue a failed delivery"""
+    if not alert_outbox.retry(delivery_id):
+        return jsonify({"error": "No failed delivery with this id"}), 404
+    return jsonify({"success": True, "delivery_id": delivery_id})
+
+# Analytics pipeline endpoints
+@app.route('/pipeline/sources', methods=['POST'])
+def add_pipeline_source():
+    """Start decoding a camera index, stream URL or video file through all pipeline stages"""
+    try:
+        data = request.get_json() if request.is_json else {}
+        source = data.get('source')
+        if source is None or source == '':
+            return jsonify({"error": "No source provided"}), 400
+        if not analytics_pipeline.stages:
+            return jsonify({"error": "No models loaded for the pipeline"}), 503
+
+        backend = data.get('backend', 'auto')
+        if backend != 'auto' and backend not in CAPTURE_BACKENDS:
+            return jsonify({"error": f"Unknown capture backend; use auto or one of {sorted(CAPTURE_BACKENDS)}"}), 400
+        try:
+            priority, min_fps = parse_qos_args(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        source_id, error = analytics_pipeline.add_source(
+            source,
+            source_id=data.get('source_id'),
+            loop=bool(data.get('loop', False)),
+            realtime=bool(data.get('realtime', True)),
+            backend=backend,
+            reconnect_max=CAPTURE_RECONNECT_MAX_SECONDS,
+            priority=priority,
+            min_fps=min_fps
+        )
+        if source_id is None:
+            return jsonify({"error": error}), 400
+
+        return jsonify({"success": True, "source_id": source_id}), 201
+
+    except Exception as e:
+        logger.error(f"Add pipeline source error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/pipeline/sources/<source_id>', methods=['DELETE'])
+def remove_pipeline_source(source_id):
+    """Stop a pipeline source"""
+    if not analytics_pipeline.remove_source(source_id):
+        return jsonify({"error": "Source not found"}), 404
+    snapshot_cache.remove(source_id)
+    return jsonify({"success": True, "source_id": source_id})
+
+@app.route('/pipeline/status', methods=['GET'])
+def get_pipeline_status():
+    """Per-source decode rates, per-stage costs and scheduler state"""
+    try:
+        return jsonify({"success": True, "pipeline": analytics_pipeline.get_status()})
+    except Exception as e:
+        logger.error(f"Get pipeline status error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/pipeline/alerts', methods=['GET'])
+def get_pipeline_alerts():
+    """Unified alerts from all stages after the `since` sequence number"""
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+        alerts, last_seq = pipeline_alerts.since(since, limit)
+        next_since = alerts[-1]['seq'] if alerts else since
+        return jsonify({
+            "success": True,
+            "alerts": alerts,
+            "count": len(alerts),
+            "next_since": next_since,
+            "last_seq": last_seq
+        })
+    except Exception as e:
+        logger.error(f"Get pipeline alerts error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/alerts/edge', methods=['POST'])
+def receive_edge_alert():
+    """Weapon alert forwarded by a standalone edge detector (Hardware-utilities/weapon/main.py)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
+        source_id = str(data.get('source_id') or '')
+        if not source_id:
+            return jsonify({"error": "No source_id provided"}), 400
+        detections = data.get('detections') or []
+        if not isinstance(detections, list):
+            return jsonify({"error": "detections must be a list"}), 400
+        now = time.time()
+        try:
+            timestamp = float(data.get('timestamp', now))
+        except (TypeError, ValueError):
+            timestamp = now
+        if not math.isfinite(timestamp) or not 0 < timestamp <= now + EDGE_MAX_CLOCK_SKEW_SECONDS:
+            logger.warning(f"Edge alert from {source_id} has implausible timestamp {timestamp}; using server time")
+            timestamp = now
+
+        published = pipeline_alerts.publish(f"edge:{source_id}", 'edge_weapon', timestamp, {
+            'type': 'WEAPON_DETECTED',
+            'severity': 'high',
+            'duration_seconds': data.get('duration_seconds'),
+            'detections': detections,
+            'detection_count': len(detections)
+        })
+        return jsonify({"success": True, "seq": published[0]['seq']}), 201
+
+    except Exception as e:
+        logger.error(f"Receive edge alert error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Voice SOS ingestion endpoints
+def sos_error_response(e):
+    response = jsonify({"error": str(e), **e.extra})
+    response.status_code = e.status
+    if 'retry_after' in e.extra:
+        response.headers['Retry-After'] = str(e.extra['retry_after'])
+    return response
+
+def parse_sos_metadata(value):
+    if isinstance(value, dict):
+        return value
+    try:
+        metadata = json.loads(value) if value else {}
+        return metadata if isinstance(metadata, dict) else {}
+    except ValueError:
+        return {}
+
+@app.route('/sos/audio', methods=['POST'])
+def upload_sos_audio():
+    """Single-request upload: multipart `audio` file plus `device_id` and JSON `metadata` fields"""
+    try:
+        if 'audio' not in request.files:
+            return jsonify({"error": "No audio file provided"}), 400
+
+        upload = request.files['audio']
+        result = sos_store.store_file(
+            request.form.get('device_id'),
+            upload.filename,
+            upload.read(),
+            parse_sos_metadata(request.form.get('metadata'))
+        )
+        if not result['duplicate']:
+            publish_event('sos_audio', result['recording'])
+        return jsonify({"success": True, **result}), 200 if result['duplicate'] else 201
+
+    except UploadError as e:
+        return sos_error_response(e)
+    except Exception as e:
+        logger.error(f"SOS upload error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sos/audio/check', methods=['POST'])
+def check_sos_audio():
+    """Which of a batch of content hashes the server already has"""
+    try:
+        data = request.get_json(silent=True) if request.is_json else {}
+        if not isinstance(data, dict):
+            raise UploadError("Request body must be a JSON object")
+        known = sos_store.known_hashes(data.get('hashes') or [])
+        return jsonify({"success": True, "known": sorted(known)})
+
+    except UploadError as e:
+        return sos_error_response(e)
+    except Exception as e:
+        logger.error(f"Check SOS audio error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sos/audio/uploads', methods=['POST'])
+def create_sos_upload():
+    """Start or resume a chunked upload (`device_id`, `filename`, `size`, `sha256`, `metadata`)"""
+    try:
+        data = request.get_json(silent=True) if request.is_json else {}
+        if not isinstance(data, dict):
+            raise UploadError("Request body must be a JSON object")
+        result = sos_store.create_upload(
+            data.get('device_id'),
+            data.get('filename'),
+            data.get('size', 0),
+            data.get('sha256'),
+            parse_sos_metadata(data.get('metadata'))
+        )
+        if result['complete']:
+            return jsonify({"success": True, **result})
+        return jsonify({"success": True, **result,
+                        "upload_url": f"/sos/audio/uploads/{result['upload_id']}"}), 201
+
+    except UploadError as e:
+        return sos_error_response(e)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid upload request: {e}"}), 400
+    except Exception as e:
+        logger.error(f"Create SOS upload error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sos/audio/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def get_sos_upload(upload_id):
+    """Current offset of a resumable upload"""
+    upload = sos_store.get_upload(upload_id)
+    if upload is None:
+        return jsonify({"error": "Upload not found"}), 404
+    response = jsonify({"success": True, **upload})
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    return response
+
+@app.route('/sos/audio/uploads/<upload_id>', methods=['PATCH', 'PUT'])
+def append_sos_upload(upload_id):
+    """Append the request body at the `Upload-Offset` header position"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', -1))
+        if offset < 0:
+            return jsonify({"error": "Upload-Offset header required"}), 400
+
+        result = sos_store.append_chunk(upload_id, offset, request.stream, request.content_length)
+        if result['complete'] and not result['duplicate']:
+            publish_event('sos_audio', result['recording'])
+
+        response = jsonify({"success": True, **result})
+        if not result['complete']:
+            response.headers['Upload-Offset'] = str(result['offset'])
+        return response
+
+    except UploadError as e:
+        return sos_error_response(e)
+    except Exception as e:
+        logger.error(f"SOS chunk upload error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sos/audio', methods=['GET'])
+def list_sos_audio():
+    """Indexed SOS recordings, newest first"""
+    try:
+        recordings = sos_store.list_recordings(
+            device_id=request.args.get('device_id'),
+            since=request.args.get('since'),
+            limit=min(max(int(request.args.get('limit', 100)), 1), 1000)
+        )
+        return jsonify({"success": True, "recordings": recordings, "count": len(recordings)})
+    except Exception as e:
+        logger.error(f"List SOS audio error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/sos/audio/<sha256>/download', methods=['GET'])
+def download_sos_audio(sha256):
+    """Download a stored SOS recording"""
+    recording = sos_store.get_recording(sha256)
+    path = sos_store.recording_path(sha256) if recording else None
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": "Recording not found"}), 404
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    mimetype = 'audio/mpeg' if path.endswith('.mp3') else 'audio/wav' if path.endswith('.wav') else 'application/octet-stream'
+    return Response(data, headers={
+        'Content-Type': mimetype,
+        'Content-Disposition': f'attachment; filename="{recording["filename"]}"'
+    })
+
+# Event journal endpoints
+def replay_batch(since, limit=EVENT_REPLAY_LIMIT):
+    """Missed events after `since`; None (a fresh client) only reports the current position"""
+    if since is None:
+        return {'events': [], 'last_seq': event_journal.last_seq, 'has_more': False, 'reset': False}
+    return event_journal.since(int(since), max(1, min(int(limit), EVENT_REPLAY_LIMIT)))
+
+@app.route('/events', methods=['GET'])
+def get_events():
+    """Journaled events after ?since=N (alerts, recordings, SOS uploads), oldest first"""
+    try:
+        batch = replay_batch(request.args.get('since', 0), request.args.get('limit', EVENT_REPLAY_LIMIT))
+        return jsonify({"success": True, **batch})
+    except ValueError:
+        return jsonify({"error": "since and limit must be integers"}), 400
+
+@app.route('/events/stats', methods=['GET'])
+def get_event_journal_stats():
+    """Journal position and how far back replay can reach"""
+    return jsonify({"success": True, "journal": event_journal.stats()})
+
 # WebSocket events
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection"""
+def handle_connect(auth=None):
+    """Handle client connection; `{"since": N}` as auth (or ?since=N) replays missed events"""
     logger.info("Client connected to WebSocket")
     emit('status', camera_monitor.get_status())
+    since = (auth or {}).get('since') if isinstance(auth, dict) else None
+    if since is None:
+        since = request.args.get('since')
+    try:
+        emit('replay', replay_batch(since))
+    except ValueError:
+        emit('replay', replay_batch(None))
+
+@socketio.on('resume')
+def handle_resume(data):
+    """Replay events after `since` to this client only; repeat while `has_more`"""
+    try:
+        emit('replay', replay_batch((data or {}).get('since', 0)))
+    except (ValueError, AttributeError):
+        emit('replay', {'error': 'since must be an integer'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     logger.info("Client disconnected from WebSocket")
 
+# Service construction
+services_started = False
+
+def create_app():
+    """
+    Build the models, stores and background workers and return the Flask app.
+    Importing this module has no side effects, so processes that re-import it
+    (spawned batch workers, the debug reloader's watcher) do not open the
+    outbox, DVR, journals or stores a second time.
+    """
+    global model, model_registry, event_journal, alert_outbox, alert_target_configs
+    global detection_store, dvr, detection_cache, roi_masks, detector, snapshot_cache
+    global violence_detector, violence_service, qos_controller, camera_monitor, batch_jobs
+    global sos_store, pipeline_alerts, analytics_pipeline, services_started
+    if services_started:
+        return app
+    services_started = True
+
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    os.makedirs(LOGS_FOLDER, exist_ok=True)
+    os.makedirs(RECORDINGS_FOLDER, exist_ok=True)
+
+    # Starts on the last promoted version, or MODEL_PATH on first run
+    model_registry = ModelRegistry(MODELS_FOLDER, loader=YOLO, warmup_runs=MODEL_WARMUP_RUNS,
+                                   shadow_iou=MODEL_SHADOW_IOU)
+    try:
+        model = model_registry.load_initial(MODEL_PATH)
+        logger.info("YOLO model loaded successfully")
+    except Exception as e:
+        logger.error(f"Failed to load YOLO model: {e}")
+        model = None
+
+    # Discrete dashboard events are journaled so reconnecting clients can replay what they missed
+    event_journal = EventJournal(EVENTS_FOLDER, max_events=EVENT_JOURNAL_MAX_EVENTS)
+
+    # Alert outbox: detection threads enqueue, delivery workers fan out to the dashboard and webhooks
+    alert_outbox = AlertOutbox(ALERT_OUTBOX_PATH, workers=ALERT_DELIVERY_WORKERS)
+    alert_outbox.add_target(SocketIOTarget('dashboard', publish_event))
+    alert_target_configs = {}
+    load_alert_targets()
+    alert_outbox.start()
+
+    detection_store = DetectionStore(HISTORY_FOLDER)
+    dvr = SegmentedDvr(DVR_FOLDER, segment_seconds=DVR_SEGMENT_SECONDS, fps=DVR_FPS,
+                       retention_seconds=DVR_RETENTION_SECONDS,
+                       max_bytes_per_camera=DVR_MAX_MB_PER_CAMERA * 1024 * 1024, ffmpeg=FFMPEG_BINARY)
+
+    detection_cache = DetectionCache(
+        max_bytes=DETECTION_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds=DETECTION_CACHE_TTL_SECONDS
+    )
+    roi_masks = RoiMasks(ROI_MASKS_PATH, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, max_tiles=TILE_MAX_TILES)
+    detector = WeaponDetector(model, cache=detection_cache, roi_masks=roi_masks)
+    # Live camera frames never repeat, so only the request endpoints use the cache
+    detection_cache.fingerprint_fn = detector.model_fingerprint
+    snapshot_cache = SnapshotCache(annotate=detector.draw_detections, sizes=SNAPSHOT_SIZES,
+                                   quality=SNAPSHOT_JPEG_QUALITY)
+
+    violence_detector = None
+    violence_service = None
+    runtime_model_path = next((p for p in VIOLENCE_RUNTIME_MODEL_PATHS if os.path.exists(p)), None)
+    if VIOLENCE_DETECTION_ENABLED and (runtime_model_path or os.path.exists(VIOLENCE_MODEL_PATH)):
+        try:
+            sys.path.insert(0, os.path.abspath(VIOLENCE_MODULE_DIR))
+            from violence_stream import ViolenceDetector
+            if runtime_model_path:
+                # Lightweight runtime: no Keras/TensorFlow import on the edge node
+                from violence_runtime import load_runtime_model
+                violence_service = load_runtime_model(runtime_model_path)
+                logger.info(f"Violence runtime model: {runtime_model_path}")
+            else:
+                from violence_service import ViolenceInferenceService
+                violence_service = ViolenceInferenceService(VIOLENCE_MODEL_PATH, max_batch_size=VIOLENCE_MAX_BATCH)
+            violence_detector = ViolenceDetector(
+                violence_service,
+                sample_interval=VIOLENCE_SAMPLE_INTERVAL,
+                stride=VIOLENCE_STRIDE
+            )
+            logger.info("Violence model loaded successfully")
+        except Exception as e:
+            logger.error(f"Failed to load violence model: {e}")
+            violence_detector = None
+            violence_service = None
+
+    # Shared by the camera monitor and pipeline sources so one deadline covers all inference on the node
+    qos_controller = QosController(deadline_ms=QOS_DEADLINE_MS, reduced_imgsz=QOS_REDUCED_IMGSZ)
+    camera_monitor = CameraMonitor(detector, violence_detector, qos=qos_controller)
+    batch_jobs = BatchJobManager(model_registry.live_path() or MODEL_PATH, JOBS_FOLDER,
+                                 max_workers=BATCH_JOB_WORKERS, shard_seconds=BATCH_SHARD_SECONDS)
+
+    model_registry.infer = detector.infer_with
+    model_registry.apply = install_model
+    detector.on_inference = model_registry.observe
+
+    # Multi-source analytics pipeline: one decode per source shared by all model stages
+    pipeline_stages = []
+    if model is not None:
+        pipeline_stages.append(WeaponStage(detector, target_fps=PIPELINE_WEAPON_FPS,
+                                           alert_threshold=WEAPON_ALERT_THRESHOLD))
+    if violence_service is not None:
+        # Separate detector so pipeline sources do not share window state with the camera monitor
+        pipeline_stages.append(ViolenceStage(
+            ViolenceDetector(violence_service, sample_interval=1, stride=VIOLENCE_STRIDE),
+            target_fps=PIPELINE_VIOLENCE_FPS,
+            max_concurrency=PIPELINE_WORKERS
+        ))
+    sos_store = SosStore(SOS_FOLDER, max_active_uploads=SOS_MAX_ACTIVE_UPLOADS)
+    sos_store.cleanup_stale_uploads()
+
+    pipeline_alerts = AlertStream(LOGS_FOLDER, correlation_seconds=PIPELINE_CORRELATION_SECONDS)
+    pipeline_alerts.subscribe(lambda alert: alert_outbox.enqueue('pipeline_alert', alert))
+    analytics_pipeline = AnalyticsPipeline(
+        pipeline_stages,
+        scheduler=CpuBudgetScheduler(budget_percent=PIPELINE_CPU_BUDGET_PERCENT),
+        alert_stream=pipeline_alerts,
+        max_workers=PIPELINE_WORKERS,
+        on_result=on_pipeline_result,
+        qos=qos_controller
+    )
+    return app
+
+def shutdown_services():
+    if not services_started:
+        return
+    camera_monitor.stop_monitoring()
+    batch_jobs.shutdown()
+    analytics_pipeline.shutdown()
+    alert_outbox.shutdown()
+    detection_store.shutdown()
+    dvr.shutdown()
+    model_registry.shutdown()
+    event_journal.close()
+
 if __name__ == '__main__':
-    if model is None:
-        logger.warning("Model not loaded. Some endpoints may not work.")
+    debug = True
+    # With the reloader, the parent process only watches files; the child it spawns serves
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
+        if model is None:
+            logger.warning("Model not loaded. Some endpoints may not work.")
     try:
         socketio.run(
             app,
-            debug=True,
+            debug=debug,
             host='0.0.0.0',
             port=5000,
             allow_unsafe_werkzeug=True
         )
     except KeyboardInterrupt:
         logger.info("Shutting down...")
-        camera_monitor.stop_monitoring()
+        shutdown_services()
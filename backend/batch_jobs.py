@@ -0,0 +1,554 @@
+"""
+Offline batch analysis of archived footage.
+
+Videos are split into frame-range shards that run on a process pool. Each
+worker loads the YOLO model once, decodes its shard on a reader thread and
+runs detection as fast as the CPU allows. Progress and detections flow back
+through a manager queue into the job state served by the /jobs endpoints.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'm4v', 'webm', 'mpg', 'mpeg', 'ts'}
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+# Per-process state for pool workers
+_worker_model = None
+_worker_model_path = None
+
+
+def is_video_file(path):
+    return '.' in path and path.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
+
+
+def collect_video_files(paths, recursive=True):
+    """Expand a list of files and directories into video file paths"""
+    files = []
+    missing = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                for root, _, names in os.walk(path):
+                    files.extend(os.path.join(root, n) for n in sorted(names) if is_video_file(n))
+            else:
+                files.extend(os.path.join(path, n) for n in sorted(os.listdir(path))
+                             if is_video_file(n) and os.path.isfile(os.path.join(path, n)))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            missing.append(path)
+    return files, missing
+
+
+def probe_video(path):
+    """Return (frame_count, fps) or (0, fps) when the container hides the count"""
+    reader = cv2.VideoCapture(path)
+    try:
+        if not reader.isOpened():
+            return None, None
+        frame_count = int(reader.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = reader.get(cv2.CAP_PROP_FPS) or 30.0
+        return max(frame_count, 0), fps
+    finally:
+        reader.release()
+
+
+def plan_shards(path, frame_count, fps, shard_seconds):
+    """Split a video into contiguous [start, end) frame ranges"""
+    if frame_count <= 0:
+        # Unknown length: one shard that reads to EOF
+        return [{'path': path, 'start': 0, 'end': None, 'fps': fps}]
+
+    shard_frames = max(int(shard_seconds * fps), 1)
+    return [{'path': path, 'start': start, 'end': min(start + shard_frames, frame_count), 'fps': fps}
+            for start in range(0, frame_count, shard_frames)]
+
+
+def format_offset(seconds):
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def merge_segments(hits, fps, gap_seconds, padding_seconds, frame_count):
+    """Merge detection frame indices into padded [start, end) clip ranges"""
+    if not hits:
+        return []
+
+    gap = int(gap_seconds * fps)
+    padding = int(padding_seconds * fps)
+    segments = []
+    start = end = hits[0]
+    for frame_index in hits[1:]:
+        if frame_index - end > gap:
+            segments.append((start, end))
+            start = frame_index
+        end = frame_index
+    segments.append((start, end))
+
+    limit = frame_count if frame_count > 0 else None
+    padded = []
+    for start, end in segments:
+        clip_start = max(start - padding, 0)
+        clip_end = end + padding + 1
+        if limit is not None:
+            clip_end = min(clip_end, limit)
+        padded.append((clip_start, clip_end))
+    return padded
+
+
+# -------------------------------
+# Worker process functions
+# -------------------------------
+def _init_worker(model_path, cv2_threads):
+    cv2.setNumThreads(cv2_threads)
+    _load_worker_model(model_path)
+
+
+def _load_worker_model(model_path):
+    """Load the weights a shard asks for, keeping them for later shards on the same model"""
+    global _worker_model, _worker_model_path
+    if _worker_model is None or _worker_model_path != model_path:
+        from ultralytics import YOLO
+        _worker_model = YOLO(model_path)
+        _worker_model_path = model_path
+    return _worker_model
+
+
+def _parse_detections(result, conf_threshold):
+    detections = []
+    boxes = result.boxes
+    if boxes is None:
+        return detections
+
+    for i in range(len(boxes.cls)):
+        confidence = float(boxes.conf[i])
+        if confidence < conf_threshold:
+            continue
+        class_name = result.names[int(boxes.cls[i])].lower()
+        if class_name == "pistol":
+            class_name = "gun"
+        bbox = boxes.xyxy[i].cpu().numpy().tolist()
+        detections.append({
+            "class": class_name,
+            "confidence": confidence,
+            "bbox": {"x1": bbox[0], "y1": bbox[1], "x2": bbox[2], "y2": bbox[3]}
+        })
+    return detections
+
+
+def _read_shard(shard, stride, frames_out, stop):
+    """Decode a shard on its own thread; grab() skipped frames, retrieve() sampled ones"""
+    reader = cv2.VideoCapture(shard['path'])
+    try:
+        if not reader.isOpened():
+            frames_out.put(IOError(f"Could not open video file: {shard['path']}"))
+            return
+        if shard['start']:
+            reader.set(cv2.CAP_PROP_POS_FRAMES, shard['start'])
+
+        frame_index = shard['start']
+        end = shard['end']
+        while not stop.is_set() and (end is None or frame_index < end):
+            if not reader.grab():
+                break
+            if frame_index % stride == 0:
+                ok, frame = reader.retrieve()
+                if ok:
+                    frames_out.put((frame_index, frame))
+            frame_index += 1
+    except Exception as e:
+        frames_out.put(e)
+    finally:
+        reader.release()
+        frames_out.put(None)
+
+
+def analyze_shard(job_id, shard, options, progress_queue, model_path):
+    """Run weapon detection over one shard. Executed inside a pool worker."""
+    model = _load_worker_model(model_path)
+    stride = max(int(options.get('frame_stride', 1)), 1)
+    conf_threshold = float(options.get('conf', 0.25))
+    batch_size = max(int(options.get('batch_size', 8)), 1)
+    fps = shard['fps']
+
+    frames = queue.Queue(maxsize=batch_size * 4)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_shard, args=(shard, stride, frames, stop), daemon=True)
+    reader.start()
+
+    hits = []
+    pending = []
+    frames_done = 0
+    last_frame = shard['start']
+    last_report = time.time()
+
+    def flush(batch):
+        results = model([frame for _, frame in batch], conf=conf_threshold, verbose=False)
+        found = []
+        for (frame_index, _), result in zip(batch, results):
+            detections = _parse_detections(result, conf_threshold)
+            if detections:
+                offset = frame_index / fps
+                hits.append(frame_index)
+                found.append({
+                    'file': shard['path'],
+                    'frame': frame_index,
+                    'offset_seconds': round(offset, 3),
+                    'timestamp': format_offset(offset),
+                    'detections': detections,
+                    'count': len(detections)
+                })
+        return found
+
+    try:
+        found = []
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            pending.append(item)
+            last_frame = item[0]
+            if len(pending) >= batch_size:
+                found.extend(flush(pending))
+                frames_done += len(pending) * stride
+                pending = []
+
+            if time.time() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                progress_queue.put(('progress', job_id, shard['path'], frames_done, found))
+                frames_done = 0
+                found = []
+                last_report = time.time()
+
+        if pending:
+            found.extend(flush(pending))
+            frames_done += len(pending) * stride
+        # The final message carries the shard summary so completion is only
+        # recorded after every detection of the shard has been collected
+        summary = {'hits': hits, 'last_frame': last_frame}
+        progress_queue.put(('done', job_id, shard['path'], frames_done, found, shard['start'], summary))
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader.is_alive():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                reader.join(timeout=0.1)
+
+    return len(hits)
+
+
+def cut_clip(source_path, start_frame, end_frame, output_path):
+    """Copy a frame range of a video into a new file. Executed inside a pool worker."""
+    reader = cv2.VideoCapture(source_path)
+    writer = None
+    try:
+        if not reader.isOpened():
+            raise IOError(f"Could not open video file: {source_path}")
+        fps = reader.get(cv2.CAP_PROP_FPS) or 30.0
+        reader.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        written = 0
+        for _ in range(end_frame - start_frame):
+            ok, frame = reader.read()
+            if not ok:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                if not writer.isOpened():
+                    raise IOError("Failed to open video writer")
+            writer.write(frame)
+            written += 1
+        return written
+    finally:
+        reader.release()
+        if writer is not None:
+            writer.release()
+
+
+# -------------------------------
+# Job manager (runs in the server process)
+# -------------------------------
+class BatchJobManager:
+    def __init__(self, model_path, output_folder, max_workers=None, shard_seconds=300,
+                 cv2_threads=2):
+        self.model_path = model_path
+        self.output_folder = output_folder
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.shard_seconds = shard_seconds
+        self.cv2_threads = cv2_threads
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pool = None
+        self.manager = None
+        self.progress_queue = None
+        self.collector_thread = None
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    def _ensure_pool(self):
+        """Start workers lazily so importing the app does not spawn processes"""
+        if self.pool is not None:
+            return
+        context = multiprocessing.get_context('spawn')
+        self.manager = context.Manager()
+        self.progress_queue = self.manager.Queue()
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.model_path, self.cv2_threads)
+        )
+        self.collector_thread = threading.Thread(target=self._collect_progress, daemon=True)
+        self.collector_thread.start()
+        logger.info(f"Batch job pool started with {self.max_workers} workers")
+
+    def set_model_path(self, model_path):
+        """Weights for jobs submitted from now on; each shard carries its job's path, so
+        running jobs finish on the old ones and workers reload when the path changes"""
+        self.model_path = model_path
+
+    def _collect_progress(self):
+        while True:
+            try:
+                message = self.progress_queue.get()
+            except (EOFError, OSError):
+                return
+            if message is None:
+                return
+
+            kind, job_id, path, frames_done, found = message[:5]
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                job['progress']['frames_done'] += frames_done
+                job['files'][path]['frames_done'] += frames_done
+                job['results'].extend(found)
+                job['updated_at'] = datetime.now().isoformat()
+
+            if kind == 'done':
+                shard_start, summary = message[5:]
+                self._shard_finished(job, path, shard_start, summary=summary)
+
+    def submit(self, paths, options=None):
+        options = dict(options or {})
+        files, missing = collect_video_files(paths, options.get('recursive', True))
+        if not files:
+            return None, f"No video files found in {paths}"
+
+        self._ensure_pool()
+        model_path = self.model_path
+        job_id = uuid.uuid4().hex[:12]
+        job_folder = os.path.join(self.output_folder, job_id)
+        os.makedirs(job_folder, exist_ok=True)
+
+        file_states = {}
+        shards = []
+        frames_total = 0
+        for path in files:
+            frame_count, fps = probe_video(path)
+            if frame_count is None:
+                file_states[path] = {'status': 'failed', 'error': 'Could not open video file',
+                                     'frames_total': 0, 'frames_done': 0}
+                continue
+            file_shards = plan_shards(path, frame_count, fps, self.shard_seconds)
+            shards.extend(file_shards)
+            frames_total += frame_count
+            file_states[path] = {'status': 'running', 'frames_total': frame_count, 'fps': fps,
+                                 'frames_done': 0, 'shards_total': len(file_shards),
+                                 'shards_done': 0, 'hits': []}
+
+        job = {
+            'job_id': job_id,
+            'status': 'running',
+            'created_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat(),
+            'options': options,
+            'model_path': model_path,
+            'missing_paths': missing,
+            'files': file_states,
+            'progress': {'frames_total': frames_total, 'frames_done': 0,
+                         'tasks_total': len(shards), 'tasks_done': 0},
+            'results': [],
+            'clips': [],
+            'errors': [],
+            'futures': [],
+            'folder': job_folder,
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+
+        if not shards:
+            job['status'] = 'failed'
+            return job_id, None
+
+        for shard in shards:
+            future = self.pool.submit(analyze_shard, job_id, shard, options, self.progress_queue, model_path)
+            future.add_done_callback(lambda f, s=shard: self._shard_failed(job, s, f))
+            job['futures'].append(future)
+
+        logger.info(f"Batch job {job_id} queued: {len(files)} files, {len(shards)} shards")
+        return job_id, None
+
+    def _shard_failed(self, job, shard, future):
+        """Account for shards that never sent their final progress message"""
+        if future.cancelled():
+            self._shard_finished(job, shard['path'], shard['start'], error='cancelled')
+        elif future.exception() is not None:
+            self._shard_finished(job, shard['path'], shard['start'], error=str(future.exception()))
+
+    def _shard_finished(self, job, path, shard_start, summary=None, error=None):
+        with self.lock:
+            file_state = job['files'][path]
+            job['progress']['tasks_done'] += 1
+            file_state['shards_done'] += 1
+
+            if error == 'cancelled':
+                file_state['status'] = 'cancelled'
+            elif error is not None:
+                job['errors'].append({'file': path, 'start_frame': shard_start, 'error': error})
+                logger.error(f"Batch job {job['job_id']} shard failed: {error}")
+            else:
+                file_state['hits'].extend(summary['hits'])
+                if file_state['frames_total'] <= 0:
+                    # Length was unknown until the shard hit EOF
+                    file_state['frames_total'] = summary['last_frame'] + 1
+                    job['progress']['frames_total'] += file_state['frames_total']
+
+            file_done = file_state['shards_done'] == file_state['shards_total']
+
+        if file_done and job['status'] == 'running':
+            self._finish_file(job, path)
+        self._finish_job_if_done(job)
+
+    def _finish_file(self, job, path):
+        options = job['options']
+        file_state = job['files'][path]
+        if file_state['status'] == 'running':
+            file_state['status'] = 'completed'
+        if not options.get('clips', True) or not file_state['hits']:
+            return
+
+        segments = merge_segments(sorted(file_state['hits']), file_state['fps'],
+                                  options.get('clip_gap_seconds', 2.0),
+                                  options.get('clip_padding_seconds', 3.0),
+                                  file_state['frames_total'])
+        base = os.path.splitext(os.path.basename(path))[0]
+        for start, end in segments:
+            filename = f"{base}_{start}_{end}.mp4"
+            clip = {
+                'file': path,
+                'filename': filename,
+                'start_frame': start,
+                'end_frame': end,
+                'start_offset': format_offset(start / file_state['fps']),
+                'end_offset': format_offset(end / file_state['fps']),
+                'status': 'pending',
+                'download_url': f"/jobs/{job['job_id']}/clips/{filename}"
+            }
+            with self.lock:
+                job['clips'].append(clip)
+                job['progress']['tasks_total'] += 1
+            future = self.pool.submit(cut_clip, path, start, end, os.path.join(job['folder'], filename))
+            future.add_done_callback(lambda f, c=clip: self._clip_done(job, c, f))
+            job['futures'].append(future)
+
+    def _clip_done(self, job, clip, future):
+        with self.lock:
+            if future.cancelled():
+                clip['status'] = 'cancelled'
+            elif future.exception() is not None:
+                clip['status'] = 'failed'
+                clip['error'] = str(future.exception())
+            else:
+                clip['status'] = 'completed'
+                clip['frames'] = future.result()
+            job['progress']['tasks_done'] += 1
+        self._finish_job_if_done(job)
+
+    def _finish_job_if_done(self, job):
+        with self.lock:
+            progress = job['progress']
+            if job['status'] != 'running' or progress['tasks_done'] < progress['tasks_total']:
+                return
+            job['status'] = 'completed_with_errors' if job['errors'] else 'completed'
+            job['finished_at'] = datetime.now().isoformat()
+        logger.info(f"Batch job {job['job_id']} {job['status']}: {len(job['results'])} detections")
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job['status'] == 'running':
+                job['status'] = 'cancelled'
+                job['finished_at'] = datetime.now().isoformat()
+        for future in job['futures']:
+            future.cancel()
+        return True
+
+    def get_job(self, job_id, since=0):
+        """Job status plus detections recorded after result index `since`"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            progress = dict(job['progress'])
+            frames_total = progress['frames_total']
+            progress['percent'] = round(100.0 * progress['frames_done'] / frames_total, 1) if frames_total else None
+            return {
+                'job_id': job_id,
+                'status': job['status'],
+                'created_at': job['created_at'],
+                'updated_at': job['updated_at'],
+                'finished_at': job.get('finished_at'),
+                'model_path': job['model_path'],
+                'progress': progress,
+                'files': {path: {k: v for k, v in state.items() if k != 'hits'}
+                          for path, state in job['files'].items()},
+                'missing_paths': job['missing_paths'],
+                'results': job['results'][since:],
+                'next_since': len(job['results']),
+                'clips': [dict(c) for c in job['clips']],
+                'errors': list(job['errors'])
+            }
+
+    def list_jobs(self):
+        with self.lock:
+            return [{'job_id': job_id, 'status': job['status'], 'created_at': job['created_at'],
+                     'files': len(job['files']), 'detections': len(job['results'])}
+                    for job_id, job in self.jobs.items()]
+
+    def clip_path(self, job_id, filename):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            for clip in job['clips']:
+                if clip['filename'] == filename and clip['status'] == 'completed':
+                    return os.path.join(job['folder'], filename)
+        return None
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.progress_queue.put(None)
+            self.manager.shutdown()
+            self.pool = None
@@ -0,0 +1,396 @@
+"""
+Reproducible benchmark for the weapon detection backend.
+
+Replays a video file (or synthetic frames) through the same CameraMonitor
+pipeline a real camera uses, with cv2.VideoCapture stubbed out and either a
+fake model or a small YOLO checkpoint, so it runs offline on CPU.
+
+Usage (from the backend directory):
+    python benchmarks/bench_backend.py --output bench.json
+    python benchmarks/bench_backend.py --video clip.mp4 --model yolov8n.pt
+    python benchmarks/bench_backend.py --compare bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import cv2
+from fakes import FakeYOLO, ReplayCapture, load_video_frames, synthetic_frames
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Metrics where a higher value is better; everything else is "lower is better"
+HIGHER_IS_BETTER = ('fps', 'throughput')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
+
+
+def latency_summary(latencies_s):
+    return {
+        'count': len(latencies_s),
+        'p50_ms': round(percentile(latencies_s, 50) * 1000, 3) if latencies_s else None,
+        'p99_ms': round(percentile(latencies_s, 99) * 1000, 3) if latencies_s else None,
+        'max_ms': round(max(latencies_s) * 1000, 3) if latencies_s else None,
+    }
+
+
+class MemorySampler:
+    """Samples process RSS on a background thread to find the high-water mark"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _rss(self):
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        try:
+            import resource
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            scale = 1 if sys.platform == 'darwin' else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        except ImportError:
+            return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self._rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline_rss = self._rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, self._rss())
+
+    def summary(self):
+        return {
+            'baseline_rss_mb': round(self.baseline_rss / 2 ** 20, 2),
+            'peak_rss_mb': round(self.peak_rss / 2 ** 20, 2),
+            'growth_mb': round((self.peak_rss - self.baseline_rss) / 2 ** 20, 2),
+        }
+
+
+def import_backend(workdir):
+    """Import app.py with its relative folders created under workdir"""
+    os.chdir(workdir)
+    import app
+    app.create_app()
+    return app
+
+
+def install_model(app, args):
+    if args.model:
+        from ultralytics import YOLO
+        model = YOLO(args.model)
+    else:
+        model = FakeYOLO(imgsz=args.imgsz, latency_ms=args.fake_latency_ms,
+                         detection_period=args.detection_period)
+    app.model = model
+    app.detector.model = model
+    return model
+
+
+def start_replay(app, frames, camera_fps):
+    """Point the monitor at a ReplayCapture and start its loop"""
+    capture = ReplayCapture(frames, fps=camera_fps)
+    original = cv2.VideoCapture
+    cv2.VideoCapture = lambda *a, **kw: capture
+    try:
+        if not app.camera_monitor.start_monitoring(0):
+            raise RuntimeError("CameraMonitor failed to start on replay capture")
+    finally:
+        cv2.VideoCapture = original
+    return capture
+
+
+def bench_monitor_loop(app, frames, args):
+    """Frames/sec and read-to-emit latency of CameraMonitor._monitor_loop"""
+    latencies = []
+    emitted = {'frames': 0, 'alerts': 0, 'recordings': 0}
+    done = threading.Event()
+    original_emit = app.socketio.emit
+
+    def timed_emit(event, data=None, *a, **kw):
+        if event == 'weapon_detection':
+            # Decode time of the frame the monitor thread is emitting
+            read_time = app.camera_monitor.camera.last_frame_time() if app.camera_monitor.camera else None
+            if read_time is not None:
+                latencies.append(time.perf_counter() - read_time)
+            emitted['frames'] += 1
+            if emitted['frames'] >= args.frames:
+                done.set()
+        elif event == 'weapon_alert':
+            emitted['alerts'] += 1
+        elif event == 'recording_started':
+            emitted['recordings'] += 1
+        return original_emit(event, data, *a, **kw)
+
+    app.socketio.emit = timed_emit
+    try:
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            start_replay(app, frames, args.camera_fps)
+            finished = done.wait(timeout=args.timeout)
+            elapsed = time.perf_counter() - start
+            app.camera_monitor.stop_monitoring()
+    finally:
+        app.socketio.emit = original_emit
+
+    processed = emitted['frames']
+    return {
+        'completed': finished,
+        'frames': processed,
+        'elapsed_s': round(elapsed, 3),
+        'fps': round(processed / elapsed, 2) if elapsed else 0.0,
+        'latency': latency_summary(latencies),
+        'alerts': emitted['alerts'],
+        'recordings_started': emitted['recordings'],
+        'memory': memory.summary(),
+    }
+
+
+def run_clients(worker, clients, duration):
+    """Run worker(stop_event, stats) on N threads and collect their stats"""
+    stop = threading.Event()
+    stats = [{'count': 0, 'latencies': [], 'errors': 0} for _ in range(clients)]
+    threads = [threading.Thread(target=worker, args=(stop, stats[i]), daemon=True)
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=5)
+    elapsed = time.perf_counter() - start
+
+    total = sum(s['count'] for s in stats)
+    latencies = [lat for s in stats for lat in s['latencies']]
+    return {
+        'clients': clients,
+        'elapsed_s': round(elapsed, 3),
+        'total': total,
+        'errors': sum(s['errors'] for s in stats),
+        'throughput_per_s': round(total / elapsed, 2) if elapsed else 0.0,
+        'per_client_per_s': round(total / elapsed / clients, 2) if elapsed else 0.0,
+        'latency': latency_summary(latencies),
+    }
+
+
+def bench_stream_clients(app, frames, args):
+    """MJPEG frames/sec delivered to concurrent /camera/stream clients"""
+    start_replay(app, frames, args.camera_fps)
+    client_factory = app.app.test_client
+
+    def worker(stop, stats):
+        client = client_factory()
+        response = client.get('/camera/stream', buffered=False)
+        if response.status_code != 200:
+            stats['errors'] += 1
+            return
+        last = time.perf_counter()
+        try:
+            for chunk in response.response:
+                now = time.perf_counter()
+                if b'--frame' in chunk:
+                    stats['count'] += 1
+                    stats['latencies'].append(now - last)
+                last = now
+                if stop.is_set():
+                    break
+        finally:
+            response.close()
+
+    try:
+        with MemorySampler() as memory:
+            result = run_clients(worker, args.stream_clients, args.duration)
+    finally:
+        app.camera_monitor.stop_monitoring()
+    result['unit'] = 'frames'
+    result['memory'] = memory.summary()
+    return result
+
+
+def bench_rest(app, path, args):
+    """Requests/sec for a REST endpoint under concurrent clients"""
+    client_factory = app.app.test_client
+
+    def worker(stop, stats):
+        client = client_factory()
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            response = client.get(path)
+            stats['latencies'].append(time.perf_counter() - t0)
+            if response.status_code >= 400:
+                stats['errors'] += 1
+            stats['count'] += 1
+
+    result = run_clients(worker, args.rest_clients, args.duration)
+    result['unit'] = 'requests'
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def flatten(report, prefix=''):
+    """Flatten nested numeric results into dotted keys for comparison"""
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_reports(baseline, current, tolerance):
+    """Return metrics that regressed by more than tolerance (fraction)"""
+    regressions = []
+    base = flatten(baseline.get('results', {}))
+    cur = flatten(current.get('results', {}))
+    for name, old in base.items():
+        new = cur.get(name)
+        if new is None or not old:
+            continue
+        if not (name.endswith('_ms') or name.endswith('_mb') or any(k in name for k in HIGHER_IS_BETTER)):
+            continue
+        change = (new - old) / abs(old)
+        higher_better = any(k in name for k in HIGHER_IS_BETTER)
+        if (higher_better and change < -tolerance) or (not higher_better and change > tolerance):
+            regressions.append({'metric': name, 'baseline': old, 'current': new,
+                                'change_pct': round(change * 100, 1)})
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Safyra backend benchmark")
+    parser.add_argument('--video', help="Video file to replay (default: synthetic frames)")
+    parser.add_argument('--model', help="YOLO checkpoint to use instead of the fake model")
+    parser.add_argument('--frames', type=int, default=300, help="Frames to push through the monitor loop")
+    parser.add_argument('--max-preload', type=int, default=300, help="Frames of the video kept in memory")
+    parser.add_argument('--camera-fps', type=float, default=0, help="Pace the replay like a camera (0 = as fast as possible)")
+    parser.add_argument('--realtime', action='store_true', help="Keep the loop's production sleep intervals")
+    parser.add_argument('--imgsz', type=int, default=640, help="Fake model input size")
+    parser.add_argument('--fake-latency-ms', type=float, default=0.0, help="Extra simulated inference time")
+    parser.add_argument('--detection-period', type=int, default=60, help="Fake model toggles detections every N calls")
+    parser.add_argument('--alert-threshold', type=float, help="Override WEAPON_ALERT_THRESHOLD to exercise recording")
+    parser.add_argument('--stream-clients', type=int, default=4)
+    parser.add_argument('--rest-clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per concurrent-client phase")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', help="Baseline JSON report to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed regression fraction")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for name in ('video', 'output', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    frames = (load_video_frames(args.video, args.max_preload) if args.video
+              else synthetic_frames())
+
+    workdir = tempfile.mkdtemp(prefix='safyra-bench-')
+    app = import_backend(workdir)
+    install_model(app, args)
+
+    if not args.realtime:
+        app.MONITOR_FRAME_INTERVAL = 0
+        app.STREAM_FRAME_INTERVAL = 0
+    if args.alert_threshold is not None:
+        app.WEAPON_ALERT_THRESHOLD = args.alert_threshold
+
+    results = {
+        'monitor_loop': bench_monitor_loop(app, frames, args),
+        'stream_clients': bench_stream_clients(app, frames, args),
+        'rest': {
+            'health': bench_rest(app, '/', args),
+            'camera_status': bench_rest(app, '/camera/status', args),
+            'weapon_alert_logs': bench_rest(app, '/logs/weapon-alerts', args),
+            'recordings': bench_rest(app, '/recordings', args),
+        },
+    }
+
+    report = {
+        'benchmark': 'safyra-backend',
+        'timestamp': datetime.now().isoformat(),
+        'git_revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'video': args.video,
+            'model': args.model or 'fake',
+            'frame_shape': list(frames[0].shape),
+            'frames': args.frames,
+            'camera_fps': args.camera_fps,
+            'realtime': args.realtime,
+            'alert_threshold_s': app.WEAPON_ALERT_THRESHOLD,
+            'stream_clients': args.stream_clients,
+            'rest_clients': args.rest_clients,
+            'duration_s': args.duration,
+        },
+        'results': results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        report['regressions'] = regressions
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
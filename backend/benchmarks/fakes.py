@@ -0,0 +1,196 @@
+"""
+Offline stand-ins for the camera and the YOLO model used by the benchmarks.
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+_RealVideoCapture = cv2.VideoCapture
+
+
+def load_video_frames(video_path, max_frames=300):
+    """Decode up to max_frames from a video file into memory"""
+    reader = _RealVideoCapture(video_path)
+    if not reader.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
+
+    frames = []
+    try:
+        while len(frames) < max_frames:
+            ok, frame = reader.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        reader.release()
+
+    if not frames:
+        raise IOError(f"No frames decoded from {video_path}")
+    return frames
+
+
+def synthetic_frames(count=150, width=640, height=480, seed=0):
+    """Generate noisy frames with a moving block so encoders do real work"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        x = (i * 7) % (width - 80)
+        y = (i * 3) % (height - 80)
+        frame[y:y + 80, x:x + 80] = (0, 0, 255)
+        frames.append(frame)
+    return frames
+
+
+class ReplayCapture:
+    """cv2.VideoCapture replacement that replays preloaded frames in a loop"""
+
+    def __init__(self, frames, fps=None):
+        self.frames = frames
+        self.fps = fps
+        self.position = 0
+        self.frames_read = 0
+        self.opened = True
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_due = None
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+
+        with self._lock:
+            if self.fps:
+                # Pace reads like a real camera would
+                now = time.perf_counter()
+                if self._next_due is not None and now < self._next_due:
+                    time.sleep(self._next_due - now)
+                self._next_due = max(now, self._next_due or now) + 1.0 / self.fps
+
+            frame = self.frames[self.position]
+            self.position = (self.position + 1) % len(self.frames)
+            self.frames_read += 1
+
+        self._local.read_time = time.perf_counter()
+        return True, frame.copy()
+
+    def grab(self):
+        ok, frame = self.read()
+        self._local.grabbed = frame
+        return ok
+
+    def retrieve(self):
+        frame = getattr(self._local, 'grabbed', None)
+        return frame is not None, frame
+
+    def last_read_time(self):
+        """perf_counter timestamp of the last read made by the calling thread"""
+        return getattr(self._local, 'read_time', None)
+
+    def get(self, prop):
+        height, width = self.frames[0].shape[:2]
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 30)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.frames))
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+class _Tensor:
+    """Minimal torch-like wrapper so `.cpu().numpy()` works on fake outputs"""
+
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        value = self.array[index]
+        return _Tensor(value) if isinstance(value, np.ndarray) else value
+
+    def __int__(self):
+        return int(self.array)
+
+    def __float__(self):
+        return float(self.array)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Boxes:
+    def __init__(self, cls, conf, xyxy):
+        self.cls = _Tensor(np.asarray(cls, dtype=np.float32))
+        self.conf = _Tensor(np.asarray(conf, dtype=np.float32))
+        self.xyxy = _Tensor(np.asarray(xyxy, dtype=np.float32).reshape(-1, 4))
+
+
+class _Result:
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+
+class FakeYOLO:
+    """
+    Deterministic YOLO stand-in.
+
+    Does the same letterbox-style resize and float conversion a real model
+    would, optionally sleeps to emulate inference time, and reports a weapon
+    during alternating `detection_period` call windows so alert and
+    recording paths are exercised.
+    """
+
+    names = {0: 'pistol', 1: 'knife'}
+
+    def __init__(self, imgsz=640, latency_ms=0.0, detection_period=60):
+        self.imgsz = imgsz
+        self.latency_ms = latency_ms
+        self.detection_period = detection_period
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _predict_one(self, frame, detect):
+        tensor = cv2.resize(frame, (self.imgsz, self.imgsz)).astype(np.float32)
+        tensor *= 1.0 / 255.0
+
+        if not detect:
+            return _Result(_Boxes([], [], np.empty((0, 4))), dict(self.names))
+
+        height, width = frame.shape[:2]
+        box = [width * 0.4, height * 0.3, width * 0.6, height * 0.7]
+        return _Result(_Boxes([0], [0.82], [box]), dict(self.names))
+
+    def __call__(self, source, **kwargs):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        detect = self.detection_period > 0 and (calls // self.detection_period) % 2 == 1
+
+        frames = source if isinstance(source, list) else [source]
+        results = [self._predict_one(frame, detect) for frame in frames]
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return results
@@ -0,0 +1,127 @@
+"""
+Local webhook receiver for exercising the alert outbox offline.
+
+Accepts POSTs on any path, optionally delays or fails a share of them, and
+reports what it received on GET /received.
+
+Usage (from the backend directory):
+    python benchmarks/webhook_stub.py --port 8099 --fail-rate 0.3 --delay-ms 200
+    curl -X POST localhost:5000/alerts/targets -H 'Content-Type: application/json' \
+         -d '{"name": "stub", "url": "http://localhost:8099/hook"}'
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookStub:
+    """Threaded HTTP server; usable from scripts via start()/stop()"""
+
+    def __init__(self, host='127.0.0.1', port=0, fail_rate=0.0, fail_status=503, delay_ms=0.0,
+                 retry_after=None, seed=0):
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.delay_ms = delay_ms
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.received = []
+        self.failed = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/hook"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                with stub.lock:
+                    self._reply(200, {'received': len(stub.received), 'failed': stub.failed,
+                                      'max_concurrent': stub.max_concurrent, 'items': stub.received[-50:]})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with stub.lock:
+                    stub.concurrent += 1
+                    stub.max_concurrent = max(stub.max_concurrent, stub.concurrent)
+                    fail = stub.random.random() < stub.fail_rate
+                try:
+                    if stub.delay_ms:
+                        time.sleep(stub.delay_ms / 1000.0)
+                    if fail:
+                        with stub.lock:
+                            stub.failed += 1
+                        headers = {'Retry-After': str(stub.retry_after)} if stub.retry_after is not None else None
+                        self._reply(stub.fail_status, {'error': 'simulated failure'}, headers)
+                        return
+                    try:
+                        payload = json.loads(body or b'{}')
+                    except ValueError:
+                        self._reply(400, {'error': 'invalid JSON'})
+                        return
+                    with stub.lock:
+                        stub.received.append({'path': self.path, 'time': time.time(), 'payload': payload})
+                    self._reply(200, {'ok': True})
+                finally:
+                    with stub.lock:
+                        stub.concurrent -= 1
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local webhook stub for alert delivery tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests answered with --fail-status")
+    parser.add_argument('--fail-status', type=int, default=503)
+    parser.add_argument('--retry-after', type=float, help="Retry-After seconds sent with failures")
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="Simulated processing time per request")
+    args = parser.parse_args()
+
+    stub = WebhookStub(args.host, args.port, args.fail_rate, args.fail_status, args.delay_ms, args.retry_after)
+    print(f"Webhook stub listening on {stub.url} (GET /received for stats)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
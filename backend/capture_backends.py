@@ -0,0 +1,337 @@
+"""
+Low-latency capture sources with automatic reconnect.
+
+`CaptureSource` opens a camera through a pluggable backend (V4L2, RTSP over
+FFmpeg, GStreamer pipeline, file replay) and reads it on its own thread so
+the driver and network buffers are always drained; consumers get the newest
+frame instead of one that sat in a queue for seconds. A failed open, read
+errors or a stalled stream trigger a reconnect with jittered exponential
+backoff. It mimics the parts of `cv2.VideoCapture` the monitor uses
+(`read`, `isOpened`, `get`, `release`), plus `stats()` with capture latency
+and reconnect counts.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# FFmpeg options read by OpenCV when an RTSP stream is opened: TCP transport,
+# no input buffering and a socket timeout so a dead camera errors out
+FFMPEG_LOW_LATENCY_OPTIONS = 'rtsp_transport;tcp|fflags;nobuffer|flags;low_delay|max_delay;500000|stimeout;5000000'
+OPEN_TIMEOUT_MS = 5000
+READ_TIMEOUT_MS = 5000
+
+_ffmpeg_env_lock = threading.Lock()
+
+
+def _set_timeouts(capture_args):
+    """Open/read timeouts as VideoCapture params where OpenCV supports them"""
+    params = []
+    for name, value in (('CAP_PROP_OPEN_TIMEOUT_MSEC', OPEN_TIMEOUT_MS), ('CAP_PROP_READ_TIMEOUT_MSEC', READ_TIMEOUT_MS)):
+        if hasattr(cv2, name):
+            params += [getattr(cv2, name), value]
+    return capture_args + ([params] if params else [])
+
+
+def open_v4l2(uri, width=None, height=None, fps=None):
+    api = cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY
+    capture = cv2.VideoCapture(int(uri), api)
+    if width:
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    if height:
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        capture.set(cv2.CAP_PROP_FPS, fps)
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+def open_rtsp(uri, width=None, height=None, fps=None):
+    # OpenCV reads the FFmpeg options from the environment at open time
+    with _ffmpeg_env_lock:
+        previous = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
+        os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = FFMPEG_LOW_LATENCY_OPTIONS
+        try:
+            try:
+                capture = cv2.VideoCapture(*_set_timeouts([uri, cv2.CAP_FFMPEG]))
+            except TypeError:
+                capture = cv2.VideoCapture(uri, cv2.CAP_FFMPEG)
+        finally:
+            if previous is None:
+                os.environ.pop('OPENCV_FFMPEG_CAPTURE_OPTIONS', None)
+            else:
+                os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = previous
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+def gstreamer_pipeline(uri):
+    """Pipeline string for a URL, or `uri` itself when it already is a pipeline"""
+    if '!' in uri:
+        return uri
+    if uri.startswith('rtsp://'):
+        source = f'rtspsrc location={uri} latency=0 drop-on-latency=true ! decodebin'
+    else:
+        source = f'uridecodebin uri={uri}'
+    return f'{source} ! videoconvert ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false'
+
+
+def open_gstreamer(uri, width=None, height=None, fps=None):
+    return cv2.VideoCapture(gstreamer_pipeline(str(uri)), cv2.CAP_GSTREAMER)
+
+
+def open_file(uri, width=None, height=None, fps=None):
+    return cv2.VideoCapture(uri)
+
+
+CAPTURE_BACKENDS = {
+    'v4l2': open_v4l2,
+    'rtsp': open_rtsp,
+    'gstreamer': open_gstreamer,
+    'file': open_file,
+}
+
+
+def register_backend(name, opener):
+    """Add a backend: opener(uri, width, height, fps) -> cv2.VideoCapture-like object"""
+    CAPTURE_BACKENDS[name] = opener
+
+
+def detect_backend(uri):
+    if isinstance(uri, int) or (isinstance(uri, str) and uri.isdigit()):
+        return 'v4l2'
+    if '!' in uri:
+        return 'gstreamer'
+    if uri.startswith(('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://')):
+        return 'rtsp'
+    return 'file'
+
+
+class CaptureSource:
+    """
+    Threaded capture with newest-frame semantics and reconnect.
+
+    Live sources overwrite the held frame as fast as the camera delivers;
+    each consumer thread's `read` waits for a frame it has not seen yet.
+    Files are replayed at their native rate when `realtime`, otherwise every
+    frame is handed over without drops. Files end (or loop) instead of
+    reconnecting.
+    """
+
+    def __init__(self, uri, backend='auto', width=None, height=None, fps=None, loop=False, realtime=True,
+                 reconnect_initial=0.5, reconnect_max=30.0, stall_seconds=5.0, name=None):
+        self.uri = int(uri) if isinstance(uri, str) and uri.isdigit() else uri
+        self.backend = detect_backend(self.uri) if backend in (None, 'auto') else backend
+        if self.backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"Unknown capture backend: {self.backend}")
+        self.width, self.height, self.fps = width, height, fps
+        self.loop = loop
+        self.realtime = realtime
+        self.is_file = self.backend == 'file'
+        self.reconnect_initial = reconnect_initial
+        self.reconnect_max = reconnect_max
+        self.stall_seconds = stall_seconds
+        self.name = name or str(uri)
+
+        self.capture = None
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = None  # perf_counter when the newest frame was decoded
+        self.seq = 0
+        self.consumed_seq = 0
+        self.local = threading.local()
+        self.running = False
+        self.connected = False
+        self.thread = None
+
+        self.started = time.time()
+        self.frames = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self.failed_opens = 0
+        self.last_error = None
+        self.last_frame_at = None
+        self.source_fps = None
+        self.grab_ms = deque(maxlen=300)
+        self.age_ms = deque(maxlen=300)
+
+    # Lifecycle
+    def _open(self):
+        capture = CAPTURE_BACKENDS[self.backend](self.uri, self.width, self.height, self.fps)
+        if capture is None or not capture.isOpened():
+            if capture is not None:
+                capture.release()
+            return None
+        self.source_fps = capture.get(cv2.CAP_PROP_FPS) or None
+        return capture
+
+    def start(self):
+        """Open synchronously once so callers learn about a bad source immediately"""
+        self.capture = self._open()
+        if self.capture is None:
+            self.last_error = f"Could not open {self.name} via {self.backend}"
+            return False
+        self.connected = True
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"capture-{self.name}", daemon=True)
+        self.thread.start()
+        logger.info(f"Capture {self.name} opened via {self.backend}")
+        return True
+
+    def release(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=READ_TIMEOUT_MS / 1000.0 + 1)
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        self.connected = False
+
+    def isOpened(self):
+        return self.running
+
+    def get(self, prop):
+        capture = self.capture
+        return capture.get(prop) if capture is not None else 0.0
+
+    # Reader thread
+    def _reconnect(self, reason):
+        self.connected = False
+        self.last_error = reason
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+        delay = self.reconnect_initial
+        while self.running:
+            logger.warning(f"Capture {self.name}: {reason}; reconnecting in {delay:.1f}s")
+            end = time.monotonic() + delay
+            while self.running and time.monotonic() < end:
+                time.sleep(min(0.2, end - time.monotonic()))
+            if not self.running:
+                return False
+            capture = self._open()
+            if capture is not None:
+                self.capture = capture
+                self.connected = True
+                self.reconnects += 1
+                logger.info(f"Capture {self.name} reconnected (#{self.reconnects})")
+                return True
+            self.failed_opens += 1
+            reason = f"Could not reopen {self.name}"
+            self.last_error = reason
+            # Full jitter on the growing window
+            delay = random.uniform(self.reconnect_initial, min(self.reconnect_max, delay * 2))
+        return False
+
+    def _run(self):
+        frame_interval = 1.0 / self.source_fps if self.is_file and self.realtime and self.source_fps else 0.0
+        next_frame_at = time.monotonic()
+        last_ok = time.monotonic()
+        try:
+            while self.running:
+                started = time.perf_counter()
+                ret, frame = self.capture.read()
+                now = time.perf_counter()
+                if not ret or frame is None:
+                    if self.is_file:
+                        if self.loop:
+                            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                            continue
+                        break
+                    if time.monotonic() - last_ok > self.stall_seconds or not self.capture.isOpened():
+                        if not self._reconnect("stream stalled"):
+                            break
+                        last_ok = time.monotonic()
+                    else:
+                        time.sleep(0.05)
+                    continue
+
+                last_ok = time.monotonic()
+                self.grab_ms.append((now - started) * 1000)
+                with self.condition:
+                    if self.is_file and not self.realtime:
+                        # Lossless replay: wait until the previous frame was taken
+                        self.condition.wait_for(lambda: self.consumed_seq >= self.seq or not self.running)
+                    elif self.seq > self.consumed_seq and self.frame is not None:
+                        self.dropped += 1
+                    self.frame = frame
+                    self.frame_time = now
+                    self.seq += 1
+                    self.frames += 1
+                    self.last_frame_at = time.time()
+                    self.condition.notify_all()
+
+                if frame_interval:
+                    next_frame_at += frame_interval
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_at = time.monotonic()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Capture {self.name} error: {e}")
+        finally:
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+            self.connected = False
+
+    # Consumer side
+    def read(self, timeout=1.0):
+        """(True, frame) with a frame this thread has not seen yet, or (False, None) on timeout/end"""
+        last_seen = getattr(self.local, 'seq', 0)
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > last_seen or not self.running, timeout):
+                return False, None
+            if self.seq <= last_seen:
+                return False, None
+            self.local.seq = self.seq
+            self.local.frame_time = self.frame_time
+            self.consumed_seq = max(self.consumed_seq, self.seq)
+            frame = self.frame
+            self.condition.notify_all()
+        self.age_ms.append((time.perf_counter() - self.local.frame_time) * 1000)
+        return True, frame
+
+    def last_frame_time(self):
+        """perf_counter decode time of the frame last returned to the calling thread"""
+        return getattr(self.local, 'frame_time', None)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {'p50': None, 'p95': None}
+        p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+        return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2)}
+
+    def stats(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        return {
+            'source': str(self.uri),
+            'backend': self.backend,
+            'running': self.running,
+            'connected': self.connected,
+            'frames': self.frames,
+            'capture_fps': round(self.frames / elapsed, 2),
+            'source_fps': self.source_fps,
+            'dropped_stale_frames': self.dropped,
+            'reconnects': self.reconnects,
+            'failed_reopens': self.failed_opens,
+            'last_error': self.last_error,
+            'seconds_since_frame': round(time.time() - self.last_frame_at, 2) if self.last_frame_at else None,
+            # Time the driver took to hand over a frame, and how old frames are when a consumer gets them
+            'grab_ms': self._percentiles(self.grab_ms),
+            'frame_age_ms': self._percentiles(self.age_ms)
+        }
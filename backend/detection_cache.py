@@ -0,0 +1,135 @@
+"""
+Detection result cache for repeated image submissions.
+
+Entries are keyed by a BLAKE2 digest of the decoded pixels plus the model
+fingerprint and inference thresholds. The cache is an LRU bounded by an
+estimated memory size, entries expire after a TTL, and everything is dropped
+as soon as the model fingerprint (file, mtime, loaded object, device) changes.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def image_digest(image):
+    """Fast content hash of a decoded image, including its shape"""
+    array = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(array.data, digest_size=16)
+    digest.update(repr((array.shape, array.dtype.str)).encode())
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl_seconds=600, fingerprint_fn=None,
+                 fingerprint_check_interval=1.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint_fn = fingerprint_fn
+        self.fingerprint_check_interval = fingerprint_check_interval
+        self.entries = OrderedDict()  # key -> (expires_at, size, result)
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.last_fingerprint_check = 0.0
+        self.metrics = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0
+        }
+
+    def _check_fingerprint(self):
+        """Drop every entry when the model file or backend changes. Caller holds the lock."""
+        if self.fingerprint_fn is None:
+            return
+        now = time.monotonic()
+        if now - self.last_fingerprint_check < self.fingerprint_check_interval:
+            return
+        self.last_fingerprint_check = now
+
+        try:
+            fingerprint = self.fingerprint_fn()
+        except Exception as e:
+            logger.warning(f"Detection cache fingerprint check failed: {e}")
+            return
+
+        if fingerprint != self.fingerprint:
+            if self.fingerprint is not None:
+                logger.info("Model changed, detection cache invalidated")
+                self.metrics['invalidations'] += 1
+            self.fingerprint = fingerprint
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def make_key(self, image, params=None):
+        with self.lock:
+            self._check_fingerprint()
+            fingerprint = self.fingerprint
+        params_key = json.dumps(params or {}, sort_keys=True)
+        return f"{image_digest(image)}:{hash((fingerprint, params_key)):x}"
+
+    def get(self, key):
+        with self.lock:
+            self._check_fingerprint()
+            entry = self.entries.get(key)
+            if entry is None:
+                self.metrics['misses'] += 1
+                return None
+
+            expires_at, size, result = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                self.current_bytes -= size
+                self.metrics['expired'] += 1
+                self.metrics['misses'] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.metrics['hits'] += 1
+            return result
+
+    def put(self, key, result):
+        size = len(json.dumps(result)) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, size, result)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes and self.entries:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.metrics['evictions'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.metrics['hits'] + self.metrics['misses']
+            return {
+                **self.metrics,
+                'hit_rate': round(self.metrics['hits'] / lookups, 4) if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds
+            }
@@ -0,0 +1,327 @@
+"""
+Columnar time-series store for per-frame detection results.
+
+Raw detections (timestamp, camera, class, confidence, box) are buffered in
+a preallocated NumPy structured array and flushed as immutable `.npy` chunks
+per UTC day. Every analysed frame also updates per-second, per-minute and
+per-hour rollups in place. The rollups are memory-mapped `.npy` arrays, one
+row per bucket and one file per camera and day, so a histogram over weeks
+reads a few hundred KB of contiguous rows instead of scanning raw events.
+
+Layout under `root_folder`:
+    cameras.json, classes.json          id dictionaries
+    raw/<YYYYMMDD>/<first_ms>-<last_ms>.npy
+    rollups/<resolution>s/<camera_index>/<YYYYMMDD>.npy
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RAW_DTYPE = np.dtype([
+    ('ts', '<f8'), ('camera', '<u2'), ('cls', 'u1'), ('conf', '<f4'),
+    ('x1', '<f4'), ('y1', '<f4'), ('x2', '<f4'), ('y2', '<f4')
+])
+RESOLUTIONS = (1, 60, 3600)
+DAY_SECONDS = 86400
+MAX_CLASSES = 8  # Per-class count columns; the last one counts every class from there on
+OTHER_CLASS = MAX_CLASSES - 1
+
+# Rollup columns; per-class detection counts follow
+FRAMES, DETECTION_FRAMES, DETECTIONS, MAX_CONFIDENCE = range(4)
+CLASS_OFFSET = 4
+ROLLUP_COLUMNS = CLASS_OFFSET + MAX_CLASSES
+
+
+def day_index(timestamp):
+    return int(timestamp // DAY_SECONDS)
+
+
+def day_name(day):
+    return datetime.fromtimestamp(day * DAY_SECONDS, tz=timezone.utc).strftime('%Y%m%d')
+
+
+class DetectionStore:
+    def __init__(self, root_folder, chunk_rows=65536, flush_seconds=5.0, raw_retention_days=30,
+                 second_retention_days=7, rollup_retention_days=400):
+        self.root_folder = root_folder
+        self.raw_folder = os.path.join(root_folder, 'raw')
+        self.rollup_folder = os.path.join(root_folder, 'rollups')
+        os.makedirs(self.raw_folder, exist_ok=True)
+        os.makedirs(self.rollup_folder, exist_ok=True)
+        self.flush_seconds = flush_seconds
+        self.retention_days = {'raw': raw_retention_days, 1: second_retention_days,
+                               60: rollup_retention_days, 3600: rollup_retention_days}
+
+        self.lock = threading.Lock()
+        self.buffer = np.zeros(chunk_rows, dtype=RAW_DTYPE)
+        self.buffered = 0
+        self.writable = {}  # (resolution, camera, day) -> writable memmap
+        self.cameras = self._load_dictionary('cameras.json')
+        self.classes = self._load_dictionary('classes.json')
+
+        self.running = True
+        self.flush_thread = threading.Thread(target=self._flush_loop, name='detection-store', daemon=True)
+        self.flush_thread.start()
+
+    # Dictionaries
+    def _load_dictionary(self, name):
+        try:
+            with open(os.path.join(self.root_folder, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_dictionary(self, name, values):
+        path = os.path.join(self.root_folder, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(values, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _camera_index(self, camera_id):
+        index = self.cameras.get(camera_id)
+        if index is None:
+            index = len(self.cameras)
+            self.cameras[camera_id] = index
+            self._save_dictionary('cameras.json', self.cameras)
+        return index
+
+    def _class_index(self, class_name):
+        index = self.classes.get(class_name)
+        if index is None:
+            # Raw rows keep the real index; only the rollup columns run out
+            index = len(self.classes)
+            self.classes[class_name] = index
+            self._save_dictionary('classes.json', self.classes)
+        return index
+
+    # Writing
+    def _rollup_path(self, resolution, camera, day):
+        return os.path.join(self.rollup_folder, f"{resolution}s", str(camera), f"{day_name(day)}.npy")
+
+    def _rollup(self, resolution, camera, day):
+        key = (resolution, camera, day)
+        array = self.writable.get(key)
+        if array is None:
+            path = self._rollup_path(resolution, camera, day)
+            if os.path.exists(path):
+                array = np.load(path, mmap_mode='r+')
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                array = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                                  shape=(DAY_SECONDS // resolution, ROLLUP_COLUMNS))
+            self.writable[key] = array
+        return array
+
+    def record(self, camera_id, timestamp, detections):
+        """Log one analysed frame and its detections (list of detect_weapons dicts)"""
+        with self.lock:
+            camera = self._camera_index(camera_id)
+            classes = [self._class_index(d['class']) for d in detections]
+            confidences = [d['confidence'] for d in detections]
+
+            day = day_index(timestamp)
+            offset = timestamp - day * DAY_SECONDS
+            for resolution in RESOLUTIONS:
+                row = self._rollup(resolution, camera, day)[int(offset // resolution)]
+                row[FRAMES] += 1
+                if detections:
+                    row[DETECTION_FRAMES] += 1
+                    row[DETECTIONS] += len(detections)
+                    row[MAX_CONFIDENCE] = max(row[MAX_CONFIDENCE], max(confidences))
+                    for cls in classes:
+                        row[CLASS_OFFSET + min(cls, OTHER_CLASS)] += 1
+
+            for cls, detection in zip(classes, detections):
+                if self.buffered == len(self.buffer):
+                    self._flush_raw()
+                bbox = detection['bbox']
+                self.buffer[self.buffered] = (timestamp, camera, cls, detection['confidence'],
+                                              bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2'])
+                self.buffered += 1
+
+    def _flush_raw(self):
+        if not self.buffered:
+            return
+        rows = self.buffer[:self.buffered]
+        days = (rows['ts'] // DAY_SECONDS).astype(np.int64)
+        for day in np.unique(days):
+            chunk = rows[days == day]
+            folder = os.path.join(self.raw_folder, day_name(int(day)))
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{int(chunk['ts'].min() * 1000)}-{int(chunk['ts'].max() * 1000)}.npy")
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, chunk)
+            os.replace(path + '.tmp', path)
+        self.buffered = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush_raw()
+            today = day_index(time.time())
+            for key, array in list(self.writable.items()):
+                array.flush()
+                # Keep only today's and yesterday's rollups open for writing
+                if key[2] < today - 1:
+                    del self.writable[key]
+
+    def _flush_loop(self):
+        last_cleanup = 0.0
+        while self.running:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+                if time.time() - last_cleanup > 3600:
+                    last_cleanup = time.time()
+                    self.cleanup()
+            except Exception as e:
+                logger.error(f"Detection store flush error: {e}")
+
+    def cleanup(self):
+        """Delete day folders/files older than each retention period"""
+        today = day_index(time.time())
+
+        def expired(name, days):
+            try:
+                day = day_index(datetime.strptime(name[:8], '%Y%m%d').replace(tzinfo=timezone.utc).timestamp())
+            except ValueError:
+                return False
+            return day < today - days
+
+        for name in os.listdir(self.raw_folder):
+            if expired(name, self.retention_days['raw']):
+                shutil.rmtree(os.path.join(self.raw_folder, name), ignore_errors=True)
+        for resolution in RESOLUTIONS:
+            folder = os.path.join(self.rollup_folder, f"{resolution}s")
+            if not os.path.isdir(folder):
+                continue
+            for camera in os.listdir(folder):
+                for name in os.listdir(os.path.join(folder, camera)):
+                    if expired(name, self.retention_days[resolution]):
+                        os.remove(os.path.join(folder, camera, name))
+
+    def shutdown(self):
+        self.running = False
+        self.flush()
+
+    # Queries
+    def list_cameras(self):
+        with self.lock:
+            return dict(self.cameras), dict(self.classes)
+
+    def _rows(self, resolution, camera, start, end):
+        """Rollup rows for [start, end) at `resolution`; zeros where nothing was stored"""
+        parts = []
+        for day in range(day_index(start), day_index(end - 1) + 1):
+            day_start = day * DAY_SECONDS
+            first = max(int((start - day_start) // resolution), 0)
+            last = min(int(-(-(end - day_start) // resolution)), DAY_SECONDS // resolution)
+            path = self._rollup_path(resolution, camera, day)
+            if os.path.exists(path):
+                parts.append(np.load(path, mmap_mode='r')[first:last])
+            else:
+                parts.append(np.zeros((last - first, ROLLUP_COLUMNS), dtype=np.float32))
+        return np.concatenate(parts) if parts else np.zeros((0, ROLLUP_COLUMNS), dtype=np.float32)
+
+    def histogram(self, start, end, bucket_seconds=60, camera_id=None):
+        """
+        Bucketed activity between `start` and `end` (epoch seconds). Uses the
+        coarsest rollup that divides `bucket_seconds`; buckets are aligned to
+        multiples of `bucket_seconds` since the epoch. Ranges reaching past the
+        per-second retention have their buckets rounded up to whole minutes.
+        Classes sharing the last count column are reported as 'other'.
+        """
+        bucket_seconds = max(int(bucket_seconds), 1)
+        if bucket_seconds % 60 and day_index(start) < day_index(time.time()) - self.retention_days[1]:
+            bucket_seconds = -(-bucket_seconds // 60) * 60
+        resolution = next(r for r in reversed(RESOLUTIONS) if bucket_seconds % r == 0)
+        start = int(start // bucket_seconds * bucket_seconds)
+        end = int(-(-end // bucket_seconds) * bucket_seconds)
+        bucket_count = (end - start) // bucket_seconds
+
+        with self.lock:
+            cameras = dict(self.cameras)
+            classes = dict(self.classes)
+        if camera_id is not None:
+            cameras = {camera_id: cameras[camera_id]} if camera_id in cameras else {}
+
+        totals = np.zeros((bucket_count, ROLLUP_COLUMNS), dtype=np.float64)
+        per_bucket = bucket_seconds // resolution
+        for index in cameras.values():
+            rows = self._rows(resolution, index, start, end).reshape(bucket_count, per_bucket, ROLLUP_COLUMNS)
+            maxima = np.maximum(totals[:, MAX_CONFIDENCE], rows[:, :, MAX_CONFIDENCE].max(axis=1))
+            totals += rows.sum(axis=1, dtype=np.float64)
+            totals[:, MAX_CONFIDENCE] = maxima
+
+        by_class = {}
+        overflow = [name for name, index in classes.items() if index >= OTHER_CLASS]
+        for name, index in classes.items():
+            if index < OTHER_CLASS:
+                by_class[name] = totals[:, CLASS_OFFSET + index].astype(np.int64).tolist()
+        if overflow:
+            name = overflow[0] if len(overflow) == 1 else 'other'
+            by_class[name] = totals[:, CLASS_OFFSET + OTHER_CLASS].astype(np.int64).tolist()
+        return {
+            'start': start,
+            'end': end,
+            'bucket_seconds': bucket_seconds,
+            'resolution_seconds': resolution,
+            'buckets': list(range(start, end, bucket_seconds)),
+            'frames': totals[:, FRAMES].astype(np.int64).tolist(),
+            'detection_frames': totals[:, DETECTION_FRAMES].astype(np.int64).tolist(),
+            'detections': totals[:, DETECTIONS].astype(np.int64).tolist(),
+            'max_confidence': np.round(totals[:, MAX_CONFIDENCE], 3).tolist(),
+            'by_class': by_class
+        }
+
+    def events(self, start, end, camera_id=None, class_name=None, limit=1000):
+        """Raw detections between `start` and `end`, oldest first"""
+        with self.lock:
+            pending = self.buffer[:self.buffered].copy()
+            camera = self.cameras.get(camera_id) if camera_id is not None else None
+            cls = self.classes.get(class_name) if class_name is not None else None
+            names = {index: name for name, index in self.cameras.items()}
+            class_names = {index: name for name, index in self.classes.items()}
+        if (camera_id is not None and camera is None) or (class_name is not None and cls is None):
+            return []
+
+        def chunks():
+            for day in range(day_index(start), day_index(end) + 1):
+                folder = os.path.join(self.raw_folder, day_name(day))
+                if not os.path.isdir(folder):
+                    continue
+                files = [name for name in os.listdir(folder) if name.endswith('.npy')]
+                for name in sorted(files, key=lambda n: int(n.split('-')[0])):
+                    first_ms, last_ms = (int(v) for v in name[:-4].split('-'))
+                    if last_ms >= start * 1000 and first_ms <= end * 1000:
+                        yield np.load(os.path.join(folder, name), mmap_mode='r')
+            # Detections not flushed yet are the newest
+            yield pending
+
+        events = []
+        for rows in chunks():
+            mask = (rows['ts'] >= start) & (rows['ts'] < end)
+            if camera is not None:
+                mask &= rows['camera'] == camera
+            if cls is not None:
+                mask &= rows['cls'] == cls
+            for row in rows[mask][:limit - len(events)]:
+                events.append({
+                    'timestamp': float(row['ts']),
+                    'camera': names.get(int(row['camera'])),
+                    'class': class_names.get(int(row['cls'])),
+                    'confidence': round(float(row['conf']), 3),
+                    'bbox': {'x1': float(row['x1']), 'y1': float(row['y1']),
+                             'x2': float(row['x2']), 'y2': float(row['y2'])}
+                })
+            if len(events) >= limit:
+                break
+        return events
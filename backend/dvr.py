@@ -0,0 +1,431 @@
+"""
+Always-on segmented DVR.
+
+Each recorded camera is encoded once, on its own thread, into short
+fixed-length MP4 segments kept in a bounded ring on disk (by age and by
+size). Alert clips are cut afterwards by concatenating the segments that
+cover the requested span with FFmpeg's concat demuxer (`-c copy`), so
+pre-roll up to the retention window costs no memory and no extra encoding.
+Without an `ffmpeg` binary, clips fall back to re-encoding the segments
+with OpenCV.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.mp4'
+PARTIAL_SUFFIX = '.part' + SEGMENT_SUFFIX  # Being written; never listed or exported
+
+
+class Segment:
+    """A finished segment; `start`/`end` are wall-clock seconds"""
+
+    __slots__ = ('path', 'start', 'end', 'size')
+
+    def __init__(self, path, start, end, size):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.size = size
+
+    def to_dict(self):
+        return {'file': os.path.basename(self.path), 'start': self.start, 'end': self.end, 'size': self.size}
+
+
+def _segment_name(start, end):
+    return f"{int(start * 1000)}_{int(end * 1000)}{SEGMENT_SUFFIX}"
+
+
+def _parse_segment_name(name):
+    if not name.endswith(SEGMENT_SUFFIX):
+        return None
+    try:
+        start, end = name[:-len(SEGMENT_SUFFIX)].split('_')
+        return int(start) / 1000.0, int(end) / 1000.0
+    except ValueError:
+        return None
+
+
+def _load_segments(folder):
+    """Finished segments on disk, oldest first; removes partial ones left by a crash"""
+    segments = deque()
+    if not os.path.isdir(folder):
+        return segments
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if name.endswith(PARTIAL_SUFFIX):
+            # The container was never finalized
+            os.remove(path)
+            continue
+        span = _parse_segment_name(name)
+        if span is not None:
+            segments.append(Segment(path, span[0], span[1], os.path.getsize(path)))
+    return segments
+
+
+class _CameraRecorder:
+    """
+    Reads one capture as its own consumer and writes constant-rate segments.
+
+    The newest frame is repeated for output slots the camera did not fill
+    and surplus frames are skipped, so segment time matches wall time. A gap
+    longer than `max_gap` or a resolution change starts a new segment.
+    """
+
+    def __init__(self, dvr, camera_id, capture, folder):
+        self.dvr = dvr
+        self.camera_id = camera_id
+        self.capture = capture
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.segments = _load_segments(folder)
+        self.writer = None
+        self.partial_path = None
+        self.segment_start = None
+        self.last_end = None
+        self.written = 0
+        self.frame_size = None
+        self.last_frame_at = None
+        self.errors = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"dvr-{self.camera_id}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def _open_segment(self, now, frame):
+        height, width = frame.shape[:2]
+        self.partial_path = os.path.join(self.folder, f"{int(now * 1000)}{PARTIAL_SUFFIX}")
+        self.writer = cv2.VideoWriter(self.partial_path, cv2.VideoWriter_fourcc(*self.dvr.fourcc),
+                                      self.dvr.fps, (width, height))
+        if not self.writer.isOpened():
+            self.writer = None
+            raise RuntimeError(f"Could not open segment writer for {self.camera_id}")
+        # Back-to-back segments share a boundary instead of overlapping by a rounded-up frame
+        self.segment_start = now if self.last_end is None else max(now, self.last_end)
+        self.written = 0
+        self.frame_size = (height, width)
+
+    def _close_segment(self):
+        if self.writer is None:
+            return
+        self.writer.release()
+        self.writer = None
+        if not self.written:
+            os.remove(self.partial_path)
+            return
+        end = self.last_end = self.segment_start + self.written / self.dvr.fps
+        path = os.path.join(self.folder, _segment_name(self.segment_start, end))
+        os.replace(self.partial_path, path)
+        segment = Segment(path, self.segment_start, end, os.path.getsize(path))
+        self.dvr._segment_closed(self, segment)
+
+    def _run(self):
+        try:
+            while self.running:
+                ret, frame = self.capture.read(timeout=0.5)
+                now = time.time()
+                if not ret:
+                    if not self.capture.isOpened():
+                        break
+                    if self.writer is not None and now - self.last_frame_at > self.dvr.max_gap:
+                        self._close_segment()
+                    continue
+
+                if self.writer is not None and (frame.shape[:2] != self.frame_size
+                                                or now - self.last_frame_at > self.dvr.max_gap):
+                    self._close_segment()
+                if self.writer is None:
+                    self._open_segment(now, frame)
+
+                due = max(int((now - self.segment_start) * self.dvr.fps), 0) + 1
+                while self.written < due:
+                    self.writer.write(frame)
+                    self.written += 1
+                self.last_frame_at = now
+                if self.written >= self.dvr.segment_frames:
+                    self._close_segment()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"DVR recorder {self.camera_id} error: {e}")
+        finally:
+            try:
+                self._close_segment()
+            except Exception as e:
+                logger.error(f"DVR recorder {self.camera_id} failed to close segment: {e}")
+            self.running = False
+            self.dvr._recorder_stopped(self)
+
+    def stats(self):
+        total = sum(segment.size for segment in self.segments)
+        return {
+            'recording': self.running,
+            'segments': len(self.segments),
+            'bytes': total,
+            'oldest': self.segments[0].start if self.segments else None,
+            'newest': self.segments[-1].end if self.segments else None,
+            'errors': self.errors
+        }
+
+
+class SegmentedDvr:
+    """
+    Rolling per-camera segment ring plus a clip exporter.
+
+    `request_clip` may be called before the end of the event is known (`end`
+    None) and closed later with `finish_clip`; the clip is exported once the
+    segments covering its end have been written. Segments a pending clip
+    still needs are not pruned.
+    """
+
+    def __init__(self, root, segment_seconds=4.0, fps=15.0, retention_seconds=900.0, max_bytes_per_camera=None,
+                 ffmpeg='ffmpeg', fourcc='mp4v', export_workers=1, max_gap=2.0):
+        self.root = root
+        self.segment_seconds = segment_seconds
+        self.fps = fps
+        self.segment_frames = max(1, int(round(segment_seconds * fps)))
+        self.retention_seconds = retention_seconds
+        self.max_bytes_per_camera = max_bytes_per_camera
+        self.ffmpeg = shutil.which(ffmpeg) if ffmpeg else None
+        self.fourcc = fourcc
+        self.max_gap = max_gap
+        self.recorders = {}
+        self.clips = {}  # clip id -> clip dict
+        self.finished_clips = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=export_workers, thread_name_prefix='dvr-clip')
+        os.makedirs(root, exist_ok=True)
+        if self.ffmpeg is None:
+            logger.warning("ffmpeg not found; DVR clips will be re-encoded instead of concatenated")
+
+    def _folder(self, camera_id):
+        return os.path.join(self.root, "".join(c if c.isalnum() or c in '-_.' else '_' for c in camera_id))
+
+    # Recording
+    def start(self, camera_id, capture):
+        """Record `capture` (a CaptureSource) under `camera_id`"""
+        self.stop(camera_id)
+        recorder = _CameraRecorder(self, camera_id, capture, self._folder(camera_id))
+        with self.lock:
+            self.recorders[camera_id] = recorder
+            self._prune(recorder)
+        recorder.start()
+        logger.info(f"DVR recording {camera_id} in {self.segment_seconds:g}s segments at {self.fps:g} fps")
+
+    def stop(self, camera_id):
+        with self.lock:
+            recorder = self.recorders.get(camera_id)
+        if recorder is not None:
+            recorder.stop()
+
+    def _segment_closed(self, recorder, segment):
+        with self.lock:
+            recorder.segments.append(segment)
+            self._prune(recorder)
+            self._dispatch_ready(recorder.camera_id)
+
+    def _recorder_stopped(self, recorder):
+        with self.lock:
+            if self.recorders.get(recorder.camera_id) is recorder:
+                del self.recorders[recorder.camera_id]
+            # Nothing more will be written; export whatever is covered
+            for clip in self.clips.values():
+                if clip['camera_id'] == recorder.camera_id and clip['status'] == 'pending':
+                    if clip['end'] is None:
+                        clip['end'] = recorder.segments[-1].end if recorder.segments else clip['start']
+            self._dispatch_ready(recorder.camera_id, final=True, segments=recorder.segments)
+
+    def _prune(self, recorder):
+        """Drop segments past retention or over the byte cap, keeping those a pending clip needs"""
+        protected_from = min((clip['start'] for clip in self.clips.values()
+                              if clip['camera_id'] == recorder.camera_id and clip['status'] == 'pending'),
+                             default=None)
+        cutoff = time.time() - self.retention_seconds
+        total = sum(segment.size for segment in recorder.segments)
+        while recorder.segments:
+            oldest = recorder.segments[0]
+            over_age = oldest.end < cutoff
+            over_size = self.max_bytes_per_camera is not None and total > self.max_bytes_per_camera
+            if not (over_age or over_size) or (protected_from is not None and oldest.end >= protected_from):
+                break
+            recorder.segments.popleft()
+            total -= oldest.size
+            try:
+                os.remove(oldest.path)
+            except OSError as e:
+                logger.warning(f"Could not remove DVR segment {oldest.path}: {e}")
+
+    # Clips
+    def request_clip(self, camera_id, start, end=None, path=None, on_done=None):
+        """Queue a clip covering [start, end]; returns its id"""
+        clip = {
+            'id': str(uuid.uuid4())[:8],
+            'camera_id': camera_id,
+            'start': start,
+            'end': end,
+            'path': path,
+            'status': 'pending',
+            'requested_at': time.time(),
+            'on_done': on_done
+        }
+        with self.lock:
+            self.clips[clip['id']] = clip
+            recorder = self.recorders.get(camera_id)
+            if recorder is None:
+                # Not recording now: export from whatever is on disk
+                if clip['end'] is None:
+                    clip['end'] = time.time()
+                self._dispatch_ready(camera_id, final=True, segments=_load_segments(self._folder(camera_id)))
+            else:
+                self._dispatch_ready(camera_id)
+        return clip['id']
+
+    def finish_clip(self, clip_id, end=None):
+        """Set the end of an open clip; it is exported once that time is on disk"""
+        with self.lock:
+            clip = self.clips.get(clip_id)
+            if clip is None or clip['status'] != 'pending':
+                return False
+            clip['end'] = end or time.time()
+            recorder = self.recorders.get(clip['camera_id'])
+            if recorder is None:
+                self._dispatch_ready(clip['camera_id'], final=True,
+                                     segments=_load_segments(self._folder(clip['camera_id'])))
+            else:
+                self._dispatch_ready(clip['camera_id'])
+        return True
+
+    def _dispatch_ready(self, camera_id, final=False, segments=None):
+        if segments is None:
+            segments = self.recorders[camera_id].segments
+        written_until = segments[-1].end if segments else None
+        for clip in self.clips.values():
+            if clip['camera_id'] != camera_id or clip['status'] != 'pending' or clip['end'] is None:
+                continue
+            if final or (written_until is not None and written_until >= clip['end']):
+                chosen = [segment for segment in segments
+                          if segment.end > clip['start'] and segment.start < clip['end']]
+                clip['status'] = 'exporting'
+                self.executor.submit(self._export, clip, chosen)
+
+    def _export(self, clip, segments):
+        started = time.perf_counter()
+        try:
+            if not segments:
+                raise RuntimeError("No DVR segments cover the requested span")
+            path = clip['path'] or os.path.join(self.root, f"clip_{clip['camera_id']}_{clip['id']}{SEGMENT_SUFFIX}")
+            # Built next to the segments so listings of the destination never see a half-written clip
+            partial = os.path.join(self.root, f"clip_{clip['id']}{PARTIAL_SUFFIX}")
+            if self.ffmpeg is not None:
+                self._concat(segments, partial)
+                method = 'concat'
+            else:
+                self._reencode(segments, partial)
+                method = 'reencode'
+            shutil.move(partial, path)
+            clip.update(status='done', path=path, method=method, size=os.path.getsize(path),
+                        clip_start=segments[0].start, clip_end=segments[-1].end, segments=len(segments),
+                        spans=[(segment.start, segment.end) for segment in segments],
+                        export_ms=round((time.perf_counter() - started) * 1000, 1))
+            logger.info(f"DVR clip {os.path.basename(path)} from {len(segments)} segments ({method})")
+        except Exception as e:
+            clip.update(status='failed', error=str(e))
+            logger.error(f"DVR clip {clip['id']} for {clip['camera_id']} failed: {e}")
+
+        with self.lock:
+            self.clips.pop(clip['id'], None)
+            self.finished_clips.append(clip)
+        if clip['on_done'] is not None:
+            try:
+                clip['on_done'](self._public(clip))
+            except Exception as e:
+                logger.error(f"DVR clip callback error: {e}")
+
+    def _concat(self, segments, output):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as listing:
+            for segment in segments:
+                listing.write(f"file '{os.path.abspath(segment.path)}'\n")
+        try:
+            subprocess.run([self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+                            '-i', listing.name, '-c', 'copy', '-movflags', '+faststart', '-f', 'mp4', output],
+                           check=True, capture_output=True, timeout=120)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(e.stderr.decode(errors='replace').strip() or str(e))
+        finally:
+            os.remove(listing.name)
+
+    def _reencode(self, segments, output):
+        writer = None
+        try:
+            for segment in segments:
+                reader = cv2.VideoCapture(segment.path)
+                while True:
+                    ret, frame = reader.read()
+                    if not ret:
+                        break
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                                 (width, height))
+                    writer.write(frame)
+                reader.release()
+        finally:
+            if writer is not None:
+                writer.release()
+        if writer is None:
+            raise RuntimeError("DVR segments contained no frames")
+
+    @staticmethod
+    def _public(clip):
+        return {key: value for key, value in clip.items() if key != 'on_done'}
+
+    def get_clip(self, clip_id):
+        with self.lock:
+            clip = self.clips.get(clip_id) or next(
+                (clip for clip in self.finished_clips if clip['id'] == clip_id), None)
+            return self._public(clip) if clip else None
+
+    def segments(self, camera_id, start=None, end=None):
+        with self.lock:
+            recorder = self.recorders.get(camera_id)
+            segments = list(recorder.segments) if recorder else None
+        if segments is None:
+            segments = list(_load_segments(self._folder(camera_id)))
+        return [segment.to_dict() for segment in segments
+                if (start is None or segment.end > start) and (end is None or segment.start < end)]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'segment_seconds': self.segment_seconds,
+                'fps': self.fps,
+                'retention_seconds': self.retention_seconds,
+                'clip_method': 'concat' if self.ffmpeg else 'reencode',
+                'cameras': {camera_id: recorder.stats() for camera_id, recorder in self.recorders.items()},
+                'pending_clips': [self._public(clip) for clip in self.clips.values()],
+                'recent_clips': [self._public(clip) for clip in list(self.finished_clips)[-20:]]
+            }
+
+    def shutdown(self):
+        for camera_id in list(self.recorders):
+            self.stop(camera_id)
+        self.executor.shutdown(wait=True)
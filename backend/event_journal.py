@@ -0,0 +1,154 @@
+"""
+Sequence-numbered journal of discrete dashboard events.
+
+Alerts, recording start/stop and SOS uploads are appended here before they
+are broadcast, each with a monotonically increasing `seq`. The newest
+`max_events` stay in memory; every event is also appended to rotating JSONL
+segments on disk, which keeps older events available and lets the sequence
+continue across restarts. A reconnecting client asks for everything after
+the last `seq` it saw and gets the missed events in one batch, instead of
+refetching alerts and recordings over REST.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EventJournal:
+    """
+    `since(seq)` answers from memory when it can and from the disk segments
+    otherwise. `reset` in the answer means events after `seq` are no longer
+    retained (or the journal was wiped), so the client should refetch its
+    state rather than trust the batch to be complete.
+    """
+
+    def __init__(self, folder, max_events=2000, segment_events=1000, max_segments=20):
+        self.folder = folder
+        self.segment_events = segment_events
+        self.max_segments = max_segments
+        self.events = deque(maxlen=max_events)
+        self.segments = []  # (first seq, path), oldest first
+        self.last_seq = 0
+        self.lock = threading.Lock()
+        self.file = None
+        self.file_events = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    # Persistence
+    def _load(self):
+        for name in sorted(os.listdir(self.folder)):
+            if name.startswith('events_') and name.endswith('.jsonl'):
+                try:
+                    self.segments.append((int(name[7:-6]), os.path.join(self.folder, name)))
+                except ValueError:
+                    continue
+
+        # Newest segments first until memory is full; the sequence continues after the last event on disk
+        loaded = []
+        for _, path in reversed(self.segments):
+            loaded = self._read_segment(path) + loaded
+            if len(loaded) >= self.events.maxlen:
+                break
+        self.events.extend(loaded)
+        if loaded:
+            self.last_seq = loaded[-1]['seq']
+        logger.info(f"Event journal resumed at seq {self.last_seq} ({len(self.segments)} segments)")
+
+    @staticmethod
+    def _read_segment(path):
+        events = []
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue  # Torn final line after a crash
+        except OSError as e:
+            logger.warning(f"Could not read event journal segment {path}: {e}")
+        return events
+
+    def _rotate(self, first_seq):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.folder, f"events_{first_seq:012d}.jsonl")
+        self.file = open(path, 'a', buffering=1)
+        self.file_events = 0
+        self.segments.append((first_seq, path))
+        while len(self.segments) > self.max_segments:
+            _, old_path = self.segments.pop(0)
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                logger.warning(f"Could not remove event journal segment {old_path}: {e}")
+
+    # Journal
+    def append(self, event, data):
+        """Record an event and return it with its `seq`"""
+        with self.lock:
+            self.last_seq += 1
+            entry = {'seq': self.last_seq, 'event': event, 'time': time.time(), 'data': data}
+            self.events.append(entry)
+            try:
+                if self.file is None or self.file_events >= self.segment_events:
+                    self._rotate(entry['seq'])
+                self.file.write(json.dumps(entry, default=str) + '\n')
+                self.file_events += 1
+            except (OSError, TypeError, ValueError) as e:
+                logger.error(f"Failed to spill event {entry['seq']} to disk: {e}")
+            return entry
+
+    def since(self, seq, limit=500):
+        """Events after `seq`, oldest first: {'events', 'last_seq', 'has_more', 'reset'}"""
+        with self.lock:
+            last_seq = self.last_seq
+            memory_from = self.events[0]['seq'] if self.events else last_seq + 1
+            if seq > last_seq:
+                # The client saw a sequence this journal never issued: it was wiped
+                return {'events': list(self.events)[-limit:], 'last_seq': last_seq, 'has_more': False,
+                        'reset': True}
+            if seq + 1 >= memory_from:
+                start = seq + 1 - memory_from
+                events = [self.events[i] for i in range(start, min(start + limit, len(self.events)))]
+                return {'events': events, 'last_seq': last_seq,
+                        'has_more': bool(events) and events[-1]['seq'] < last_seq, 'reset': False}
+            segments = list(self.segments)
+
+        # Older than memory: read the segments that can hold seq + 1 onwards
+        reset = not segments or segments[0][0] > seq + 1
+        events = []
+        for i, (first_seq, path) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= seq + 1:
+                continue
+            for entry in self._read_segment(path):
+                if entry['seq'] > seq:
+                    events.append(entry)
+                    if len(events) >= limit:
+                        break
+            if len(events) >= limit:
+                break
+        return {'events': events, 'last_seq': last_seq,
+                'has_more': bool(events) and events[-1]['seq'] < last_seq, 'reset': reset}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'last_seq': self.last_seq,
+                'in_memory': len(self.events),
+                'oldest_in_memory': self.events[0]['seq'] if self.events else None,
+                'oldest_on_disk': self.segments[0][0] if self.segments else None,
+                'segments': len(self.segments)
+            }
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,15 @@
+"""
+Content hashes of files on disk, shared by the SOS ingest and the model registry.
+"""
+
+import hashlib
+
+HASH_BLOCK_SIZE = 256 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,443 @@
+"""
+Versioned weapon-model weights with background loading, shadow evaluation and hot swap.
+
+A new version (content-addressed by its SHA-256) is loaded and warmed up on
+a background thread while the live model keeps serving. It can then run in
+shadow: a sampled fraction of the frames the live model sees is handed to a
+single shadow worker that runs the candidate on the same image and compares
+latency and detections. Shadow work is dropped rather than queued when the
+worker is busy, so it never delays live inference. Promotion installs the
+candidate with one reference assignment, which detection calls pick up at
+their next frame; the replaced model stays loaded so rollback is just as
+fast. The live and previous versions are kept in `registry.json`, so a
+restart comes back on the promoted weights.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from file_hashing import file_sha256
+from tiling import box_overlaps
+
+logger = logging.getLogger(__name__)
+
+# loading -> ready -> live -> standby (kept loaded for rollback) -> retired (unloaded)
+VERSION_STATES = ('loading', 'ready', 'live', 'standby', 'retired', 'failed')
+
+
+def compare_detections(live, candidate, iou_threshold=0.5):
+    """(matched, live only, candidate only, confidence deltas); same-class boxes are paired greedily by IoU"""
+    if not live or not candidate:
+        return 0, len(live), len(candidate), []
+    boxes = np.array([[d['bbox']['x1'], d['bbox']['y1'], d['bbox']['x2'], d['bbox']['y2']]
+                      for d in live + candidate], dtype=np.float32)
+    iou = box_overlaps(boxes)[0][:len(live), len(live):]
+    same_class = np.array([[a['class'] == b['class'] for b in candidate] for a in live])
+    iou = np.where(same_class, iou, 0.0)
+
+    matched_live, matched_candidate, deltas = set(), set(), []
+    for flat in np.argsort(-iou, axis=None):
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        if i in matched_live or j in matched_candidate:
+            continue
+        matched_live.add(i)
+        matched_candidate.add(j)
+        deltas.append(candidate[j]['confidence'] - live[i]['confidence'])
+    matched = len(deltas)
+    return matched, len(live) - matched, len(candidate) - matched, deltas
+
+
+def _percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None}
+    p50, p95 = np.percentile(np.fromiter(values, dtype=np.float64), [50, 95])
+    return {'p50': round(float(p50), 2), 'p95': round(float(p95), 2)}
+
+
+class _ShadowStats:
+    def __init__(self, fraction, window):
+        self.fraction = fraction
+        self.started_at = time.time()
+        self.credit = 0.0
+        self.frames = 0
+        self.skipped_busy = 0
+        self.errors = 0
+        self.last_error = None
+        self.matched = 0
+        self.live_only = 0
+        self.candidate_only = 0
+        self.live_ms = deque(maxlen=window)
+        self.candidate_ms = deque(maxlen=window)
+        self.agreement = deque(maxlen=window)  # Per-frame F1 between the two detection sets
+        self.confidence_delta = deque(maxlen=window)
+
+    def record(self, live_ms, candidate_ms, matched, live_only, candidate_only, deltas):
+        self.frames += 1
+        self.matched += matched
+        self.live_only += live_only
+        self.candidate_only += candidate_only
+        self.live_ms.append(live_ms)
+        self.candidate_ms.append(candidate_ms)
+        total = 2 * matched + live_only + candidate_only
+        self.agreement.append(2 * matched / total if total else 1.0)
+        self.confidence_delta.extend(deltas)
+
+    def summary(self):
+        return {
+            'fraction': self.fraction,
+            'started_at': self.started_at,
+            'frames': self.frames,
+            'skipped_busy': self.skipped_busy,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            # Both latencies are measured while the other model shares the hardware
+            'live_ms': _percentiles(self.live_ms),
+            'candidate_ms': _percentiles(self.candidate_ms),
+            'agreement': round(float(np.mean(self.agreement)), 4) if self.agreement else None,
+            'matched': self.matched,
+            'live_only': self.live_only,
+            'candidate_only': self.candidate_only,
+            'mean_confidence_delta': (round(float(np.mean(self.confidence_delta)), 4)
+                                      if self.confidence_delta else None)
+        }
+
+
+class _Version:
+    def __init__(self, version_id, path, sha256):
+        self.id = version_id
+        self.path = path
+        self.sha256 = sha256
+        self.model = None
+        self.status = 'loading'
+        self.error = None
+        self.created_at = time.time()
+        self.loaded_at = None
+        self.promoted_at = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.shadow = None
+
+    def info(self):
+        return {
+            'version': self.id,
+            'path': self.path,
+            'sha256': self.sha256,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'loaded_at': self.loaded_at,
+            'promoted_at': self.promoted_at,
+            'load_ms': self.load_ms,
+            'warmup_ms': self.warmup_ms,
+            'shadow': self.shadow.summary() if self.shadow else None
+        }
+
+
+class ModelRegistry:
+    """
+    `loader(path)` returns a model, `infer(model, image, params)` returns
+    its detections for one frame and `apply(model, path)` installs the live
+    model. Only one candidate shadows the live model at a time, and only one
+    standby version is kept loaded besides the live one.
+    """
+
+    def __init__(self, folder, loader, infer=None, apply=None, warmup_size=640, warmup_runs=3,
+                 shadow_iou=0.5, shadow_window=1000):
+        self.folder = folder
+        self.state_path = os.path.join(folder, 'registry.json')
+        self.loader = loader
+        self.infer = infer
+        self.apply = apply
+        self.warmup_size = warmup_size
+        self.warmup_runs = warmup_runs
+        self.shadow_iou = shadow_iou
+        self.shadow_window = shadow_window
+        self.versions = {}
+        self.live_id = None
+        self.previous_id = None
+        self.shadow_id = None
+        self.shadow_busy = False
+        self.shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-shadow')
+        self.swaps = deque(maxlen=100)
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    # Persistence
+    def _read_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read model registry {self.state_path}: {e}")
+            return {}
+
+    def _save(self):
+        """Caller holds the lock"""
+        state = {
+            'live': self.live_id,
+            'previous': self.previous_id,
+            'versions': {version.id: {'path': version.path, 'sha256': version.sha256,
+                                      'created_at': version.created_at, 'promoted_at': version.promoted_at}
+                         for version in self.versions.values() if version.status != 'failed'}
+        }
+        try:
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.error(f"Could not save model registry: {e}")
+
+    def load_initial(self, default_path):
+        """Synchronously load the persisted live version, or `default_path` on first start; returns the model"""
+        state = self._read_state()
+        for version_id, entry in state.get('versions', {}).items():
+            if os.path.exists(entry.get('path', '')):
+                version = _Version(version_id, entry['path'], entry.get('sha256'))
+                version.status = 'retired'
+                version.created_at = entry.get('created_at') or version.created_at
+                version.promoted_at = entry.get('promoted_at')
+                self.versions[version_id] = version
+
+        live = self.versions.get(state.get('live'))
+        if live is None:
+            sha256 = file_sha256(default_path)
+            live = self.versions.get(sha256[:12]) or _Version(sha256[:12], default_path, sha256)
+            self.versions[live.id] = live
+        elif live.path != default_path:
+            logger.info(f"Model registry: starting on promoted version {live.id} ({live.path})")
+
+        started = time.perf_counter()
+        try:
+            live.model = self.loader(live.path)
+        except Exception as e:
+            live.status = 'failed'
+            live.error = str(e)
+            raise
+        live.load_ms = round((time.perf_counter() - started) * 1000, 1)
+        live.status = 'live'
+        live.loaded_at = time.time()
+        with self.lock:
+            self.live_id = live.id
+            previous_id = state.get('previous')
+            self.previous_id = previous_id if previous_id in self.versions and previous_id != live.id else None
+            self._save()
+        return live.model
+
+    # Loading
+    def _warmup(self, model):
+        """Run a few blank frames so the first live frame does not pay for lazy initialisation"""
+        if self.infer is None or not self.warmup_runs:
+            return None
+        frame = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+        elapsed = None
+        for _ in range(self.warmup_runs):
+            started = time.perf_counter()
+            self.infer(model, frame, None)
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+        return elapsed
+
+    def stage(self, path, shadow_fraction=0.0, promote=False):
+        """Register weights and load them in the background; returns the version info"""
+        if not os.path.isfile(path):
+            raise ValueError(f"Model file not found: {path}")
+        sha256 = file_sha256(path)
+        version_id = sha256[:12]
+        with self.lock:
+            version = self.versions.get(version_id)
+            if version is not None and version.status not in ('retired', 'failed'):
+                return version.info()
+            if version is None:
+                version = _Version(version_id, path, sha256)
+                self.versions[version_id] = version
+            version.path = path
+            version.status = 'loading'
+            version.error = None
+            self._save()
+        threading.Thread(target=self._load, args=(version, shadow_fraction, promote),
+                         name=f"model-load-{version_id}", daemon=True).start()
+        logger.info(f"Loading model version {version_id} from {path}")
+        return version.info()
+
+    def _load(self, version, shadow_fraction, promote):
+        try:
+            started = time.perf_counter()
+            model = self.loader(version.path)
+            load_ms = round((time.perf_counter() - started) * 1000, 1)
+            warmup_ms = self._warmup(model)
+        except Exception as e:
+            with self.lock:
+                version.status = 'failed'
+                version.error = str(e)
+            logger.error(f"Failed to load model version {version.id}: {e}")
+            return
+
+        with self.lock:
+            version.model = model
+            version.status = 'ready'
+            version.loaded_at = time.time()
+            version.load_ms = load_ms
+            version.warmup_ms = warmup_ms
+        logger.info(f"Model version {version.id} ready (load {load_ms} ms, warm-up {warmup_ms} ms)")
+        try:
+            if promote:
+                self.promote(version.id)
+            elif shadow_fraction:
+                self.start_shadow(version.id, shadow_fraction)
+        except (KeyError, ValueError) as e:
+            logger.warning(f"Model version {version.id}: {e}")
+
+    def unload(self, version_id):
+        """Free a loaded candidate or standby version; its file stays registered"""
+        with self.lock:
+            version = self._get(version_id)
+            if version.status == 'live':
+                raise ValueError("The live model cannot be unloaded; promote or roll back first")
+            if version.status == 'loading':
+                raise ValueError(f"Model {version_id} is still loading")
+            if self.shadow_id == version_id:
+                self.shadow_id = None
+            version.model = None
+            version.status = 'retired'
+            return version.info()
+
+    # Shadow evaluation
+    def start_shadow(self, version_id, fraction):
+        """Compare a loaded version against the live one on `fraction` of the live frames; 0 stops"""
+        fraction = min(max(float(fraction), 0.0), 1.0)
+        with self.lock:
+            if fraction == 0.0:
+                self.shadow_id = None
+                return None
+            version = self._get(version_id)
+            if version.status not in ('ready', 'standby') or version.model is None:
+                raise ValueError(f"Model {version_id} is {version.status}; only loaded, non-live versions can shadow")
+            version.shadow = _ShadowStats(fraction, self.shadow_window)
+            self.shadow_id = version_id
+            logger.info(f"Model version {version_id} shadowing {fraction:.0%} of live frames")
+            return version.info()
+
+    def observe(self, image, detections, live_ms, params=None):
+        """Called after each live full-frame inference; passes a sampled share of frames to the shadow worker"""
+        if self.shadow_id is None:
+            return
+        with self.lock:
+            version = self.versions.get(self.shadow_id)
+            if version is None or version.model is None or version.shadow is None:
+                return
+            stats = version.shadow
+            # Credit sampling spreads shadow frames evenly instead of in random bursts
+            stats.credit += stats.fraction
+            if stats.credit < 1.0:
+                return
+            stats.credit -= 1.0
+            if self.shadow_busy:
+                stats.skipped_busy += 1
+                return
+            self.shadow_busy = True
+            model = version.model
+        self.shadow_executor.submit(self._shadow_run, model, stats, image, detections, live_ms, params)
+
+    def _shadow_run(self, model, stats, image, live, live_ms, params):
+        try:
+            started = time.perf_counter()
+            candidate = self.infer(model, image, params)
+            candidate_ms = (time.perf_counter() - started) * 1000
+            matched, live_only, candidate_only, deltas = compare_detections(live, candidate, self.shadow_iou)
+            with self.lock:
+                stats.record(live_ms, candidate_ms, matched, live_only, candidate_only, deltas)
+        except Exception as e:
+            with self.lock:
+                stats.errors += 1
+                stats.last_error = str(e)
+        finally:
+            with self.lock:
+                self.shadow_busy = False
+
+    # Swapping
+    def _get(self, version_id):
+        version = self.versions.get(version_id)
+        if version is None:
+            raise KeyError(f"Unknown model version: {version_id}")
+        return version
+
+    def _swap(self, version, action):
+        """Install `version` as live; caller holds the lock and has checked it is loaded"""
+        current = self.versions.get(self.live_id)
+        self.apply(version.model, version.path)
+        if current is not None and current is not version:
+            previous = self.versions.get(self.previous_id)
+            if previous is not None and previous is not version:
+                # Only one standby stays in memory
+                previous.model = None
+                previous.status = 'retired'
+            current.status = 'standby'
+            self.previous_id = current.id
+        elif self.previous_id == version.id:
+            self.previous_id = None
+        version.status = 'live'
+        version.promoted_at = time.time()
+        self.live_id = version.id
+        if self.shadow_id == version.id:
+            self.shadow_id = None
+        self.swaps.append({'time': version.promoted_at, 'action': action,
+                           'from': current.id if current else None, 'to': version.id})
+        self._save()
+        logger.info(f"Model {action}: {current.id if current else None} -> {version.id}")
+        return version.info()
+
+    def promote(self, version_id):
+        """Make a loaded version live; in-flight frames finish on the old model"""
+        with self.lock:
+            version = self._get(version_id)
+            if version.status == 'live':
+                return version.info()
+            if version.model is None:
+                raise ValueError(f"Model {version_id} is {version.status}, not loaded")
+            return self._swap(version, 'promote')
+
+    def rollback(self):
+        """Swap back to the previous live version, reloading it first if it was unloaded"""
+        with self.lock:
+            previous = self.versions.get(self.previous_id)
+            if previous is None:
+                raise ValueError("No previous model version to roll back to")
+            model = previous.model
+        if model is None:
+            # Only after a restart or unload; live frames keep running while it loads
+            model = self.loader(previous.path)
+            self._warmup(model)
+        with self.lock:
+            if self.previous_id != previous.id:
+                raise ValueError("The model changed while rolling back; retry")
+            previous.model = model
+            return self._swap(previous, 'rollback')
+
+    def live_path(self):
+        with self.lock:
+            version = self.versions.get(self.live_id)
+            return version.path if version else None
+
+    def status(self):
+        with self.lock:
+            return {
+                'live': self.live_id,
+                'previous': self.previous_id,
+                'shadow': self.shadow_id,
+                'versions': [version.info() for version in self.versions.values()],
+                'swaps': list(self.swaps)
+            }
+
+    def shutdown(self):
+        self.shadow_executor.shutdown(wait=False, cancel_futures=True)
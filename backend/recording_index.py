@@ -0,0 +1,361 @@
+"""
+Detection sidecar index for recorded clips.
+
+Next to every clip the recorder writes `<clip>.idx`, a small binary file
+with the wall-clock time of each frame, the byte offset and size of every
+keyframe (read from the MP4 sample tables, no decoding) and each detection
+mapped to its frame. From it the backend serves a detection timeline with
+seekable byte ranges, and cuts stills or short highlight clips by seeking to
+the nearest keyframe instead of decoding the whole file.
+
+Layout (little endian): header, class names (newline separated UTF-8),
+then the frame time, keyframe and detection arrays.
+"""
+
+import os
+import shutil
+import struct
+import subprocess
+
+import cv2
+import numpy as np
+
+INDEX_SUFFIX = '.idx'
+MAGIC = b'SDIX'
+VERSION = 1
+# magic, version, reserved, clip start (epoch), fps, frames, keyframes, detections, class name bytes
+HEADER = struct.Struct('<4sHHdfIIII')
+KEYFRAME_DTYPE = np.dtype([('frame', '<u4'), ('media_time', '<f4'), ('offset', '<u8'), ('size', '<u4')])
+DETECTION_DTYPE = np.dtype([('frame', '<u4'), ('time', '<f4'), ('cls', 'u1'), ('conf', '<f4'),
+                            ('x1', '<f4'), ('y1', '<f4'), ('x2', '<f4'), ('y2', '<f4')])
+HIGHLIGHT_GAP_SECONDS = 1.0  # Detections closer than this form one highlight
+
+
+def index_path(video_path):
+    return os.path.splitext(video_path)[0] + INDEX_SUFFIX
+
+
+# -------------------------------
+# MP4 sample tables
+# -------------------------------
+def _boxes(data, start=0, end=None):
+    """(type, payload start, payload end) for each box in data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            break
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _read_moov(path):
+    """Only the moov box is read; media data is skipped by seeking"""
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            size, kind = struct.unpack('>I4s', f.read(8))
+            header = 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                header = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header:
+                break
+            if kind == b'moov':
+                return f.read(size - header)
+            pos += size
+    raise ValueError(f"No moov box in {path}")
+
+
+def _find(data, start, end, kind):
+    for box_kind, box_start, box_end in _boxes(data, start, end):
+        if box_kind == kind:
+            return box_start, box_end
+    return None
+
+
+def _table(data, span, fmt, fields):
+    """Entries of a full-box table: version/flags, entry count, then `fields` `fmt` values per entry"""
+    start, _ = span
+    count = struct.unpack_from('>I', data, start + 4)[0]
+    dtype = np.dtype('>' + fmt) if fields == 1 else np.dtype(','.join(['>' + fmt] * fields))
+    values = np.frombuffer(data, dtype=dtype, count=count, offset=start + 8)
+    if fields == 1:
+        return values.astype(np.int64)
+    return np.stack([values[name].astype(np.int64) for name in values.dtype.names], axis=1)
+
+
+def parse_mp4_index(path):
+    """
+    Per-sample media time, byte offset and size of the first video track,
+    and the indexes of its keyframes (sync samples).
+    """
+    moov = _read_moov(path)
+    for kind, trak_start, trak_end in _boxes(moov):
+        if kind != b'trak':
+            continue
+        mdia = _find(moov, trak_start, trak_end, b'mdia')
+        hdlr = mdia and _find(moov, *mdia, b'hdlr')
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+
+        mdhd = _find(moov, *mdia, b'mdhd')
+        version = moov[mdhd[0]]
+        timescale = struct.unpack_from('>I', moov, mdhd[0] + (20 if version == 1 else 12))[0]
+        minf = _find(moov, *mdia, b'minf')
+        stbl = _find(moov, *minf, b'stbl')
+        boxes = {kind: (start, end) for kind, start, end in _boxes(moov, *stbl)}
+
+        stsz_start = boxes[b'stsz'][0]
+        fixed_size, sample_count = struct.unpack_from('>II', moov, stsz_start + 4)
+        if fixed_size:
+            sizes = np.full(sample_count, fixed_size, dtype=np.int64)
+        else:
+            sizes = np.frombuffer(moov, dtype='>u4', count=sample_count, offset=stsz_start + 12).astype(np.int64)
+
+        stts = _table(moov, boxes[b'stts'], 'u4', 2)
+        deltas = np.repeat(stts[:, 1], stts[:, 0])[:sample_count]
+        times = (np.cumsum(deltas) - deltas) / float(timescale)
+
+        if b'co64' in boxes:
+            chunk_offsets = _table(moov, boxes[b'co64'], 'u8', 1)
+        else:
+            chunk_offsets = _table(moov, boxes[b'stco'], 'u4', 1)
+        stsc = _table(moov, boxes[b'stsc'], 'u4', 3)
+        per_chunk = np.zeros(len(chunk_offsets), dtype=np.int64)
+        for i, (first_chunk, samples, _) in enumerate(stsc):
+            last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+            per_chunk[first_chunk - 1:last_chunk] = samples
+        sample_chunk = np.repeat(np.arange(len(chunk_offsets)), per_chunk)[:sample_count]
+        chunk_first_sample = np.cumsum(per_chunk) - per_chunk
+        size_before = np.cumsum(sizes) - sizes
+        offsets = chunk_offsets[sample_chunk] + size_before - size_before[chunk_first_sample[sample_chunk]]
+
+        # No stss means every sample is a sync sample
+        keyframes = (_table(moov, boxes[b'stss'], 'u4', 1) - 1) if b'stss' in boxes else np.arange(sample_count)
+        return {'timescale': timescale, 'times': times, 'offsets': offsets, 'sizes': sizes,
+                'keyframes': keyframes[keyframes < sample_count]}
+    raise ValueError(f"No video track in {path}")
+
+
+# -------------------------------
+# Sidecar
+# -------------------------------
+class RecordingIndex:
+    def __init__(self, clip_start, fps, frame_times, keyframes, detections, class_names):
+        self.clip_start = clip_start
+        self.fps = fps
+        self.frame_times = frame_times  # Seconds since clip_start, per frame
+        self.keyframes = keyframes
+        self.detections = detections
+        self.class_names = class_names
+
+    @classmethod
+    def build(cls, video_path, clip_start, fps, detections, spans=None):
+        """
+        Index `video_path`. `spans` are the (start, end) wall times of the
+        segments it was cut from, so frames after a recording gap get their
+        real time; without them frames are timed from the MP4 itself.
+        """
+        mp4 = parse_mp4_index(video_path)
+        frames = len(mp4['times'])
+        frame_times = mp4['times']
+        if spans:
+            wall = np.concatenate([start + np.arange(int(round((end - start) * fps))) / fps
+                                   for start, end in spans]) - clip_start
+            if len(wall) == frames:
+                frame_times = wall
+        frame_times = frame_times.astype(np.float32)
+
+        keyframes = np.zeros(len(mp4['keyframes']), dtype=KEYFRAME_DTYPE)
+        keyframes['frame'] = mp4['keyframes']
+        keyframes['media_time'] = mp4['times'][mp4['keyframes']]
+        keyframes['offset'] = mp4['offsets'][mp4['keyframes']]
+        keyframes['size'] = mp4['sizes'][mp4['keyframes']]
+
+        class_names = sorted({d['class'] for d in detections if d.get('class')})
+        class_ids = {name: i for i, name in enumerate(class_names)}
+        rows = np.zeros(len(detections), dtype=DETECTION_DTYPE)
+        for i, detection in enumerate(detections):
+            box = detection['bbox']
+            rows[i] = (0, detection['timestamp'] - clip_start, class_ids.get(detection.get('class'), 0),
+                       detection['confidence'], box['x1'], box['y1'], box['x2'], box['y2'])
+        if frames:
+            rows['frame'] = np.clip(np.searchsorted(frame_times, rows['time'], side='right') - 1, 0, frames - 1)
+        return cls(clip_start, fps, frame_times, keyframes, rows, class_names)
+
+    def save(self, path):
+        names = '\n'.join(self.class_names).encode()
+        partial = path + '.tmp'
+        with open(partial, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, self.clip_start, self.fps, len(self.frame_times),
+                                len(self.keyframes), len(self.detections), len(names)))
+            f.write(names)
+            f.write(self.frame_times.astype('<f4').tobytes())
+            f.write(self.keyframes.tobytes())
+            f.write(self.detections.tobytes())
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, _, clip_start, fps, frames, keyframes, detections, name_bytes = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a recording index: {path}")
+        pos = HEADER.size
+        class_names = data[pos:pos + name_bytes].decode().split('\n') if name_bytes else []
+        pos += name_bytes
+        frame_times = np.frombuffer(data, dtype='<f4', count=frames, offset=pos)
+        pos += frame_times.nbytes
+        keyframe_rows = np.frombuffer(data, dtype=KEYFRAME_DTYPE, count=keyframes, offset=pos)
+        pos += keyframe_rows.nbytes
+        detection_rows = np.frombuffer(data, dtype=DETECTION_DTYPE, count=detections, offset=pos)
+        return cls(clip_start, fps, frame_times, keyframe_rows, detection_rows, class_names)
+
+    # Lookups
+    def frame_at(self, offset_seconds):
+        """Frame showing wall time clip_start + offset_seconds"""
+        index = int(np.searchsorted(self.frame_times, offset_seconds, side='right')) - 1
+        return min(max(index, 0), len(self.frame_times) - 1)
+
+    def keyframe_before(self, frame):
+        """Keyframe row a decoder must start from to show `frame`"""
+        position = int(np.searchsorted(self.keyframes['frame'], frame, side='right')) - 1
+        return self.keyframes[max(position, 0)]
+
+    def keyframe_after(self, frame):
+        position = int(np.searchsorted(self.keyframes['frame'], frame, side='right'))
+        return self.keyframes[position] if position < len(self.keyframes) else None
+
+    def detections_at(self, frame):
+        rows = self.detections[self.detections['frame'] == frame]
+        return [self._detection(row) for row in rows]
+
+    def _detection(self, row):
+        return {
+            'frame': int(row['frame']),
+            'offset_seconds': round(float(row['time']), 3),
+            'timestamp': self.clip_start + float(row['time']),
+            'class': self.class_names[row['cls']] if row['cls'] < len(self.class_names) else None,
+            'confidence': round(float(row['conf']), 3),
+            'bbox': {'x1': float(row['x1']), 'y1': float(row['y1']), 'x2': float(row['x2']), 'y2': float(row['y2'])}
+        }
+
+    def highlights(self):
+        """Runs of detections with the byte range a player needs to seek there"""
+        if not len(self.detections):
+            return []
+        order = np.argsort(self.detections['time'], kind='stable')
+        rows = self.detections[order]
+        breaks = np.flatnonzero(np.diff(rows['time']) > HIGHLIGHT_GAP_SECONDS) + 1
+        highlights = []
+        for group in np.split(rows, breaks):
+            first_frame, last_frame = int(group['frame'].min()), int(group['frame'].max())
+            start_key = self.keyframe_before(first_frame)
+            end_key = self.keyframe_after(last_frame)
+            peak = group[np.argmax(group['conf'])]
+            highlights.append({
+                'start_offset': round(float(group['time'][0]), 3),
+                'end_offset': round(float(group['time'][-1]), 3),
+                'start_frame': first_frame,
+                'end_frame': last_frame,
+                'detections': len(group),
+                'classes': sorted({self.class_names[c] for c in group['cls'] if c < len(self.class_names)}),
+                'peak': self._detection(peak),
+                'seek': {
+                    'keyframe': int(start_key['frame']),
+                    'media_time': round(float(start_key['media_time']), 3),
+                    'byte_start': int(start_key['offset']),
+                    # Up to the next keyframe after the run; None means to the end of the file
+                    'byte_end': int(end_key['offset']) - 1 if end_key is not None else None
+                }
+            })
+        return highlights
+
+    def timeline(self):
+        return {
+            'clip_start': self.clip_start,
+            'fps': self.fps,
+            'frames': len(self.frame_times),
+            'duration_seconds': round(float(self.frame_times[-1]) + 1.0 / self.fps, 3) if len(self.frame_times) else 0,
+            'keyframes': len(self.keyframes),
+            'detections': [self._detection(row) for row in self.detections],
+            'highlights': self.highlights()
+        }
+
+
+# -------------------------------
+# Extraction
+# -------------------------------
+def extract_still(video_path, index, frame):
+    """Decode one frame, starting from the keyframe before it rather than the start of the file"""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        keyframe = int(index.keyframe_before(frame)['frame'])
+        capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        image = None
+        for _ in range(frame - keyframe + 1):
+            ret, image = capture.read()
+            if not ret:
+                break
+        if image is None:
+            raise ValueError(f"Could not decode frame {frame}")
+        return image
+    finally:
+        capture.release()
+
+
+def extract_subclip(video_path, index, start_frame, end_frame, output, ffmpeg='ffmpeg'):
+    """
+    Frames start_frame..end_frame into `output`. With ffmpeg the cut starts on
+    the preceding keyframe and is stream-copied; otherwise only that range is
+    decoded and re-encoded.
+    """
+    keyframe = index.keyframe_before(start_frame)
+    partial = os.path.splitext(output)[0] + '.part.mp4'
+    ffmpeg = shutil.which(ffmpeg) if ffmpeg else None
+    if ffmpeg is not None:
+        duration = (end_frame - int(keyframe['frame']) + 1) / index.fps
+        try:
+            subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                            '-ss', f"{float(keyframe['media_time']):.3f}", '-i', video_path,
+                            '-t', f"{duration:.3f}", '-c', 'copy', '-avoid_negative_ts', 'make_zero',
+                            '-movflags', '+faststart', partial],
+                           check=True, capture_output=True, timeout=60)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(e.stderr.decode(errors='replace').strip() or str(e))
+    else:
+        capture = cv2.VideoCapture(video_path)
+        writer = None
+        try:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, int(keyframe['frame']))
+            for frame in range(int(keyframe['frame']), end_frame + 1):
+                ret, image = capture.read()
+                if not ret:
+                    break
+                if frame < start_frame:
+                    continue
+                if writer is None:
+                    height, width = image.shape[:2]
+                    writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*'mp4v'), index.fps, (width, height))
+                writer.write(image)
+        finally:
+            capture.release()
+            if writer is not None:
+                writer.release()
+        if writer is None:
+            raise ValueError("No frames in the requested range")
+    os.replace(partial, output)
+    return output
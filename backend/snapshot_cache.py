@@ -0,0 +1,133 @@
+"""
+Latest-frame snapshots for polling dashboards.
+
+Detection loops hand over each analysed frame with its detections; that is
+only a reference swap. The annotated JPEG for a size variant is encoded on
+the first request after a new frame and then served from memory, so any
+number of polling clients cost at most one encode per camera, size and
+frame, and `If-None-Match` polls cost nothing at all.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import cv2
+
+
+class _Snapshot:
+    def __init__(self, frame, detections, timestamp, seq):
+        self.frame = frame
+        self.detections = detections
+        self.timestamp = timestamp
+        self.seq = seq
+        self.annotated = None
+        self.encoded = {}  # size name -> (jpeg bytes, etag)
+
+
+class SnapshotCache:
+    """
+    `sizes` maps variant names to a maximum width (None keeps the full
+    frame). `annotate(frame, detections)` draws boxes onto a copy.
+    """
+
+    def __init__(self, annotate=None, sizes=None, quality=80):
+        self.annotate = annotate
+        self.sizes = sizes or {'thumb': 320, 'medium': 640, 'full': None}
+        self.quality = quality
+        self.lock = threading.Lock()
+        self.snapshots = {}  # camera id -> _Snapshot
+        self.encode_locks = {}
+        self.seq = 0
+        # seq restarts with the process; the nonce keeps a restarted server's
+        # ETags from matching ones a client cached before the restart
+        self.nonce = os.urandom(8).hex()
+        self.encodes = 0
+        self.hits = 0
+        self.not_modified = 0
+
+    def update(self, camera_id, frame, detections=None, timestamp=None):
+        with self.lock:
+            self.seq += 1
+            self.snapshots[camera_id] = _Snapshot(frame, detections or [], timestamp or time.time(), self.seq)
+            self.encode_locks.setdefault(camera_id, threading.Lock())
+
+    def remove(self, camera_id):
+        with self.lock:
+            self.snapshots.pop(camera_id, None)
+
+    def cameras(self):
+        now = time.time()
+        with self.lock:
+            return [{
+                'camera_id': camera_id,
+                'timestamp': snapshot.timestamp,
+                'age_seconds': round(now - snapshot.timestamp, 2),
+                'detections': len(snapshot.detections),
+                'height': snapshot.frame.shape[0],
+                'width': snapshot.frame.shape[1]
+            } for camera_id, snapshot in sorted(self.snapshots.items())]
+
+    def etag(self, camera_id, size):
+        """Current ETag without encoding anything, or None when there is no snapshot"""
+        with self.lock:
+            snapshot = self.snapshots.get(camera_id)
+        if snapshot is None:
+            return None
+        return self._etag(camera_id, size, snapshot)
+
+    def _etag(self, camera_id, size, snapshot):
+        key = f"{self.nonce}|{camera_id}|{snapshot.seq}|{size}"
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return f'"{digest}"'
+
+    def get(self, camera_id, size='medium'):
+        """(jpeg bytes, etag, timestamp) or None; encodes once per frame and size"""
+        if size not in self.sizes:
+            raise ValueError(f"Unknown size {size}; use one of {sorted(self.sizes)}")
+        with self.lock:
+            snapshot = self.snapshots.get(camera_id)
+            encode_lock = self.encode_locks.get(camera_id)
+        if snapshot is None:
+            return None
+
+        cached = snapshot.encoded.get(size)
+        if cached is None:
+            # One encoder per camera; concurrent pollers wait for it instead of encoding the same frame
+            with encode_lock:
+                cached = snapshot.encoded.get(size)
+                if cached is None:
+                    cached = self._encode(camera_id, size, snapshot)
+        else:
+            with self.lock:
+                self.hits += 1
+        return cached[0], cached[1], snapshot.timestamp
+
+    def _encode(self, camera_id, size, snapshot):
+        if snapshot.annotated is None:
+            snapshot.annotated = (self.annotate(snapshot.frame, snapshot.detections)
+                                  if self.annotate and snapshot.detections else snapshot.frame)
+        image = snapshot.annotated
+        max_width = self.sizes[size]
+        if max_width and image.shape[1] > max_width:
+            height = int(round(image.shape[0] * max_width / image.shape[1]))
+            image = cv2.resize(image, (max_width, height), interpolation=cv2.INTER_AREA)
+
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("Failed to encode snapshot")
+        cached = (buffer.tobytes(), self._etag(camera_id, size, snapshot))
+        snapshot.encoded[size] = cached
+        with self.lock:
+            self.encodes += 1
+        return cached
+
+    def record_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self.lock:
+            return {'cameras': len(self.snapshots), 'encodes': self.encodes, 'hits': self.hits,
+                    'not_modified': self.not_modified, 'sizes': dict(self.sizes)}
@@ -0,0 +1,320 @@
+"""
+Voice SOS recording ingestion.
+
+Devices upload distress recordings in resumable chunks: they create an
+upload with the file's SHA-256, size and metadata, then append chunks at
+the offset the server reports. Partial data lives in an incoming folder, so
+a dropped connection resumes where it stopped. Completed files are verified
+against their hash, stored content-addressed and indexed in SQLite together
+with their metadata. A recording that is already stored is never uploaded
+twice, and the number of uploads written at the same time is capped so a
+burst of reconnecting devices gets a retry hint instead of exhausting the
+server.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from file_hashing import file_sha256
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a', 'aac', 'flac', 'webm'}
+COPY_BLOCK_SIZE = 256 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _safe_component(value, fallback):
+    cleaned = ''.join(c for c in str(value or '') if c.isalnum() or c in '-_.')[:64].strip('.')
+    return cleaned or fallback
+
+
+class SosStore:
+    def __init__(self, root_folder, max_active_uploads=32, upload_ttl_seconds=7 * 24 * 3600,
+                 max_file_bytes=200 * 1024 * 1024):
+        self.root_folder = root_folder
+        self.incoming_folder = os.path.join(root_folder, 'incoming')
+        self.audio_folder = os.path.join(root_folder, 'audio')
+        os.makedirs(self.incoming_folder, exist_ok=True)
+        os.makedirs(self.audio_folder, exist_ok=True)
+
+        self.db_path = os.path.join(root_folder, 'sos_index.db')
+        self.max_file_bytes = max_file_bytes
+        self.upload_ttl_seconds = upload_ttl_seconds
+        self.write_slots = threading.BoundedSemaphore(max_active_uploads)
+        self.upload_locks = {}
+        self.locks_lock = threading.Lock()
+        self.local = threading.local()
+        self._init_db()
+
+    # Database
+    def _db(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def _init_db(self):
+        db = self._db()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS recordings (
+                sha256 TEXT PRIMARY KEY,
+                device_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                recorded_at TEXT,
+                latitude REAL,
+                longitude REAL,
+                location TEXT,
+                duration_seconds REAL,
+                metadata TEXT,
+                received_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_recordings_device ON recordings(device_id, received_at);
+            CREATE INDEX IF NOT EXISTS idx_recordings_received ON recordings(received_at);
+
+            CREATE TABLE IF NOT EXISTS uploads (
+                upload_id TEXT PRIMARY KEY,
+                device_id TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                received INTEGER NOT NULL DEFAULT 0,
+                metadata TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                UNIQUE (device_id, sha256)
+            );
+        """)
+
+    def _upload_lock(self, upload_id):
+        with self.locks_lock:
+            return self.upload_locks.setdefault(upload_id, threading.Lock())
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.incoming_folder, f"{upload_id}.part")
+
+    # Queries
+    def known_hashes(self, hashes):
+        """Subset of `hashes` already stored; lets a device skip a whole batch in one call"""
+        if not isinstance(hashes, list):
+            raise UploadError("hashes must be a list of SHA-256 hex digests")
+        hashes = [h.lower() for h in hashes if isinstance(h, str)][:500]
+        if not hashes:
+            return set()
+        placeholders = ','.join('?' * len(hashes))
+        rows = self._db().execute(f"SELECT sha256 FROM recordings WHERE sha256 IN ({placeholders})", hashes)
+        return {row['sha256'] for row in rows}
+
+    def get_recording(self, sha256):
+        row = self._db().execute("SELECT * FROM recordings WHERE sha256 = ?", (sha256.lower(),)).fetchone()
+        return self._recording_dict(row) if row else None
+
+    def list_recordings(self, device_id=None, since=None, limit=100):
+        query = "SELECT * FROM recordings"
+        clauses, params = [], []
+        if device_id:
+            clauses.append("device_id = ?")
+            params.append(device_id)
+        if since:
+            clauses.append("received_at > ?")
+            params.append(since)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY received_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._recording_dict(row) for row in self._db().execute(query, params)]
+
+    def _recording_dict(self, row):
+        record = dict(row)
+        record['metadata'] = json.loads(record['metadata']) if record['metadata'] else {}
+        record.pop('path')
+        return record
+
+    def recording_path(self, sha256):
+        row = self._db().execute("SELECT path FROM recordings WHERE sha256 = ?", (sha256.lower(),)).fetchone()
+        return row['path'] if row else None
+
+    def get_upload(self, upload_id):
+        row = self._db().execute("SELECT * FROM uploads WHERE upload_id = ?", (upload_id,)).fetchone()
+        if row is None:
+            return None
+        return {'upload_id': row['upload_id'], 'sha256': row['sha256'], 'size': row['size'],
+                'offset': row['received'], 'filename': row['filename']}
+
+    # Upload protocol
+    def create_upload(self, device_id, filename, size, sha256, metadata=None):
+        """Start an upload, resume the device's pending one, or report a duplicate"""
+        sha256 = str(sha256 or '').lower()
+        if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+            raise UploadError("sha256 must be a 64 character hex digest")
+        size = int(size)
+        if size <= 0 or size > self.max_file_bytes:
+            raise UploadError(f"size must be between 1 and {self.max_file_bytes} bytes")
+        extension = os.path.splitext(filename or '')[1].lstrip('.').lower()
+        if extension not in AUDIO_EXTENSIONS:
+            raise UploadError(f"Unsupported audio type: .{extension}")
+
+        device_id = _safe_component(device_id, 'unknown')
+        filename = _safe_component(os.path.basename(filename), f"sos.{extension}")
+
+        existing = self.get_recording(sha256)
+        if existing is not None:
+            return {'duplicate': True, 'complete': True, 'recording': existing}
+
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT * FROM uploads WHERE device_id = ? AND sha256 = ?",
+                             (device_id, sha256)).fetchone()
+            if row is not None and row['size'] == size:
+                upload_id, offset = row['upload_id'], row['received']
+                db.execute("UPDATE uploads SET updated = ? WHERE upload_id = ?", (now, upload_id))
+            else:
+                if row is not None:
+                    db.execute("DELETE FROM uploads WHERE upload_id = ?", (row['upload_id'],))
+                upload_id, offset = uuid.uuid4().hex, 0
+                db.execute(
+                    "INSERT INTO uploads (upload_id, device_id, sha256, filename, size, received, metadata, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                    (upload_id, device_id, sha256, filename, size, json.dumps(metadata or {}), now, now))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        if offset == 0:
+            open(self._part_path(upload_id), 'wb').close()
+        return {'duplicate': False, 'complete': False, 'upload_id': upload_id, 'offset': offset, 'size': size}
+
+    def append_chunk(self, upload_id, offset, stream, content_length=None):
+        """
+        Append a chunk read from `stream` at `offset`; finalize once the file is
+        complete. Without a Content-Length (chunked transfer encoding) the
+        body is read until EOF, up to the remaining declared size.
+        """
+        if not self.write_slots.acquire(blocking=False):
+            raise UploadError("Too many concurrent uploads", status=503, retry_after=5)
+        try:
+            with self._upload_lock(upload_id):
+                upload = self.get_upload(upload_id)
+                if upload is None:
+                    raise UploadError("Upload not found", status=404)
+                if offset != upload['offset']:
+                    raise UploadError("Offset mismatch", status=409, offset=upload['offset'])
+                remaining = upload['size'] - offset
+                if content_length is not None and content_length > remaining:
+                    raise UploadError("Chunk exceeds declared size", status=413)
+                limit = remaining if content_length is None else content_length
+
+                part_path = self._part_path(upload_id)
+                written = 0
+                with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+                    f.seek(offset)
+                    while written < limit:
+                        block = stream.read(min(COPY_BLOCK_SIZE, limit - written))
+                        if not block:
+                            break
+                        f.write(block)
+                        written += len(block)
+                    f.truncate(offset + written)
+
+                if written == 0:
+                    raise UploadError("Empty chunk")
+                new_offset = offset + written
+                self._db().execute("UPDATE uploads SET received = ?, updated = ? WHERE upload_id = ?",
+                                   (new_offset, time.time(), upload_id))
+                if new_offset < upload['size']:
+                    return {'complete': False, 'upload_id': upload_id, 'offset': new_offset}
+                return self._finalize(upload_id)
+        finally:
+            self.write_slots.release()
+
+    def store_file(self, device_id, filename, data, metadata=None):
+        """Single-request upload of a small recording held in memory"""
+        result = self.create_upload(device_id, filename, len(data), hashlib.sha256(data).hexdigest(), metadata)
+        if result['complete']:
+            return result
+        return self.append_chunk(result['upload_id'], result['offset'],
+                                 io.BytesIO(data[result['offset']:]), len(data) - result['offset'])
+
+    def _finalize(self, upload_id):
+        db = self._db()
+        row = db.execute("SELECT * FROM uploads WHERE upload_id = ?", (upload_id,)).fetchone()
+        part_path = self._part_path(upload_id)
+
+        actual = file_sha256(part_path)
+        if actual != row['sha256']:
+            # Corrupt transfer: start over from zero
+            open(part_path, 'wb').close()
+            db.execute("UPDATE uploads SET received = 0, updated = ? WHERE upload_id = ?", (time.time(), upload_id))
+            raise UploadError("Checksum mismatch, upload restarted", status=422, offset=0)
+
+        extension = os.path.splitext(row['filename'])[1].lower()
+        device_folder = os.path.join(self.audio_folder, row['device_id'])
+        os.makedirs(device_folder, exist_ok=True)
+        final_path = os.path.join(device_folder, f"{row['sha256']}{extension}")
+        os.replace(part_path, final_path)
+
+        metadata = json.loads(row['metadata'] or '{}')
+        received_at = datetime.now().isoformat()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT OR IGNORE INTO recordings (sha256, device_id, filename, path, size, recorded_at, "
+                "latitude, longitude, location, duration_seconds, metadata, received_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (row['sha256'], row['device_id'], row['filename'], final_path, row['size'],
+                 metadata.get('timestamp'), _as_float(metadata.get('latitude')),
+                 _as_float(metadata.get('longitude')), metadata.get('location'),
+                 _as_float(metadata.get('duration_seconds')), json.dumps(metadata), received_at))
+            db.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        with self.locks_lock:
+            self.upload_locks.pop(upload_id, None)
+        logger.info(f"SOS recording received from {row['device_id']}: {row['filename']} ({row['size']} bytes)")
+        return {'complete': True, 'duplicate': False, 'recording': self.get_recording(row['sha256'])}
+
+    def cleanup_stale_uploads(self):
+        """Drop uploads that have not progressed within the TTL"""
+        cutoff = time.time() - self.upload_ttl_seconds
+        db = self._db()
+        stale = [row['upload_id'] for row in db.execute("SELECT upload_id FROM uploads WHERE updated < ?", (cutoff,))]
+        for upload_id in stale:
+            db.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+            try:
+                os.remove(self._part_path(upload_id))
+            except OSError:
+                pass
+        return len(stale)
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
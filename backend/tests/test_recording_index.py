@@ -0,0 +1,205 @@
+"""
+Sample tables read by recording_index, checked against the MPEG-4 Part 2
+start codes found at each sample offset. Layouts OpenCV does not write
+(co64, several stsc runs, no stss, moov before mdat) are made by rewriting
+the sample tables of an OpenCV clip; ffmpeg clips run when it is installed.
+"""
+
+import shutil
+import struct
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+from recording_index import RecordingIndex, parse_mp4_index
+
+FRAMES = 40
+FPS = 10
+GOP = 12  # OpenCV's mp4v writer starts a new GOP every 12 frames
+CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+VOP_START = b'\x00\x00\x01\xb6'
+
+
+def write_clip(path):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), FPS, (64, 48))
+    for i in range(FRAMES):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        cv2.circle(frame, (10 + i, 24), 8, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def intra_samples(data, mp4):
+    """Which samples are I-VOPs, failing if an offset does not land on a start code"""
+    intra = []
+    for offset, size in zip(mp4['offsets'], mp4['sizes']):
+        sample = data[offset:offset + size]
+        assert sample[:3] == b'\x00\x00\x01', f"no start code at byte {offset}"
+        vop = sample.index(VOP_START) + len(VOP_START)
+        intra.append(sample[vop] >> 6 == 0)
+    return np.flatnonzero(intra)
+
+
+def check_clip(path, sync_table=True):
+    mp4 = parse_mp4_index(str(path))
+    data = path.read_bytes()
+    assert len(mp4['times']) == FRAMES
+    np.testing.assert_allclose(mp4['times'], np.arange(FRAMES) / FPS, atol=1e-6)
+    intra = intra_samples(data, mp4)
+    if sync_table:
+        np.testing.assert_array_equal(mp4['keyframes'], intra)
+    else:
+        np.testing.assert_array_equal(mp4['keyframes'], np.arange(FRAMES))
+    return mp4
+
+
+# -------------------------------
+# Box rewriting
+# -------------------------------
+def parse_boxes(data, start=0, end=None):
+    """[(type, payload)] with container payloads parsed into lists"""
+    end = len(data) if end is None else end
+    boxes = []
+    while start < end:
+        size, kind = struct.unpack_from('>I4s', data, start)
+        payload = data[start + 8:start + size]
+        boxes.append((kind, parse_boxes(payload) if kind in CONTAINERS else payload))
+        start += size
+    return boxes
+
+
+def serialize(boxes):
+    out = b''
+    for kind, payload in boxes:
+        if isinstance(payload, list):
+            payload = serialize(payload)
+        out += struct.pack('>I4s', 8 + len(payload), kind) + payload
+    return out
+
+
+def child(boxes, kind):
+    return next(payload for box_kind, payload in boxes if box_kind == kind)
+
+
+def video_stbl(moov):
+    for kind, trak in moov:
+        if kind == b'trak':
+            mdia = child(trak, b'mdia')
+            if child(mdia, b'hdlr')[8:12] == b'vide':
+                return child(child(mdia, b'minf'), b'stbl')
+    raise AssertionError("no video track")
+
+
+def full_box(fmt, entries):
+    """Version/flags, entry count and big-endian entries"""
+    return struct.pack('>II', 0, len(entries)) + b''.join(struct.pack('>' + fmt, *entry) for entry in entries)
+
+
+def mdat_payload_start(boxes):
+    before = next(i for i, (kind, _) in enumerate(boxes) if kind == b'mdat')
+    return len(serialize(boxes[:before])) + 8
+
+
+def rewrite(source, target, chunks, co64=False, sync_table=True, moov_first=False):
+    """
+    Copy an OpenCV clip with new chunking: `chunks` holds the sample count of
+    each chunk. OpenCV writes the samples back to back in one chunk, so any
+    split of them is a valid layout.
+    """
+    boxes = parse_boxes(source.read_bytes())
+    moov = child(boxes, b'moov')
+    stbl = video_stbl(moov)
+    stco = child(stbl, b'stco')
+    assert struct.unpack_from('>I', stco, 4)[0] == 1, "expected a single chunk"
+    sizes = np.frombuffer(child(stbl, b'stsz'), dtype='>u4', offset=12).astype(np.int64)
+    # Relative to the mdat payload, which moves when moov does
+    sample_offsets = struct.unpack_from('>I', stco, 8)[0] + np.cumsum(sizes) - sizes - mdat_payload_start(boxes)
+
+    first_samples = np.cumsum(chunks) - chunks
+    stsc = [(i + 1, count, 1) for i, count in enumerate(chunks) if i == 0 or count != chunks[i - 1]]
+    if moov_first:
+        boxes.remove((b'moov', moov))
+        boxes.insert(1, (b'moov', moov))
+
+    def tables(base):
+        offsets = [(int(base + sample_offsets[i]),) for i in first_samples]
+        stbl[:] = [(kind, payload) for kind, payload in stbl
+                   if kind not in (b'stsc', b'stco', b'co64') and (sync_table or kind != b'stss')]
+        stbl.append((b'stsc', full_box('III', stsc)))
+        stbl.append((b'co64', full_box('Q', offsets)) if co64 else (b'stco', full_box('I', offsets)))
+
+    # Table sizes do not depend on the offsets, so one pass finds where mdat lands
+    tables(0)
+    tables(mdat_payload_start(boxes))
+    target.write_bytes(serialize(boxes))
+    return target
+
+
+# -------------------------------
+# Tests
+# -------------------------------
+@pytest.fixture(scope='module')
+def opencv_clip(tmp_path_factory):
+    return write_clip(tmp_path_factory.mktemp('clips') / 'opencv.mp4')
+
+
+def test_opencv_clip(opencv_clip):
+    mp4 = check_clip(opencv_clip)
+    np.testing.assert_array_equal(mp4['keyframes'], np.arange(0, FRAMES, GOP))
+
+
+@pytest.mark.parametrize('layout', [
+    dict(chunks=[FRAMES], co64=True),
+    dict(chunks=[3, 3, 3, 5, 5, 7, 7, 7]),
+    dict(chunks=[FRAMES], sync_table=False),
+    dict(chunks=[1, 4, 4, 6, 25], co64=True, moov_first=True),
+], ids=['co64', 'multi_stsc', 'no_stss', 'moov_first'])
+def test_rewritten_tables(opencv_clip, tmp_path, layout):
+    original = parse_mp4_index(str(opencv_clip))
+    mp4 = check_clip(rewrite(opencv_clip, tmp_path / 'rewritten.mp4', **layout),
+                     sync_table=layout.get('sync_table', True))
+    np.testing.assert_array_equal(mp4['sizes'], original['sizes'])
+    if not layout.get('moov_first'):
+        np.testing.assert_array_equal(mp4['offsets'], original['offsets'])
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg is not installed')
+@pytest.mark.parametrize('movflags', [[], ['-movflags', '+faststart']], ids=['default', 'faststart'])
+def test_ffmpeg_clip(opencv_clip, tmp_path, movflags):
+    path = tmp_path / 'ffmpeg.mp4'
+    subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-i', str(opencv_clip),
+                    '-c:v', 'mpeg4', '-g', str(GOP), '-bf', '0', *movflags, str(path)],
+                   check=True, capture_output=True, timeout=60)
+    mp4 = check_clip(path)
+    np.testing.assert_array_equal(mp4['keyframes'], np.arange(0, FRAMES, GOP))
+
+
+def test_build_round_trip(opencv_clip, tmp_path):
+    clip = rewrite(opencv_clip, tmp_path / 'clip.mp4', chunks=[3, 3, 3, 5, 5, 7, 7, 7], co64=True)
+    mp4 = parse_mp4_index(str(clip))
+    clip_start = 1_700_000_000.0
+    # Two 2 s segments with an 8 s recording gap between them
+    spans = [(clip_start, clip_start + 2), (clip_start + 10, clip_start + 12)]
+    box = {'x1': 1.0, 'y1': 2.0, 'x2': 3.0, 'y2': 4.0}
+    detections = [{'timestamp': clip_start + 10.55, 'class': 'knife', 'confidence': 0.8, 'bbox': box},
+                  {'timestamp': clip_start + 10.75, 'class': 'gun', 'confidence': 0.9, 'bbox': box}]
+
+    index = RecordingIndex.build(str(clip), clip_start, FPS, detections, spans=spans)
+    index.save(str(tmp_path / 'clip.idx'))
+    loaded = RecordingIndex.load(str(tmp_path / 'clip.idx'))
+
+    assert loaded.class_names == ['gun', 'knife']
+    assert loaded.frame_at(10.55) == 25
+    assert [d['class'] for d in loaded.detections_at(25)] == ['knife']
+    np.testing.assert_array_equal(loaded.keyframes['frame'], np.arange(0, FRAMES, GOP))
+    np.testing.assert_array_equal(loaded.keyframes['offset'], mp4['offsets'][loaded.keyframes['frame']])
+
+    highlight, = loaded.highlights()
+    assert (highlight['start_frame'], highlight['end_frame']) == (25, 27)
+    assert highlight['seek']['keyframe'] == 24
+    assert highlight['seek']['byte_start'] == mp4['offsets'][24]
+    assert highlight['seek']['byte_end'] == mp4['offsets'][36] - 1
+    assert highlight['peak']['class'] == 'gun'
@@ -0,0 +1,207 @@
+"""
+Tiled and region-of-interest inference helpers for high-resolution cameras.
+
+Large frames are sliced into overlapping tiles so small weapons keep enough
+pixels after YOLO's resize. Per-camera ROI masks (normalised polygons) drop
+tiles that only cover sky or walls, and the tile size grows until the plan
+fits within `max_tiles`, so the cost per frame stays bounded. Boxes from all
+tiles are merged with a vectorized class-aware NMS.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _axis_starts(length, tile, step):
+    """Tile offsets along one axis; the last tile is aligned to the far edge"""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - tile) / step) + 1
+    return sorted({min(i * step, length - tile) for i in range(count)})
+
+
+def plan_tiles(width, height, tile_size=640, overlap=0.2, mask=None, min_coverage=0.02, max_tiles=12):
+    """
+    (N, 4) int array of x1, y1, x2, y2 tiles covering the frame. Tiles whose
+    share of ROI pixels is below `min_coverage` are skipped; the tile size
+    grows by 25% until at most `max_tiles` tiles remain.
+    """
+    tile = max(1, min(tile_size, width, height))
+    while True:
+        step = max(1, int(tile * (1.0 - overlap)))
+        tiles = np.array([(x, y, min(x + tile, width), min(y + tile, height))
+                          for y in _axis_starts(height, tile, step)
+                          for x in _axis_starts(width, tile, step)], dtype=np.int32)
+        if mask is not None:
+            coverage = np.array([mask[y1:y2, x1:x2].mean() for x1, y1, x2, y2 in tiles])
+            tiles = tiles[coverage >= min_coverage]
+        if len(tiles) <= max_tiles or tile >= max(width, height):
+            return tiles
+        tile = int(tile * 1.25)
+
+
+def box_overlaps(boxes):
+    """Pairwise IoU and intersection-over-smaller matrices for (N, 4) boxes"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    iw = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    ih = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    inter = iw * ih
+    union = areas[:, None] + areas[None, :] - inter
+    iou = inter / np.maximum(union, 1e-9)
+    ios = inter / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-9)
+    return iou, ios
+
+
+def nms(boxes, scores, classes, iou_threshold=0.5, ios_threshold=0.7):
+    """
+    Class-aware greedy NMS; returns kept indices by descending score.
+    Intersection-over-smaller also suppresses partial boxes cut at tile edges
+    that sit inside a full box from a neighbouring tile.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    boxes, classes = boxes[order], classes[order]
+
+    iou, ios = box_overlaps(boxes)
+    suppress = ((iou > iou_threshold) | (ios > ios_threshold)) & (classes[:, None] == classes[None, :])
+    suppress = np.triu(suppress, k=1)
+
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            keep[i + 1:] &= ~suppress[i, i + 1:]
+    return order[keep]
+
+
+class RoiMasks:
+    """
+    Per-camera ROI polygons in normalised [0, 1] coordinates, persisted as
+    JSON. Rasterised masks and tile plans are cached per frame size.
+    """
+
+    def __init__(self, path, tile_size=640, overlap=0.2, max_tiles=12, min_coverage=0.02):
+        self.path = path
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.min_coverage = min_coverage
+        self.lock = threading.Lock()
+        self.polygons = {}
+        self.versions = {}
+        self.masks = {}  # (camera_id, width, height) -> uint8 mask
+        self.plans = {}  # (camera_id, width, height) -> tiles
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            for camera_id, polygons in data.items():
+                self.polygons[camera_id] = self._validate(polygons)
+                self.versions[camera_id] = 1
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load ROI masks from {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.polygons, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _validate(polygons):
+        if not isinstance(polygons, list) or not polygons:
+            raise ValueError("polygons must be a non-empty list")
+        cleaned = []
+        for polygon in polygons:
+            points = np.asarray(polygon, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError("each polygon needs at least 3 [x, y] points")
+            if points.min() < 0 or points.max() > 1:
+                raise ValueError("polygon coordinates must be normalised to [0, 1]")
+            cleaned.append(points.round(4).tolist())
+        return cleaned
+
+    def _drop_cached(self, camera_id):
+        for cache in (self.masks, self.plans):
+            for key in [key for key in cache if key[0] == camera_id]:
+                del cache[key]
+
+    def set(self, camera_id, polygons):
+        polygons = self._validate(polygons)
+        with self.lock:
+            self.polygons[camera_id] = polygons
+            self.versions[camera_id] = self.versions.get(camera_id, 0) + 1
+            self._drop_cached(camera_id)
+            self._save()
+        return polygons
+
+    def remove(self, camera_id):
+        with self.lock:
+            if self.polygons.pop(camera_id, None) is None:
+                return False
+            self.versions[camera_id] = self.versions.get(camera_id, 0) + 1
+            self._drop_cached(camera_id)
+            self._save()
+        return True
+
+    def get(self, camera_id):
+        with self.lock:
+            return self.polygons.get(camera_id)
+
+    def all(self):
+        with self.lock:
+            return dict(self.polygons)
+
+    def version(self, camera_id):
+        with self.lock:
+            return self.versions.get(camera_id, 0)
+
+    def mask(self, camera_id, width, height):
+        """uint8 mask (1 inside the ROI) or None when the camera has no ROI"""
+        if camera_id is None:
+            return None
+        with self.lock:
+            polygons = self.polygons.get(camera_id)
+            if polygons is None:
+                return None
+            key = (camera_id, width, height)
+            mask = self.masks.get(key)
+            if mask is None:
+                mask = np.zeros((height, width), dtype=np.uint8)
+                scale = np.array([width - 1, height - 1], dtype=np.float64)
+                cv2.fillPoly(mask, [np.round(np.asarray(p) * scale).astype(np.int32) for p in polygons], 1)
+                self.masks[key] = mask
+            return mask
+
+    def plan(self, camera_id, width, height):
+        key = (camera_id, width, height)
+        with self.lock:
+            tiles = self.plans.get(key)
+        if tiles is None:
+            tiles = plan_tiles(width, height, self.tile_size, self.overlap, self.mask(camera_id, width, height),
+                               self.min_coverage, self.max_tiles)
+            with self.lock:
+                self.plans[key] = tiles
+        return tiles
+
+    def inside(self, camera_id, width, height, boxes):
+        """Boolean array: which (N, 4) boxes have their centre inside the ROI"""
+        mask = self.mask(camera_id, width, height)
+        if mask is None or len(boxes) == 0:
+            return np.ones(len(boxes), dtype=bool)
+        cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64), 0, width - 1)
+        cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64), 0, height - 1)
+        return mask[cy, cx].astype(bool)